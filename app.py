@@ -1,13 +1,19 @@
 """
 MultiLLM Cost-Optimized API Microservice
 """
+import itertools
 import os
-import json
+import signal
+import threading
 import time
-import yaml
-from flask import Flask, request, jsonify , render_template
-from services.provider_manager import ProviderManager
+from flask import Flask, Response, g, request, jsonify , render_template, stream_with_context
+from services import metrics, tracing
+from services.admission import AdmissionRejectedError
+from services.deadline import DeadlineExceededError
+from services.provider_manager import ContextWindowError, ProviderManager
+from services.response_cache import CacheMissError
 from utils.logger import setup_logger
+from utils.sse import SSE_HEADERS, sse_stream
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -15,28 +21,104 @@ app = Flask(__name__)
 # Setup logger
 logger = setup_logger()
 
-# Load provider configuration
-def load_config():
-    config_path = os.environ.get('CONFIG_PATH', 'config/providers.yaml')
-    
-    with open(config_path, 'r') as file:
-        config = yaml.safe_load(file)
-    
-    return config
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+def request_timeout(data):
+    """Deadline in seconds from the "timeout" field or X-Request-Timeout header; None for the server default."""
+    value = data.get('timeout') if isinstance(data, dict) else None
+    if value in (None, ''):
+        value = request.headers.get(TIMEOUT_HEADER)
+    return float(value) if value not in (None, '') else None
+
+PRIORITY_HEADER = 'X-Priority'
+
+def request_priority(data):
+    """Admission class from the "priority" field or X-Priority header; None for the default class."""
+    value = data.get('priority') if isinstance(data, dict) else None
+    return value or request.headers.get(PRIORITY_HEADER) or None
+
+def wants_timings(data):
+    """Whether the request asked for its trace spans in a "timings" field."""
+    value = data.get('timings') if isinstance(data, dict) else None
+    return value is True or str(value).lower() in ('1', 'true')
+
+def generation_params(data):
+    """
+    prompt, max_tokens, temperature and cache from a request body.
+
+    Raises:
+        TypeError, ValueError: If a field has the wrong type or value
+    """
+    prompt = data['prompt']
+    if not isinstance(prompt, str):
+        raise TypeError("prompt must be a string")
+    return {
+        "prompt": prompt,
+        "max_tokens": int(data.get('max_tokens', 100)),
+        "temperature": float(data.get('temperature', 0.7)),
+        "cache": data.get('cache', 'default')
+    }
+
+def busy_response(error):
+    """429 for a request turned away by admission control."""
+    return jsonify({
+        "error": "Server busy",
+        "details": str(error),
+        "retryAfter": error.retry_after_header
+    }), 429, {'Retry-After': error.retry_after_header}
+
+def get_config_path():
+    return os.environ.get('CONFIG_PATH', 'config/providers.yaml')
 
 # Initialize provider manager
 provider_manager = None
+_init_lock = threading.Lock()
+
+@app.before_request
+def start_trace():
+    """Collect per-phase spans for the request when settings.tracing is enabled."""
+    g.trace = tracing.start(f"{request.method} {request.path}")
 
 @app.before_request
 def initialize():
+    """Build the provider manager once per process, then only check for config changes."""
     global provider_manager
-    config = load_config()
-    provider_manager = ProviderManager(config)
-    logger.info("Provider manager initialized with configuration.")
+    if provider_manager is not None:
+        with tracing.span('config_reload'):
+            provider_manager.reload_if_changed()
+        return
+    
+    with _init_lock:
+        if provider_manager is None:
+            provider_manager = ProviderManager.from_config_file(get_config_path())
+            logger.info("Provider manager initialized with configuration.")
+
+@app.after_request
+def add_server_timing(response):
+    """Summarise the request's spans in a Server-Timing header."""
+    trace = g.get('trace')
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.teardown_request
+def finish_trace(error=None):
+    tracing.finish(g.pop('trace', None))
+
+def _handle_sighup(signum, frame):
+    """Reload provider configuration on SIGHUP."""
+    if provider_manager is not None:
+        provider_manager.request_reload()
+
+if hasattr(signal, 'SIGHUP'):
+    try:
+        signal.signal(signal.SIGHUP, _handle_sighup)
+    except ValueError:
+        # Not running in the main thread (e.g. imported by a worker wrapper)
+        pass
 @app.route('/')
 def home():
    return render_template('index.html')
-@app.route('/generate', methods=['POST'])
 
 @app.route('/generate', methods=['POST'])
 def generate():
@@ -50,11 +132,21 @@ def generate():
       {
         "prompt": "Hello!",
         "max_tokens": 100,
-        "temperature": 0.7
+        "temperature": 0.7,
+        "cache": "default",
+        "timeout": 20,
+        "priority": "interactive",
+        "timings": true
       }
 
     - Form:
       prompt=Hello!&max_tokens=100&temperature=0.7
+
+    "timeout" (or the X-Request-Timeout header) is the end-to-end deadline
+    in seconds across all provider attempts and retries. "priority" (or the
+    X-Priority header) picks the admission class; a request the queue can't
+    serve in time gets a 429 with Retry-After. "timings" adds the request's
+    per-phase spans to the response when tracing is enabled.
     """
 
     start_time = time.time()
@@ -65,29 +157,136 @@ def generate():
     else:
         data = request.form.to_dict()
 
-    if not data or 'prompt' not in data:
+    if not isinstance(data, dict) or 'prompt' not in data:
         return jsonify({
             "error": "Missing required parameter: prompt"
         }), 400
 
-    # Convert types as needed
-    prompt = data['prompt']
-    max_tokens = int(data.get('max_tokens', 100))
-    temperature = float(data.get('temperature', 0.7))
-
+    slot = None
     try:
+        # Convert types as needed; a bad value is answered with a 400 below
+        params = generation_params(data)
+        timeout = request_timeout(data)
+
+        slot = provider_manager.admit(request_priority(data))
+
         # Call your LLM provider manager
-        result = provider_manager.generate(
-            prompt=prompt,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
+        result = provider_manager.generate(timeout=timeout, **params)
 
         time_taken = time.time() - start_time
         result['timeTaken'] = round(time_taken, 2)
+        if slot is not None:
+            result['queueTime'] = round(slot.waited, 3)
+        trace = tracing.current()
+        if trace is not None and wants_timings(data):
+            result['timings'] = trace.report()
 
         return jsonify(result)
 
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except CacheMissError as e:
+        return jsonify({
+            "error": "No cached response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 504
+
+    except ContextWindowError as e:
+        return jsonify({
+            "error": "Prompt too long",
+            "details": str(e)
+        }), 413
+
+    except DeadlineExceededError as e:
+        return jsonify({
+            "error": "Deadline exceeded",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 504
+
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "error": "Invalid request",
+            "details": str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return jsonify({
+            "error": "Failed to generate response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 500
+
+    finally:
+        if slot is not None:
+            slot.release()
+
+@app.route('/generate/stream', methods=['POST'])
+def generate_stream():
+    """
+    Stream generated text as Server-Sent Events.
+
+    Accepts the same request body as /generate. Sends `chunk` events with
+    {"text": ...} as the provider produces them, then one `done` event with
+    tokens, cost and provider metadata. Failures before the first event get
+    the usual JSON error response; later ones end the stream with an
+    `error` event.
+    """
+    start_time = time.time()
+
+    if request.is_json:
+        data = request.get_json()
+    else:
+        data = request.form.to_dict()
+
+    if not isinstance(data, dict) or 'prompt' not in data:
+        return jsonify({
+            "error": "Missing required parameter: prompt"
+        }), 400
+
+    # Pull the first event before answering so fallback and errors can still
+    # happen before any byte is sent
+    slot = None
+    first = None
+    try:
+        params = generation_params(data)
+        timeout = request_timeout(data)
+        slot = provider_manager.admit(request_priority(data))
+        events = provider_manager.stream(timeout=timeout, **params)
+        first = next(events)
+
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except CacheMissError as e:
+        return jsonify({
+            "error": "No cached response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 504
+
+    except ContextWindowError as e:
+        return jsonify({
+            "error": "Prompt too long",
+            "details": str(e)
+        }), 413
+
+    except DeadlineExceededError as e:
+        return jsonify({
+            "error": "Deadline exceeded",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 504
+
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "error": "Invalid request",
+            "details": str(e)
+        }), 400
+
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
         return jsonify({
@@ -96,33 +295,89 @@ def generate():
             "timeTaken": round(time.time() - start_time, 2)
         }), 500
 
+    finally:
+        # Once the stream has started, the slot is released when the response closes
+        if first is None and slot is not None:
+            slot.release()
+
+    body = sse_stream(itertools.chain([first], events), start_time=start_time)
+    response = Response(stream_with_context(body), mimetype='text/event-stream', headers=SSE_HEADERS)
+    if slot is not None:
+        response.call_on_close(slot.release)
+    return response
+
+@app.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """
+    Generate several prompts in one call.
+
+    Request format (JSON), either a bare array or wrapped in "items":
+      {
+        "items": [
+          {"prompt": "Hello!", "max_tokens": 50},
+          {"prompt": "What is ML?", "temperature": 0}
+        ]
+      }
+
+    Items run concurrently and results come back in input order. An item
+    that fails gets {"error", "details", "status"} in its slot. Items may
+    set their own "timeout"; a top-level "timeout" next to "items" (or the
+    X-Request-Timeout header) sets it for the rest.
+    """
+    start_time = time.time()
+
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            "error": "Missing required parameter: items"
+        }), 400
+
+    slot = None
+    try:
+        slot = provider_manager.admit(request_priority(data), batch=True)
+        results = provider_manager.generate_batch(items, timeout=request_timeout(data))
+
+        return jsonify({
+            "results": results,
+            "timeTaken": round(time.time() - start_time, 2)
+        })
+
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "error": "Invalid request",
+            "details": str(e)
+        }), 400
+
+    except Exception as e:
+        logger.error(f"Error generating batch: {str(e)}")
+        return jsonify({
+            "error": "Failed to generate batch",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }), 500
+
+    finally:
+        if slot is not None:
+            slot.release()
+
 @app.route('/stats', methods=['GET'])
 def get_stats():
     """Get usage statistics and logs."""
     try:
-        # Read usage logs from storage
-        with open('storage/usage_logs.json', 'r') as file:
-            logs = json.load(file)
-        
-        # Calculate summary statistics
-        summary = {
-            "totalRequests": len(logs),
-            "totalCost": sum(log.get('cost', 0) for log in logs),
-            "totalTokens": sum(log.get('tokens', {}).get('total', 0) for log in logs),
-            "providerUsage": {}
-        }
-        
-        # Count usage by provider
-        for log in logs:
-            provider = log.get('modelUsed')
-            if provider:
-                if provider not in summary['providerUsage']:
-                    summary['providerUsage'][provider] = 0
-                summary['providerUsage'][provider] += 1
+        # Write this worker's buffered records, then fold in anything new
+        provider_manager.usage_store.flush()
+        usage_stats = provider_manager.usage_stats
+        usage_stats.refresh()
         
         return jsonify({
-            "summary": summary,
-            "recentLogs": logs[-50:]  # Return the most recent 50 logs
+            "summary": usage_stats.summary(),
+            "recentLogs": usage_stats.recent_logs(),  # Return the most recent 50 logs
+            "caches": provider_manager.get_cache_stats()
         })
     
     except Exception as e:
@@ -134,21 +389,35 @@ def get_stats():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint."""
-    return jsonify({
-        "status": "healthy",
-        "providers": provider_manager.get_provider_status() if provider_manager else []
-    })
+    """
+    Health check endpoint. Degraded while any provider's circuit is not
+    closed; not ready while tokenizers are still loading (token counts are
+    estimated until then). Admission queue depth and waits are included
+    when admission control is enabled.
+    """
+    providers = provider_manager.get_provider_status() if provider_manager else []
+    degraded = any(p.get('circuit', {}).get('state', 'closed') != 'closed' for p in providers)
+    health = {
+        "status": "degraded" if degraded else "healthy",
+        "ready": provider_manager.tokenizers_ready() if provider_manager else False,
+        "providers": providers
+    }
+    if provider_manager is not None and provider_manager.admission is not None:
+        health['admission'] = provider_manager.admission.status()
+    return jsonify(health)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus metrics, merged across worker processes when
+    settings.metrics.path is set.
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     # Ensure storage directory exists
     os.makedirs('storage', exist_ok=True)
     
-    # Create empty usage logs file if it doesn't exist
-    if not os.path.exists('storage/usage_logs.json'):
-        with open('storage/usage_logs.json', 'w') as file:
-            json.dump([], file)
-    
     # Start the Flask app
     port = int(os.environ.get('PORT', 5000))
     debug_mode = os.environ.get('DEBUG', 'False').lower() == 'true'
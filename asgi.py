@@ -0,0 +1,358 @@
+"""
+MultiLLM Cost-Optimized API Microservice - ASGI entry point
+
+Serves the API on an event loop so an in-flight LLM call does not hold a
+worker thread. Run with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+
+from services import metrics, tracing
+from services.admission import AdmissionRejectedError
+from services.deadline import DeadlineExceededError
+from services.provider_manager import ContextWindowError, ProviderManager
+from services.response_cache import CacheMissError
+from utils.logger import setup_logger
+from utils.sse import SSE_HEADERS, sse_stream
+
+# Setup logger
+logger = setup_logger()
+
+# Initialize provider manager
+provider_manager = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global provider_manager
+    config_path = os.environ.get('CONFIG_PATH', 'config/providers.yaml')
+    provider_manager = ProviderManager.from_config_file(config_path)
+    logger.info("Provider manager initialized with configuration.")
+    yield
+    provider_manager.usage_store.close()
+
+
+app = FastAPI(title="MultiLLM", lifespan=lifespan)
+
+TIMEOUT_HEADER = 'X-Request-Timeout'
+
+
+def request_timeout(request: Request, data=None):
+    """Deadline in seconds from the "timeout" field or X-Request-Timeout header; None for the server default."""
+    value = data.get('timeout') if isinstance(data, dict) else None
+    if value in (None, ''):
+        value = request.headers.get(TIMEOUT_HEADER)
+    return float(value) if value not in (None, '') else None
+
+
+PRIORITY_HEADER = 'X-Priority'
+
+
+def request_priority(request: Request, data=None):
+    """Admission class from the "priority" field or X-Priority header; None for the default class."""
+    value = data.get('priority') if isinstance(data, dict) else None
+    return value or request.headers.get(PRIORITY_HEADER) or None
+
+
+def wants_timings(data) -> bool:
+    """Whether the request asked for its trace spans in a "timings" field."""
+    value = data.get('timings') if isinstance(data, dict) else None
+    return value is True or str(value).lower() in ('1', 'true')
+
+
+def generation_params(data: dict) -> dict:
+    """
+    prompt, max_tokens, temperature and cache from a request body.
+
+    Raises:
+        TypeError, ValueError: If a field has the wrong type or value
+    """
+    prompt = data['prompt']
+    if not isinstance(prompt, str):
+        raise TypeError("prompt must be a string")
+    return {
+        "prompt": prompt,
+        "max_tokens": int(data.get('max_tokens', 100)),
+        "temperature": float(data.get('temperature', 0.7)),
+        "cache": data.get('cache', 'default')
+    }
+
+
+def busy_response(error: AdmissionRejectedError) -> JSONResponse:
+    """429 for a request turned away by admission control."""
+    return JSONResponse({
+        "error": "Server busy",
+        "details": str(error),
+        "retryAfter": error.retry_after_header
+    }, status_code=429, headers={'Retry-After': error.retry_after_header})
+
+
+@app.middleware("http")
+async def reload_config(request: Request, call_next):
+    """
+    Pick up config file changes; a no-op stat when nothing changed. The
+    reload itself (parsing, building providers, closing pools) runs on a
+    worker thread so requests in flight on the loop keep moving.
+    """
+    if provider_manager.needs_reload():
+        with tracing.span('config_reload'):
+            await asyncio.to_thread(provider_manager.reload_if_changed)
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """
+    Collect per-phase spans for the request when settings.tracing is enabled,
+    summarised in a Server-Timing header. For streams the header covers the
+    time until the first event.
+    """
+    trace = tracing.start(f"{request.method} {request.url.path}")
+    try:
+        response = await call_next(request)
+        if trace is not None:
+            response.headers['Server-Timing'] = trace.server_timing()
+        return response
+    finally:
+        tracing.finish(trace)
+
+
+@app.post('/generate')
+async def generate(request: Request):
+    """
+    Generate text using the most cost-effective LLM provider.
+
+    Accepts the same JSON body as the Flask endpoint:
+      {"prompt": "Hello!", "max_tokens": 100, "temperature": 0.7, "cache": "default", "timeout": 20,
+       "priority": "interactive", "timings": true}
+    """
+    start_time = time.time()
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or 'prompt' not in data:
+        return JSONResponse({"error": "Missing required parameter: prompt"}, status_code=400)
+
+    slot = None
+    try:
+        params = generation_params(data)
+        timeout = request_timeout(request, data)
+
+        slot = await provider_manager.aadmit(request_priority(request, data))
+        result = await provider_manager.agenerate(timeout=timeout, **params)
+
+        result['timeTaken'] = round(time.time() - start_time, 2)
+        if slot is not None:
+            result['queueTime'] = round(slot.waited, 3)
+        trace = tracing.current()
+        if trace is not None and wants_timings(data):
+            result['timings'] = trace.report()
+        return result
+
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except CacheMissError as e:
+        return JSONResponse({
+            "error": "No cached response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=504)
+
+    except ContextWindowError as e:
+        return JSONResponse({"error": "Prompt too long", "details": str(e)}, status_code=413)
+
+    except DeadlineExceededError as e:
+        return JSONResponse({
+            "error": "Deadline exceeded",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=504)
+
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": "Invalid request", "details": str(e)}, status_code=400)
+
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return JSONResponse({
+            "error": "Failed to generate response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=500)
+
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+@app.post('/generate/stream')
+async def generate_stream(request: Request):
+    """
+    Stream generated text as Server-Sent Events; see the Flask endpoint for
+    the event format. Provider chunks are read in a worker thread.
+    """
+    start_time = time.time()
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    if not isinstance(data, dict) or 'prompt' not in data:
+        return JSONResponse({"error": "Missing required parameter: prompt"}, status_code=400)
+
+    slot = None
+    first = None
+    try:
+        params = generation_params(data)
+        timeout = request_timeout(request, data)
+        slot = await provider_manager.aadmit(request_priority(request, data))
+        events = provider_manager.stream(timeout=timeout, **params)
+        first = await asyncio.to_thread(next, events)
+
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except CacheMissError as e:
+        return JSONResponse({
+            "error": "No cached response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=504)
+
+    except ContextWindowError as e:
+        return JSONResponse({"error": "Prompt too long", "details": str(e)}, status_code=413)
+
+    except DeadlineExceededError as e:
+        return JSONResponse({
+            "error": "Deadline exceeded",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=504)
+
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": "Invalid request", "details": str(e)}, status_code=400)
+
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        return JSONResponse({
+            "error": "Failed to generate response",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=500)
+
+    finally:
+        # Once the stream has started, the slot is released when the response finishes
+        if first is None and slot is not None:
+            slot.release()
+
+    body = sse_stream(itertools.chain([first], events), start_time=start_time)
+    background = BackgroundTask(slot.release) if slot is not None else None
+    return StreamingResponse(body, media_type='text/event-stream', headers=SSE_HEADERS, background=background)
+
+
+@app.post('/generate/batch')
+async def generate_batch(request: Request):
+    """Generate several prompts in one call; same body and response as the Flask endpoint."""
+    start_time = time.time()
+
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+
+    items = data.get('items') if isinstance(data, dict) else data
+
+    if not isinstance(items, list) or not items:
+        return JSONResponse({"error": "Missing required parameter: items"}, status_code=400)
+
+    slot = None
+    try:
+        slot = await provider_manager.aadmit(request_priority(request, data), batch=True)
+        results = await asyncio.to_thread(provider_manager.generate_batch, items,
+                                          request_timeout(request, data))
+        return {"results": results, "timeTaken": round(time.time() - start_time, 2)}
+
+    except AdmissionRejectedError as e:
+        return busy_response(e)
+
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": "Invalid request", "details": str(e)}, status_code=400)
+
+    except Exception as e:
+        logger.error(f"Error generating batch: {str(e)}")
+        return JSONResponse({
+            "error": "Failed to generate batch",
+            "details": str(e),
+            "timeTaken": round(time.time() - start_time, 2)
+        }, status_code=500)
+
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+@app.get('/stats')
+async def get_stats():
+    """Get usage statistics and logs."""
+    def collect():
+        provider_manager.usage_store.flush()
+        usage_stats = provider_manager.usage_stats
+        usage_stats.refresh()
+        return {
+            "summary": usage_stats.summary(),
+            "recentLogs": usage_stats.recent_logs(),
+            "caches": provider_manager.get_cache_stats()
+        }
+
+    try:
+        return await asyncio.to_thread(collect)
+    except Exception as e:
+        logger.error(f"Error retrieving stats: {str(e)}")
+        return JSONResponse({
+            "error": "Failed to retrieve statistics",
+            "details": str(e)
+        }, status_code=500)
+
+
+@app.get('/health')
+async def health_check():
+    """
+    Health check endpoint. Degraded while any provider's circuit is not
+    closed; not ready while tokenizers are still loading (token counts are
+    estimated until then). Admission queue depth and waits are included
+    when admission control is enabled.
+    """
+    providers = provider_manager.get_provider_status() if provider_manager else []
+    degraded = any(p.get('circuit', {}).get('state', 'closed') != 'closed' for p in providers)
+    health = {
+        "status": "degraded" if degraded else "healthy",
+        "ready": provider_manager.tokenizers_ready() if provider_manager else False,
+        "providers": providers
+    }
+    if provider_manager is not None and provider_manager.admission is not None:
+        health['admission'] = provider_manager.admission.status()
+    return health
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """
+    Prometheus metrics, merged across worker processes when
+    settings.metrics.path is set. Read in a thread, since merging reads
+    the other workers' files.
+    """
+    body = await asyncio.to_thread(metrics.render)
+    return PlainTextResponse(body, media_type='text/plain; version=0.0.4')
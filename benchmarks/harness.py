@@ -0,0 +1,294 @@
+"""
+Benchmark Harness
+
+Shared plumbing for the load and replay benchmarks: starts stub providers
+and a router in their own processes, rewrites a providers config to point at
+the stubs, parses Server-Timing headers into router overhead, and
+summarises and compares results.
+"""
+import copy
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Provider type -> stub wire format
+STUB_KINDS = {'llama': 'ollama', 'groq': 'groq', 'huggingface': 'huggingface'}
+
+# Server-Timing phases spent waiting on providers or on the router's own
+# admission, concurrency, rate-limit and backoff policies rather than doing router work
+WAIT_PHASES = {'http_connect', 'http_tls', 'http_upstream', 'http_read', 'backoff', 'admission', 'rate_limit',
+               'slot_wait'}
+
+
+def load_config(path: str) -> Dict:
+    """Read a providers YAML file without importing the router (and its logging setup)."""
+    with open(path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_override(value: str):
+    """'groq.error_rate=0.2' -> ('groq', 'error_rate', 0.2); the value is parsed as YAML."""
+    target, _, raw = value.partition('=')
+    name, _, key = target.partition('.')
+    if not name or not key or not raw:
+        raise ValueError(f"Invalid stub override '{value}'; expected PROVIDER.KEY=VALUE")
+    return name, key, yaml.safe_load(raw)
+
+
+def stub_specs(config: Dict, profile: Dict, overrides: Iterable[str] = ()) -> List[Dict]:
+    """One stub spec per enabled provider: the shared profile plus that provider's overrides."""
+    specs = []
+    for provider in config.get('providers', []):
+        if not provider.get('enabled', True) or provider.get('type') not in STUB_KINDS:
+            continue
+        spec = dict(profile, name=provider['name'], kind=STUB_KINDS[provider['type']])
+        specs.append(spec)
+
+    by_name = {spec['name']: spec for spec in specs}
+    for override in overrides:
+        name, key, value = parse_override(override)
+        if name not in by_name:
+            raise ValueError(f"Stub override for unknown provider '{name}'")
+        by_name[name][key] = value
+    return specs
+
+
+def bench_config(config: Dict, stubs: List[Dict], tracing: bool = True) -> Dict:
+    """
+    The router config for a run: the given config with every stubbed
+    provider's endpoint pointed at its stub and a placeholder API key, and
+    tracing on so responses carry Server-Timing.
+    """
+    config = copy.deepcopy(config)
+    endpoints = {stub['name']: stub['endpoint'] for stub in stubs}
+    providers = []
+    for provider in config.get('providers', []):
+        if provider['name'] not in endpoints:
+            continue
+        provider['endpoint'] = endpoints[provider['name']]
+        provider['enabled'] = True
+        if provider.get('type') in ('groq', 'huggingface'):
+            provider['api_key'] = 'benchmark'
+        providers.append(provider)
+    config['providers'] = providers
+
+    settings = config.setdefault('settings', {})
+    settings['tracing'] = {'enabled': tracing}
+    return config
+
+
+class Processes:
+    """Stub and router processes for one run, sharing a scratch directory."""
+
+    def __init__(self, workdir: Optional[str] = None, keep: bool = False):
+        self.workdir = workdir or tempfile.mkdtemp(prefix='llm-bench-')
+        os.makedirs(self.workdir, exist_ok=True)
+        self.keep = keep or workdir is not None
+        self._processes: List[subprocess.Popen] = []
+        self._logs = []
+
+    def __enter__(self) -> 'Processes':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _spawn(self, args: List[str], log_name: str, env: Optional[Dict] = None, **kwargs) -> subprocess.Popen:
+        log = open(os.path.join(self.workdir, log_name), 'w')
+        self._logs.append(log)
+        process = subprocess.Popen(args, cwd=self.workdir, env=dict(os.environ, PYTHONPATH=ROOT, **(env or {})),
+                                   stderr=log, **kwargs)
+        self._processes.append(process)
+        return process
+
+    def start_stubs(self, specs: List[Dict]) -> List[Dict]:
+        """Serve the stubs and return the specs with their URL and endpoint filled in."""
+        if not specs:
+            return []
+        process = self._spawn([sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_servers.py'),
+                               '--specs', json.dumps(specs)], 'stubs.log', stdout=subprocess.PIPE, text=True)
+        line = process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"Stub servers failed to start; see {os.path.join(self.workdir, 'stubs.log')}")
+        return [dict(spec, **served) for spec, served in zip(specs, json.loads(line))]
+
+    def start_router(self, config: Dict, server: str = 'asgi', workers: int = 1,
+                     log_level: str = 'INFO', timeout: float = 60.0) -> str:
+        """Run the router on config and return its base URL once /health answers."""
+        config_path = os.path.join(self.workdir, f"router-{len(self._processes)}.yaml")
+        with open(config_path, 'w') as file:
+            yaml.safe_dump(config, file, sort_keys=False)
+
+        port = free_port()
+        env = {'CONFIG_PATH': config_path, 'LOG_LEVEL': log_level}
+        if server == 'asgi':
+            args = [sys.executable, '-m', 'uvicorn', 'asgi:app', '--app-dir', ROOT, '--host', '127.0.0.1',
+                    '--port', str(port), '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+        elif server == 'flask':
+            args = [sys.executable, '-c',
+                    "import sys; from werkzeug.serving import run_simple; from app import app; "
+                    f"run_simple('127.0.0.1', {port}, app, threaded=True)"]
+        else:
+            raise ValueError(f"Unknown server '{server}'; expected asgi or flask")
+        process = self._spawn(args, f"router-{port}.log", env=env, stdout=subprocess.DEVNULL)
+
+        url = f"http://127.0.0.1:{port}"
+        wait_until = time.monotonic() + timeout
+        while time.monotonic() < wait_until:
+            if process.poll() is not None:
+                break
+            try:
+                if httpx.get(f"{url}/health", timeout=2.0).status_code == 200:
+                    return url
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Router did not become healthy; see {os.path.join(self.workdir, f'router-{port}.log')}")
+
+    def stop_router(self):
+        """Stop the most recently started router, keeping the stubs running."""
+        for process in reversed(self._processes[1:]):
+            if process.poll() is None:
+                _terminate(process)
+                return
+
+    def stop(self):
+        for process in reversed(self._processes):
+            if process.poll() is None:
+                _terminate(process)
+        for log in self._logs:
+            log.close()
+        if not self.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def _terminate(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def stub_stats(stubs: List[Dict]) -> List[Dict]:
+    """What each stub answered, from its /stats endpoint."""
+    stats = []
+    for stub in stubs:
+        try:
+            answered = httpx.get(f"{stub['url']}/stats", timeout=5.0).json()
+        except (httpx.HTTPError, ValueError):
+            answered = {}
+        stats.append(dict(answered, name=stub['name']))
+    return stats
+
+
+def server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Milliseconds per phase from a Server-Timing header, summed over providers."""
+    phases: Dict[str, float] = {}
+    for entry in (header or '').split(','):
+        parts = [part.strip() for part in entry.split(';')]
+        if not parts[0]:
+            continue
+        for part in parts[1:]:
+            if part.startswith('dur='):
+                phases[parts[0]] = phases.get(parts[0], 0.0) + float(part[4:])
+    return phases
+
+
+def router_overhead(phases: Dict[str, float]) -> Optional[float]:
+    """Milliseconds the router spent on its own work: the traced total minus waiting."""
+    if 'total' not in phases:
+        return None
+    return max(0.0, phases['total'] - sum(ms for name, ms in phases.items() if name in WAIT_PHASES))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of values, q in [0, 100]."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100.0 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def distribution(values: List[float]) -> Dict:
+    """p50/p95/p99, mean and max, rounded to 0.01."""
+    if not values:
+        return {}
+    summary = {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+    summary['mean'] = sum(values) / len(values)
+    summary['max'] = max(values)
+    return {key: round(value, 2) for key, value in summary.items()}
+
+
+def environment() -> Dict:
+    """Where the results came from, so runs can be compared across versions."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+
+
+def lookup(results: Dict, path: str):
+    """Value at a dotted path like 'latencyMs.p95', or None."""
+    value = results
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(baseline: Dict, current: Dict, paths: Iterable[str]) -> List[Dict]:
+    """Per-metric baseline, current value and relative change."""
+    rows = []
+    for path in paths:
+        before, after = lookup(baseline, path), lookup(current, path)
+        change = None
+        if isinstance(before, (int, float)) and isinstance(after, (int, float)) and before:
+            change = round((after - before) / abs(before) * 100, 1)
+        rows.append({"metric": path, "baseline": before, "current": after, "changePct": change})
+    return rows
+
+
+def print_comparison(rows: List[Dict], baseline_label: str = 'baseline', current_label: str = 'current'):
+    print(f"{'metric':<26}{baseline_label:>16}{current_label:>16}{'change':>10}")
+    for row in rows:
+        change = f"{row['changePct']:+.1f}%" if row['changePct'] is not None else '-'
+        print(f"{row['metric']:<26}{_cell(row['baseline']):>16}{_cell(row['current']):>16}{change:>10}")
+
+
+def _cell(value) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        # Costs are fractions of a cent; keep their significant digits
+        return f"{value:.2f}" if value == 0 or abs(value) >= 0.01 else f"{value:.3g}"
+    return str(value)
@@ -0,0 +1,264 @@
+"""
+Load Test
+
+Drives /generate on a router backed by stub providers (see stub_servers.py)
+and reports latency percentiles, throughput and the router's own overhead.
+Two load models are supported:
+
+- closed loop: a fixed number of clients, each sending its next request
+  as soon as the previous one answers (--concurrency)
+- open loop: requests arrive at a fixed rate whether or not earlier ones
+  have answered (--rate), with latency measured from the scheduled arrival
+  so a slow router can't hide its queueing
+
+Router overhead is read from the Server-Timing header: the traced total
+minus time spent waiting on providers, backoff, admission and rate limits.
+
+Usage:
+    python benchmarks/load_test.py --concurrency 32 --duration 30 --json run.json
+    python benchmarks/load_test.py --rate 200 --arrivals poisson --latency lognormal:0.3:0.5 \\
+        --stub groq.error_rate=0.05 --compare baseline.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import (ROOT, Processes, bench_config, compare, distribution, environment, load_config,
+                                print_comparison, router_overhead, server_timing, stub_specs, stub_stats)
+
+COMPARED = ('throughputRps', 'successRate', 'latencyMs.p50', 'latencyMs.p95', 'latencyMs.p99',
+            'overheadMs.p50', 'overheadMs.p95', 'overheadMs.p99')
+
+
+class Recorder:
+    """Outcome of every request sent, plus the prompts to send."""
+
+    def __init__(self, args):
+        self.args = args
+        self.samples: List[Dict] = []
+        self.dropped = 0
+        self._ids = itertools.count()
+        self._random = random.Random(args.seed)
+
+    def payload(self) -> Dict:
+        index = next(self._ids)
+        if self.args.prompt_pool:
+            index = self._random.randrange(self.args.prompt_pool)
+        words = ' '.join(f"word{(index + offset) % 997}" for offset in range(self.args.prompt_words))
+        return {"prompt": f"Request {index}: {words}", "max_tokens": self.args.max_tokens,
+                "temperature": 0, "cache": self.args.cache}
+
+    async def send(self, client: httpx.AsyncClient, url: str, scheduled: float):
+        sample = {"scheduled": scheduled}
+        try:
+            response = await client.post(url, json=self.payload())
+            sample['status'] = response.status_code
+            phases = server_timing(response.headers.get('server-timing'))
+            overhead = router_overhead(phases)
+            if overhead is not None:
+                sample['overheadMs'] = overhead
+            if response.status_code == 200:
+                body = response.json()
+                sample['provider'] = body.get('modelUsed')
+                sample['cached'] = bool(body.get('cached'))
+        except (httpx.HTTPError, ValueError) as e:
+            sample['status'] = type(e).__name__
+        sample['latencyMs'] = (time.perf_counter() - scheduled) * 1000
+        sample['finished'] = time.perf_counter()
+        self.samples.append(sample)
+
+
+async def closed_loop(recorder: Recorder, client: httpx.AsyncClient, url: str, args) -> float:
+    """Each of --concurrency clients sends back to back until the time or request budget runs out."""
+    started = time.perf_counter()
+    end = started + args.warmup + args.duration
+    issued = itertools.count()
+
+    async def client_loop():
+        while time.perf_counter() < end and (args.requests is None or next(issued) < args.requests):
+            await recorder.send(client, url, time.perf_counter())
+
+    await asyncio.gather(*(client_loop() for _ in range(args.concurrency)))
+    return started
+
+
+async def open_loop(recorder: Recorder, client: httpx.AsyncClient, url: str, args) -> float:
+    """Requests arrive at --rate per second; arrivals past --max-outstanding are dropped and counted."""
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    end = started + args.warmup + args.duration
+    next_at = started
+    pending = set()
+
+    while next_at < end and (args.requests is None or len(recorder.samples) + len(pending) < args.requests):
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(pending) >= args.max_outstanding:
+            recorder.dropped += 1
+        else:
+            task = asyncio.ensure_future(recorder.send(client, url, next_at))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        next_at += rng.expovariate(args.rate) if args.arrivals == 'poisson' else 1.0 / args.rate
+
+    if pending:
+        await asyncio.gather(*pending)
+    return started
+
+
+async def drive(url: str, args) -> Dict:
+    recorder = Recorder(args)
+    connections = args.concurrency if args.rate is None else args.max_outstanding
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        loop = closed_loop if args.rate is None else open_loop
+        started = await loop(recorder, client, f"{url}/generate", args)
+    return summarize(recorder, started + args.warmup)
+
+
+def summarize(recorder: Recorder, measured_from: float) -> Dict:
+    """Results over the samples that started after the warm-up."""
+    samples = [sample for sample in recorder.samples if sample['scheduled'] >= measured_from]
+    if not samples:
+        return {"requests": 0, "dropped": recorder.dropped}
+
+    window = max(sample['finished'] for sample in samples) - measured_from
+    succeeded = [sample for sample in samples if sample['status'] == 200]
+    statuses: Dict[str, int] = {}
+    served_by: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    for sample in succeeded:
+        served_by[sample.get('provider') or 'unknown'] = served_by.get(sample.get('provider') or 'unknown', 0) + 1
+
+    return {
+        "requests": len(samples),
+        "dropped": recorder.dropped,
+        "statuses": statuses,
+        "successRate": round(len(succeeded) / len(samples), 4),
+        "throughputRps": round(len(succeeded) / window, 2) if window > 0 else None,
+        "latencyMs": distribution([sample['latencyMs'] for sample in succeeded]),
+        "overheadMs": distribution([sample['overheadMs'] for sample in succeeded if 'overheadMs' in sample]),
+        "cached": sum(1 for sample in succeeded if sample.get('cached')),
+        "servedBy": served_by
+    }
+
+
+def print_results(results: Dict):
+    print(f"requests {results['requests']}  dropped {results['dropped']}  "
+          f"success {results.get('successRate', 0) * 100:.1f}%  throughput {results.get('throughputRps')} req/s")
+    print(f"statuses {results.get('statuses', {})}  served by {results.get('servedBy', {})}")
+    print(f"{'':<14}{'p50':>10}{'p95':>10}{'p99':>10}{'mean':>10}{'max':>10}")
+    for key in ('latencyMs', 'overheadMs'):
+        summary = results.get(key) or {}
+        cells = ''.join(f"{summary[stat]:>10.2f}" if stat in summary else f"{'-':>10}"
+                        for stat in ('p50', 'p95', 'p99', 'mean', 'max'))
+        print(f"{key:<14}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /generate against stub providers")
+    load = parser.add_argument_group('load')
+    load.add_argument('--concurrency', type=int, default=16, help="closed loop: clients sending back to back")
+    load.add_argument('--rate', type=float, help="open loop: arrivals per second (overrides --concurrency)")
+    load.add_argument('--arrivals', choices=('constant', 'poisson'), default='constant')
+    load.add_argument('--max-outstanding', type=int, default=1000, help="open loop: drop arrivals beyond this")
+    load.add_argument('--duration', type=float, default=20.0, help="measured seconds")
+    load.add_argument('--warmup', type=float, default=3.0, help="seconds sent but not measured")
+    load.add_argument('--requests', type=int, help="stop after this many requests")
+    load.add_argument('--timeout', type=float, default=60.0, help="client timeout per request")
+    load.add_argument('--max-tokens', type=int, default=32)
+    load.add_argument('--prompt-words', type=int, default=20)
+    load.add_argument('--prompt-pool', type=int, help="draw prompts from this many distinct ones (exercises caching)")
+    load.add_argument('--cache', default='bypass', help="cache mode sent with each request")
+    load.add_argument('--seed', type=int, default=1)
+
+    stubs = parser.add_argument_group('stub providers (applied to every provider unless overridden)')
+    stubs.add_argument('--latency', default='lognormal:0.1:0.3')
+    stubs.add_argument('--per-token', type=float, default=0.0)
+    stubs.add_argument('--completion-tokens', type=int, default=32)
+    stubs.add_argument('--error-rate', type=float, default=0.0)
+    stubs.add_argument('--rate-limit-rate', type=float, default=0.0)
+    stubs.add_argument('--rpm', type=int)
+    stubs.add_argument('--retry-after', type=float, default=1.0)
+    stubs.add_argument('--stub', action='append', default=[], metavar='PROVIDER.KEY=VALUE',
+                       help="per-provider override, e.g. groq.error_rate=0.1 or llama.latency=fixed:0.5")
+
+    router = parser.add_argument_group('router')
+    router.add_argument('--config', default=os.path.join(ROOT, 'config', 'providers.yaml'),
+                        help="providers and settings to run; endpoints are pointed at the stubs")
+    router.add_argument('--server', choices=('asgi', 'flask'), default='asgi')
+    router.add_argument('--workers', type=int, default=1, help="uvicorn worker processes")
+    router.add_argument('--log-level', default='INFO', help="router LOG_LEVEL")
+    router.add_argument('--no-tracing', action='store_true', help="don't trace requests (no overhead figures)")
+    router.add_argument('--url', help="load an already running router instead of starting stubs and one")
+    router.add_argument('--workdir', help="keep stub and router logs here instead of a temporary directory")
+
+    output = parser.add_argument_group('output')
+    output.add_argument('--label', help="name for this run in the results")
+    output.add_argument('--json', help="write the results to this file")
+    output.add_argument('--compare', metavar='BASELINE', help="print changes against an earlier --json file")
+    args = parser.parse_args()
+
+    profile = {
+        "latency": args.latency, "per_token": args.per_token, "completion_tokens": args.completion_tokens,
+        "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate, "rpm": args.rpm,
+        "retry_after": args.retry_after, "seed": args.seed
+    }
+    scenario = {
+        "mode": 'closed' if args.rate is None else 'open',
+        "concurrency": args.concurrency if args.rate is None else None,
+        "rate": args.rate, "arrivals": args.arrivals if args.rate is not None else None,
+        "duration": args.duration, "warmup": args.warmup, "maxTokens": args.max_tokens,
+        "promptWords": args.prompt_words, "promptPool": args.prompt_pool, "cache": args.cache,
+        "server": args.server, "workers": args.workers, "tracing": not args.no_tracing
+    }
+
+    stub_results: List[Dict] = []
+    if args.url:
+        results = asyncio.run(drive(args.url.rstrip('/'), args))
+    else:
+        config = load_config(args.config)
+        with Processes(args.workdir) as processes:
+            served = processes.start_stubs(stub_specs(config, profile, args.stub))
+            url = processes.start_router(bench_config(config, served, tracing=not args.no_tracing),
+                                         server=args.server, workers=args.workers, log_level=args.log_level)
+            results = asyncio.run(drive(url, args))
+            stub_results = stub_stats(served)
+
+    report = {
+        "label": args.label,
+        "environment": environment(),
+        "scenario": scenario,
+        "stubs": stub_results,
+        "results": results
+    }
+    print_results(results)
+    for stub in stub_results:
+        print(f"stub {stub['name']:<14} {stub.get('kind', '?'):<12} {stub.get('requests', 0):>7} requests  "
+              f"{stub.get('statuses', {})}")
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        print()
+        print_comparison(compare(baseline['results'], results, COMPARED),
+                         baseline.get('label') or 'baseline', args.label or 'current')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+"""
+Trace Replay
+
+Replays recorded traffic from the usage log against one or two router
+configurations and reports how latency, cost, cache hits and fallbacks
+change between them. Use it to try a routing or caching change on the real
+traffic shape before rolling it out.
+
+The usage log keeps when each request arrived and how many prompt and
+completion tokens it had, but not the prompt itself. Each record becomes a
+synthetic prompt of about the same length, asking for the recorded number
+of completion tokens. Records with the same response get the same prompt,
+so repeated questions (including those the cache answered) repeat in the
+replay and exercise the cache. Arrivals keep their recorded spacing, sped
+up by --speed, or are sent as fast as --concurrency allows with
+--speed max.
+
+By default each configuration runs against fresh stub providers (see
+stub_servers.py) with a clean router, so both see the same traffic and the
+same provider behaviour. --live runs the configurations against their real
+endpoints instead, and a target can also be the URL of a running router.
+
+Usage:
+    python benchmarks/replay.py --baseline config/providers.yaml --candidate new.yaml --speed 60
+    python benchmarks/replay.py --log storage/usage --speed max --max-gap 5 \\
+        --baseline main.yaml --candidate branch.yaml --stub groq.error_rate=0.1 --json replay.json
+"""
+import argparse
+import asyncio
+import copy
+import glob
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.harness import (ROOT, Processes, bench_config, compare, distribution, environment, load_config,
+                                print_comparison, router_overhead, server_timing, stub_specs, stub_stats)
+
+COMPARED = ('successRate', 'latencyMs.p50', 'latencyMs.p95', 'latencyMs.p99', 'overheadMs.p50',
+            'costUsd', 'costPerRequestUsd', 'cacheHits', 'cacheHitRate', 'fallbacks', 'fallbackRate')
+
+# Short enough that a multi-worker run's fallback counters are merged soon after it ends
+METRICS_FLUSH_INTERVAL = 1.0
+
+# Short common words, so synthetic prompts are close to one token per word
+VOCABULARY = ('the', 'of', 'and', 'to', 'in', 'is', 'for', 'on', 'with', 'as', 'what', 'how', 'why', 'when',
+              'data', 'model', 'code', 'time', 'list', 'file', 'user', 'name', 'test', 'page', 'text', 'value',
+              'write', 'explain', 'find', 'make', 'show', 'give', 'short', 'simple', 'first', 'next', 'best', 'new')
+
+
+def read_usage(path: str) -> List[Dict]:
+    """
+    Usage records from a legacy JSON array log, a JSONL usage store
+    directory or a SQLite usage store, oldest first.
+    """
+    if os.path.isdir(path):
+        records = []
+        for segment in sorted(glob.glob(os.path.join(path, 'usage-*.jsonl'))):
+            with open(segment, 'r') as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # a line cut off by a crash
+        return records
+
+    if path.endswith(('.db', '.sqlite', '.sqlite3')):
+        connection = sqlite3.connect(path)
+        try:
+            return [json.loads(row[0]) for row in connection.execute("SELECT record FROM usage ORDER BY id")]
+        finally:
+            connection.close()
+
+    with open(path, 'r') as file:
+        records = json.load(file)
+    if not isinstance(records, list):
+        raise ValueError(f"{path} is not a JSON array of usage records")
+    return records
+
+
+def synthesize_prompt(key: str, words: int) -> str:
+    """A prompt of `words` words that is the same every time for the same key."""
+    rng = random.Random(key)
+    return ' '.join(rng.choice(VOCABULARY) for _ in range(max(1, words)))
+
+
+def build_workload(records: List[Dict], max_gap: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+    """
+    One request per client request in the log, in arrival order. `at` is
+    seconds after the first request at 1x speed, with idle gaps longer than
+    max_gap shortened to max_gap.
+
+    The abandoned side of a hedged request is skipped: the client never
+    saw it. So are records without a timestamp.
+    """
+    records = [record for record in records
+               if isinstance(record, dict) and record.get('timestamp') is not None and 'hedgeOutcome' not in record]
+    records.sort(key=lambda record: record['timestamp'])
+    if limit is not None:
+        records = records[:limit]
+
+    workload = []
+    at = 0.0
+    previous = None
+    for record in records:
+        if previous is not None:
+            gap = max(0.0, record['timestamp'] - previous)
+            at += gap if max_gap is None else min(gap, max_gap)
+        previous = record['timestamp']
+
+        tokens = record.get('tokens') or {}
+        prompt_tokens = int(tokens.get('prompt') or 0)
+        completion_tokens = int(tokens.get('completion') or 0)
+        prompt = record.get('prompt')
+        if not prompt:
+            key = f"{prompt_tokens}:{record.get('response') or record['timestamp']}"
+            prompt = synthesize_prompt(hashlib.sha256(key.encode('utf-8')).hexdigest(), prompt_tokens)
+
+        workload.append({
+            "at": at,
+            "prompt": prompt,
+            "maxTokens": max(1, completion_tokens),
+            "recorded": {
+                "provider": record.get('modelUsed'),
+                "cost": record.get('cost') or 0.0,
+                "cached": bool(record.get('cached') or record.get('coalesced'))
+            }
+        })
+    return workload
+
+
+def describe_workload(workload: List[Dict]) -> Dict:
+    """What the recorded traffic looked like, for the report."""
+    served_by: Dict[str, int] = {}
+    for item in workload:
+        provider = item['recorded']['provider'] or 'unknown'
+        served_by[provider] = served_by.get(provider, 0) + 1
+    return {
+        "requests": len(workload),
+        "spanS": round(workload[-1]['at'], 2) if workload else 0.0,
+        "distinctPrompts": len({item['prompt'] for item in workload}),
+        "recordedCostUsd": round(sum(item['recorded']['cost'] for item in workload), 6),
+        "recordedCached": sum(1 for item in workload if item['recorded']['cached']),
+        "recordedServedBy": served_by
+    }
+
+
+def parse_speed(value: str) -> Optional[float]:
+    """'max' -> None (as fast as possible); otherwise a positive multiple of real time."""
+    if value.lower() in ('max', 'asap'):
+        return None
+    speed = float(value.lower().rstrip('x'))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError(f"Speed must be positive or 'max', got {value}")
+    return speed
+
+
+def fallback_counts(metrics_text: str) -> Dict[str, float]:
+    """llm_fallbacks_total from a /metrics body, summed over providers, by reason."""
+    counts: Dict[str, float] = {}
+    for line in metrics_text.splitlines():
+        if not line.startswith('llm_fallbacks_total{'):
+            continue
+        labels, _, value = line.rpartition(' ')
+        reason = labels.partition('reason="')[2].partition('"')[0] or 'unknown'
+        try:
+            counts[reason] = counts.get(reason, 0.0) + float(value)
+        except ValueError:
+            continue
+    return counts
+
+
+async def scrape_fallbacks(client: httpx.AsyncClient, url: str) -> Optional[Dict[str, float]]:
+    try:
+        response = await client.get(f"{url}/metrics")
+        response.raise_for_status()
+    except httpx.HTTPError:
+        return None
+    return fallback_counts(response.text)
+
+
+async def send(client: httpx.AsyncClient, url: str, item: Dict, temperature: float, scheduled: float) -> Dict:
+    sample = {}
+    try:
+        response = await client.post(url, json={"prompt": item['prompt'], "max_tokens": item['maxTokens'],
+                                                "temperature": temperature})
+        sample['status'] = response.status_code
+        overhead = router_overhead(server_timing(response.headers.get('server-timing')))
+        if overhead is not None:
+            sample['overheadMs'] = overhead
+        if response.status_code == 200:
+            body = response.json()
+            sample['provider'] = body.get('modelUsed')
+            sample['cost'] = body.get('cost') or 0.0
+            sample['cached'] = bool(body.get('cached'))
+            sample['coalesced'] = bool(body.get('coalesced'))
+    except (httpx.HTTPError, ValueError) as e:
+        sample['status'] = type(e).__name__
+    sample['latencyMs'] = (time.perf_counter() - scheduled) * 1000
+    return sample
+
+
+async def replay(url: str, workload: List[Dict], args) -> Dict:
+    """
+    Send the workload and summarise the responses. At a fixed speed
+    requests arrive on schedule whether or not earlier ones have answered,
+    and latency counts from the scheduled arrival; at max speed at most
+    --concurrency are in flight.
+    """
+    connections = args.concurrency if args.speed is None else 1000
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def timed(item: Dict, started: float) -> Dict:
+        scheduled = started + item['at'] / args.speed
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return await send(client, f"{url}/generate", item, args.temperature, scheduled)
+
+    async def bounded(item: Dict) -> Dict:
+        async with semaphore:
+            return await send(client, f"{url}/generate", item, args.temperature, time.perf_counter())
+
+    async with httpx.AsyncClient(limits=limits, timeout=args.timeout) as client:
+        fallbacks_before = await scrape_fallbacks(client, url)
+        started = time.perf_counter()
+        if args.speed is None:
+            samples = await asyncio.gather(*(bounded(item) for item in workload))
+        else:
+            samples = await asyncio.gather(*(timed(item, started) for item in workload))
+        elapsed = time.perf_counter() - started
+
+        if args.workers > 1:
+            # Other workers publish their counters every flush_interval
+            await asyncio.sleep(METRICS_FLUSH_INTERVAL + 0.5)
+        fallbacks_after = await scrape_fallbacks(client, url)
+
+    fallbacks = None
+    if fallbacks_before is not None and fallbacks_after is not None:
+        fallbacks = {reason: int(count - fallbacks_before.get(reason, 0.0))
+                     for reason, count in fallbacks_after.items() if count > fallbacks_before.get(reason, 0.0)}
+    return summarize(list(samples), fallbacks, elapsed)
+
+
+def summarize(samples: List[Dict], fallbacks: Optional[Dict[str, int]], elapsed: float) -> Dict:
+    """Results of one replay; fallbacks are by reason, None when /metrics couldn't be read."""
+    if not samples:
+        return {"requests": 0}
+
+    succeeded = [sample for sample in samples if sample['status'] == 200]
+    statuses: Dict[str, int] = {}
+    served_by: Dict[str, int] = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    for sample in succeeded:
+        served_by[sample.get('provider') or 'unknown'] = served_by.get(sample.get('provider') or 'unknown', 0) + 1
+
+    cost = sum(sample.get('cost', 0.0) for sample in succeeded)
+    cache_hits = sum(1 for sample in succeeded if sample.get('cached'))
+    return {
+        "requests": len(samples),
+        "statuses": statuses,
+        "successRate": round(len(succeeded) / len(samples), 4),
+        "durationS": round(elapsed, 2),
+        "latencyMs": distribution([sample['latencyMs'] for sample in succeeded]),
+        "overheadMs": distribution([sample['overheadMs'] for sample in succeeded if 'overheadMs' in sample]),
+        "costUsd": round(cost, 6),
+        "costPerRequestUsd": round(cost / len(succeeded), 8) if succeeded else None,
+        "cacheHits": cache_hits,
+        "cacheHitRate": round(cache_hits / len(succeeded), 4) if succeeded else None,
+        "coalesced": sum(1 for sample in succeeded if sample.get('coalesced')),
+        "fallbacks": sum(fallbacks.values()) if fallbacks is not None else None,
+        "fallbackRate": round(sum(fallbacks.values()) / len(samples), 4) if fallbacks is not None else None,
+        "fallbacksByReason": fallbacks,
+        "servedBy": served_by
+    }
+
+
+def router_config(config: Dict, stubs: Optional[List[Dict]], tracing: bool) -> Dict:
+    """The config to run: pointed at the stubs, or as written for --live."""
+    if stubs is not None:
+        config = bench_config(config, stubs, tracing=tracing)
+    else:
+        config = copy.deepcopy(config)
+        config.setdefault('settings', {})['tracing'] = {'enabled': tracing}
+    config['settings']['metrics'] = dict(config['settings'].get('metrics') or {}, path='metrics',
+                                         flush_interval=METRICS_FLUSH_INTERVAL)
+    return config
+
+
+def run_target(target: str, label: str, workload: List[Dict], profile: Dict, args) -> Dict:
+    """Replay against a router URL, or start one (and its stubs) for a config file."""
+    if target.startswith(('http://', 'https://')):
+        return {"target": target, "stubs": [], "results": asyncio.run(replay(target.rstrip('/'), workload, args))}
+
+    config = load_config(target)
+    workdir = os.path.join(args.workdir, label) if args.workdir else None
+    with Processes(workdir) as processes:
+        served = None if args.live else processes.start_stubs(stub_specs(config, profile, args.stub))
+        url = processes.start_router(router_config(config, served, tracing=not args.no_tracing),
+                                     server=args.server, workers=args.workers, log_level=args.log_level)
+        results = asyncio.run(replay(url, workload, args))
+        stubs = stub_stats(served) if served else []
+    return {"target": target, "stubs": stubs, "results": results}
+
+
+def print_results(label: str, results: Dict):
+    print(f"[{label}] requests {results['requests']}  success {results.get('successRate', 0) * 100:.1f}%  "
+          f"in {results.get('durationS')}s  cost ${results.get('costUsd', 0):.6f}  "
+          f"cache hits {results.get('cacheHits')}  fallbacks {results.get('fallbacksByReason')}")
+    print(f"[{label}] statuses {results.get('statuses', {})}  served by {results.get('servedBy', {})}")
+    latency = results.get('latencyMs') or {}
+    print(f"[{label}] latency ms " + '  '.join(f"{stat} {latency[stat]:.2f}"
+                                                for stat in ('p50', 'p95', 'p99', 'max') if stat in latency))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded usage against one or two router configurations")
+    workload_group = parser.add_argument_group('workload')
+    workload_group.add_argument('--log', default=os.path.join(ROOT, 'storage', 'usage_logs.json'),
+                                help="legacy JSON log, JSONL usage store directory or SQLite usage store")
+    workload_group.add_argument('--speed', type=parse_speed, default=1.0,
+                                help="multiple of recorded time (1, 10, 60...) or 'max' for as fast as possible")
+    workload_group.add_argument('--max-gap', type=float, help="shorten recorded idle gaps to this many seconds")
+    workload_group.add_argument('--limit', type=int, help="replay only the first this many requests")
+    workload_group.add_argument('--concurrency', type=int, default=32, help="--speed max: requests in flight")
+    workload_group.add_argument('--temperature', type=float, default=0.0, help="sent with every request")
+    workload_group.add_argument('--timeout', type=float, default=60.0, help="client timeout per request")
+
+    targets = parser.add_argument_group('targets (providers config file or URL of a running router)')
+    targets.add_argument('--baseline', default=os.path.join(ROOT, 'config', 'providers.yaml'))
+    targets.add_argument('--candidate', help="replay against this too and report the changes")
+    targets.add_argument('--live', action='store_true', help="use the configs' real providers instead of stubs")
+    targets.add_argument('--server', choices=('asgi', 'flask'), default='asgi')
+    targets.add_argument('--workers', type=int, default=1, help="uvicorn worker processes")
+    targets.add_argument('--log-level', default='WARNING', help="router LOG_LEVEL")
+    targets.add_argument('--no-tracing', action='store_true', help="don't trace requests (no overhead figures)")
+    targets.add_argument('--workdir', help="keep stub and router logs here instead of a temporary directory")
+
+    stubs = parser.add_argument_group('stub providers (applied to every provider unless overridden)')
+    stubs.add_argument('--latency', default='lognormal:0.1:0.3')
+    stubs.add_argument('--per-token', type=float, default=0.0)
+    stubs.add_argument('--error-rate', type=float, default=0.0)
+    stubs.add_argument('--rate-limit-rate', type=float, default=0.0)
+    stubs.add_argument('--rpm', type=int)
+    stubs.add_argument('--retry-after', type=float, default=1.0)
+    stubs.add_argument('--seed', type=int, default=1)
+    stubs.add_argument('--stub', action='append', default=[], metavar='PROVIDER.KEY=VALUE',
+                       help="per-provider override, e.g. groq.error_rate=0.1 or llama.latency=fixed:0.5")
+
+    output = parser.add_argument_group('output')
+    output.add_argument('--json', help="write the workload, both runs and the comparison to this file")
+    args = parser.parse_args()
+
+    workload = build_workload(read_usage(args.log), max_gap=args.max_gap, limit=args.limit)
+    if not workload:
+        parser.error(f"No replayable usage records in {args.log}")
+    described = describe_workload(workload)
+    replay_span = described['spanS'] / args.speed if args.speed else None
+    print(f"Replaying {described['requests']} requests ({described['distinctPrompts']} distinct) spanning "
+          f"{described['spanS']}s, " + (f"{replay_span:.1f}s at {args.speed:g}x" if replay_span is not None
+                                        else "as fast as possible"))
+
+    # Stubs answer with the recorded completion length, capped only by the request
+    profile = {
+        "latency": args.latency, "per_token": args.per_token, "completion_tokens": 1 << 20,
+        "error_rate": args.error_rate, "rate_limit_rate": args.rate_limit_rate, "rpm": args.rpm,
+        "retry_after": args.retry_after, "seed": args.seed
+    }
+    runs = {"baseline": run_target(args.baseline, 'baseline', workload, profile, args)}
+    print_results('baseline', runs['baseline']['results'])
+    if args.candidate:
+        runs['candidate'] = run_target(args.candidate, 'candidate', workload, profile, args)
+        print_results('candidate', runs['candidate']['results'])
+
+    report = {
+        "environment": environment(),
+        "scenario": {
+            "log": args.log, "speed": args.speed or 'max', "maxGap": args.max_gap, "limit": args.limit,
+            "concurrency": args.concurrency if args.speed is None else None, "temperature": args.temperature,
+            "live": args.live, "server": args.server, "workers": args.workers, "stubs": None if args.live else {
+                key: value for key, value in profile.items() if key != 'completion_tokens'
+            }, "stubOverrides": args.stub
+        },
+        "workload": described,
+        "runs": runs
+    }
+    if args.candidate:
+        rows = compare(runs['baseline']['results'], runs['candidate']['results'], COMPARED)
+        report['comparison'] = rows
+        print()
+        print_comparison(rows)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Startup Benchmark
+
+Measures what a cold worker pays per provider before it can serve: importing
+the provider module, constructing the provider, and loading its tokenizer.
+Every run happens in a fresh interpreter so already-imported modules don't
+hide import cost.
+
+Usage:
+    python benchmarks/startup.py [--config config/providers.yaml] [--runs 5] [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from services.provider_manager import load_config_file
+
+PHASES = ('base_import', 'provider_import', 'construct', 'tokenizer_load')
+
+# Runs in the child interpreter: times each phase and prints them as JSON
+CHILD = '''
+import json, sys, time
+config = json.loads(sys.argv[1])
+timings = {}
+
+started = time.perf_counter()
+import services.provider_manager
+from services.providers import get_provider_class
+from services.token_counter import load_tokenizer
+timings["base_import"] = time.perf_counter() - started
+
+try:
+    started = time.perf_counter()
+    provider_class = get_provider_class(config["type"])
+    timings["provider_import"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    provider = provider_class(config)
+    timings["construct"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    loaded = load_tokenizer(provider.tokenizer_spec) is not None
+    timings["tokenizer_load"] = time.perf_counter() - started
+    timings["tokenizer"] = provider.tokenizer_spec
+    timings["tokenizerLoaded"] = loaded
+except Exception as e:
+    timings["error"] = str(e)
+
+print(json.dumps(timings))
+'''
+
+
+def run_once(provider_config: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, json.dumps(provider_config)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_provider(provider_config: dict, runs: int) -> dict:
+    samples = [run_once(provider_config) for _ in range(runs)]
+    result = {"name": provider_config.get('name'), "type": provider_config.get('type'), "runs": runs}
+
+    errors = [sample['error'] for sample in samples if 'error' in sample]
+    if errors:
+        result['error'] = errors[0]
+
+    for phase in PHASES:
+        values = [sample[phase] for sample in samples if phase in sample]
+        if values:
+            result[phase] = {
+                "medianMs": round(statistics.median(values) * 1000, 2),
+                "maxMs": round(max(values) * 1000, 2)
+            }
+    for key in ('tokenizer', 'tokenizerLoaded'):
+        if key in samples[-1]:
+            result[key] = samples[-1][key]
+    return result
+
+
+def print_table(results: list):
+    print(f"{'provider':<20}" + ''.join(f"{phase:>18}" for phase in PHASES) + "  tokenizer")
+    for result in results:
+        cells = ''.join(
+            f"{result[phase]['medianMs']:>15.1f} ms" if phase in result else f"{'-':>18}"
+            for phase in PHASES
+        )
+        note = result.get('error') or f"{result.get('tokenizer')} ({'loaded' if result.get('tokenizerLoaded') else 'estimate'})"
+        print(f"{result['name']:<20}{cells}  {note}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-provider import and initialisation cost")
+    parser.add_argument('--config', default=os.path.join(ROOT, 'config', 'providers.yaml'))
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per provider")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    config = load_config_file(args.config)
+
+    providers = [p for p in config.get('providers', []) if p.get('enabled', True)]
+    results = [benchmark_provider(provider, args.runs) for provider in providers]
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump({"python": sys.version.split()[0], "providers": results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Stub Provider Servers
+
+Local HTTP servers that answer in the Ollama /api/generate, Groq (OpenAI)
+chat-completions and Hugging Face inference wire formats, streaming
+included, so the router can be load-tested without real providers. Each stub
+has a latency distribution, a per-token generation delay, an error rate and
+429 behaviour (a share of requests, or an RPM limit), and counts what it
+answered at GET /stats.
+
+Usage:
+    python benchmarks/stub_servers.py --kind ollama --latency lognormal:0.2:0.5 --error-rate 0.01
+    python benchmarks/stub_servers.py --kind groq --port 8002 --rpm 600 --retry-after 1
+
+Run by load_test.py, several stubs share one process and the listening URLs
+are printed as a JSON line once every stub is up.
+"""
+import argparse
+import http.server
+import json
+import math
+import random
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+KINDS = ('ollama', 'groq', 'huggingface')
+
+# Wire-format paths; any other POST path is answered in the stub's own format
+PATHS = {
+    'ollama': '/api/generate',
+    'groq': '/openai/v1/chat/completions',
+    'huggingface': '/models/stub'
+}
+
+WORDS = ('alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet')
+
+
+def parse_latency(spec: str):
+    """
+    Sampler for a latency spec, in seconds:
+    fixed:S, uniform:LO:HI, exponential:MEAN or lognormal:MEDIAN:SIGMA.
+    """
+    kind, _, rest = spec.partition(':')
+    args = [float(value) for value in rest.split(':') if value]
+    if kind == 'fixed' and len(args) == 1:
+        return lambda rng: args[0]
+    if kind == 'uniform' and len(args) == 2:
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == 'exponential' and len(args) == 1:
+        return lambda rng: rng.expovariate(1.0 / args[0]) if args[0] > 0 else 0.0
+    if kind == 'lognormal' and len(args) == 2:
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1]) if args[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec '{spec}'; expected fixed:S, uniform:LO:HI, "
+                     f"exponential:MEAN or lognormal:MEDIAN:SIGMA")
+
+
+class StubProfile:
+    """How a stub behaves: when and how it answers."""
+
+    def __init__(
+        self,
+        latency: str = 'fixed:0.05',
+        per_token: float = 0.0,
+        completion_tokens: int = 32,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        rpm: Optional[int] = None,
+        retry_after: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            latency: Time before the first byte, as a parse_latency() spec
+            per_token: Extra seconds per completion token (between chunks when streaming)
+            completion_tokens: Tokens generated, capped by the request's max tokens
+            error_rate: Share of requests answered 500
+            rate_limit_rate: Share of requests answered 429
+            rpm: Requests per minute before answering 429, like a real provider's quota
+            retry_after: Retry-After seconds sent with 429s
+            seed: Random seed, for repeatable runs
+        """
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.per_token = per_token
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.seed = seed
+
+    @classmethod
+    def from_dict(cls, spec: Dict) -> 'StubProfile':
+        known = ('latency', 'per_token', 'completion_tokens', 'error_rate', 'rate_limit_rate', 'rpm',
+                 'retry_after', 'seed')
+        return cls(**{key: spec[key] for key in known if key in spec})
+
+    def to_dict(self) -> Dict:
+        return {
+            "latency": self.latency, "perToken": self.per_token, "completionTokens": self.completion_tokens,
+            "errorRate": self.error_rate, "rateLimitRate": self.rate_limit_rate, "rpm": self.rpm,
+            "retryAfter": self.retry_after
+        }
+
+
+class _StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        stub = self.server
+        status, delay = stub.decide()
+        time.sleep(delay)
+        if status == 429:
+            stub.count(429)
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "tokens"}},
+                            {'Retry-After': f"{stub.profile.retry_after:g}"})
+            return
+        if status != 200:
+            stub.count(status)
+            self._send_json(status, {"error": "stub failure"})
+            return
+
+        kind = stub.kind_for(self.path)
+        prompt, max_tokens, stream = _parse_request(kind, request)
+        words = stub.completion(max_tokens)
+        stub.count(200)
+        if stream and kind in ('ollama', 'groq'):
+            self._stream(kind, prompt, words)
+        else:
+            time.sleep(stub.profile.per_token * len(words))
+            self._send_json(200, _response(kind, prompt, words))
+
+    def _stream(self, kind: str, prompt: str, words: List[str]):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if kind == 'ollama' else 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.server.profile.per_token)
+            text = word if index == 0 else ' ' + word
+            if kind == 'ollama':
+                self._chunk(json.dumps({"response": text, "done": False}) + '\n')
+            else:
+                self._chunk('data: ' + json.dumps({"choices": [{"delta": {"content": text}}]}) + '\n\n')
+
+        prompt_tokens = len(prompt.split())
+        if kind == 'ollama':
+            self._chunk(json.dumps({"response": "", "done": True, "prompt_eval_count": prompt_tokens,
+                                    "eval_count": len(words)}) + '\n')
+        else:
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                     "total_tokens": prompt_tokens + len(words)}
+            self._chunk('data: ' + json.dumps({"choices": [], "usage": usage}) + '\n\n')
+            self._chunk('data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _chunk(self, text: str):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status: int, body, headers: Optional[Dict] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def _parse_request(kind: str, request: Dict):
+    """(prompt, max tokens, streaming) from a request in the given wire format."""
+    if kind == 'ollama':
+        return request.get('prompt', ''), request.get('options', {}).get('num_predict'), request.get('stream', False)
+    if kind == 'groq':
+        messages = request.get('messages') or [{}]
+        return messages[-1].get('content', ''), request.get('max_tokens'), request.get('stream', False)
+    return request.get('inputs', ''), request.get('parameters', {}).get('max_new_tokens'), False
+
+
+def _response(kind: str, prompt: str, words: List[str]):
+    text = ' '.join(words)
+    prompt_tokens = len(prompt.split())
+    if kind == 'ollama':
+        return {"response": text, "done": True, "prompt_eval_count": prompt_tokens, "eval_count": len(words)}
+    if kind == 'groq':
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                      "total_tokens": prompt_tokens + len(words)}
+        }
+    return [{"generated_text": text}]
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """One stub provider listening on its own port."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, kind: str, profile: Optional[StubProfile] = None, host: str = '127.0.0.1', port: int = 0):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown stub kind '{kind}'; expected one of {', '.join(KINDS)}")
+        super().__init__((host, port), _StubHandler)
+        self.kind = kind
+        self.profile = profile or StubProfile()
+        self._random = random.Random(self.profile.seed)
+        self._counts: Dict[int, int] = {}
+        self._minute: List[float] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def endpoint(self) -> str:
+        """URL to put in the provider's `endpoint` setting."""
+        return self.url + PATHS[self.kind]
+
+    def kind_for(self, path: str) -> str:
+        for kind, kind_path in PATHS.items():
+            if path == kind_path or (kind == 'huggingface' and path.startswith('/models/')):
+                return kind
+        return self.kind
+
+    def decide(self):
+        """(status to answer with, seconds to wait first) for the next request."""
+        with self._lock:
+            now = time.monotonic()
+            if self.profile.rpm:
+                self._minute = [at for at in self._minute if now - at < 60.0]
+                if len(self._minute) >= self.profile.rpm:
+                    return 429, 0.0
+                self._minute.append(now)
+            roll = self._random.random()
+            delay = max(0.0, self.profile.sample_latency(self._random))
+        if roll < self.profile.rate_limit_rate:
+            return 429, 0.0
+        if roll < self.profile.rate_limit_rate + self.profile.error_rate:
+            return 500, delay
+        return 200, delay
+
+    def completion(self, max_tokens: Optional[int]) -> List[str]:
+        count = self.profile.completion_tokens
+        if max_tokens:
+            count = min(count, int(max_tokens))
+        return [WORDS[index % len(WORDS)] for index in range(max(1, count))]
+
+    def count(self, status: int):
+        with self._lock:
+            self._counts[status] = self._counts.get(status, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "kind": self.kind,
+            "requests": sum(counts.values()),
+            "statuses": {str(status): n for status, n in sorted(counts.items())},
+            "profile": self.profile.to_dict()
+        }
+
+    def start(self) -> 'StubServer':
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, name=f"stub-{self.kind}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def serve(specs: List[Dict]) -> List[StubServer]:
+    """Start one stub per spec ({"kind", "port"?, profile fields...})."""
+    return [
+        StubServer(spec['kind'], StubProfile.from_dict(spec), port=spec.get('port', 0)).start()
+        for spec in specs
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub LLM provider APIs for load testing")
+    parser.add_argument('--kind', choices=KINDS, default='ollama')
+    parser.add_argument('--port', type=int, default=0, help="0 picks a free port")
+    parser.add_argument('--latency', default='fixed:0.05', help="fixed:S, uniform:LO:HI, exponential:MEAN "
+                                                                "or lognormal:MEDIAN:SIGMA")
+    parser.add_argument('--per-token', type=float, default=0.0, help="seconds per completion token")
+    parser.add_argument('--completion-tokens', type=int, default=32)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of requests answered 429")
+    parser.add_argument('--rpm', type=int, help="answer 429 above this many requests per minute")
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--specs', help="JSON list of stub specs to serve instead of a single stub")
+    args = parser.parse_args()
+
+    if args.specs:
+        specs = json.loads(args.specs)
+    else:
+        specs = [{
+            "kind": args.kind, "port": args.port, "latency": args.latency, "per_token": args.per_token,
+            "completion_tokens": args.completion_tokens, "error_rate": args.error_rate,
+            "rate_limit_rate": args.rate_limit_rate, "rpm": args.rpm, "retry_after": args.retry_after,
+            "seed": args.seed
+        }]
+
+    servers = serve(specs)
+    print(json.dumps([{"kind": server.kind, "url": server.url, "endpoint": server.endpoint} for server in servers]))
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+"""
+Admission Control
+
+Caps how many requests a worker process serves at once and queues the rest
+by priority class. A request whose expected queue wait would break its
+class's max_wait is rejected straight away with a retry hint, rather than
+piling up until every request is slow; one that is queued but not served
+in time is rejected the same way.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from services import metrics
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_CLASSES = {
+    'interactive': {'priority': 0, 'max_wait': 2.0},
+    'bulk': {'priority': 1, 'max_wait': 30.0}
+}
+
+
+class AdmissionRejectedError(Exception):
+    """Raised when a request can't be served within its class's queue-wait limit."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Value for the Retry-After header: whole seconds, at least one."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class _Waiter:
+    def __init__(self, priority: int, class_name: str, notify: Callable[[], None]):
+        self.priority = priority
+        self.class_name = class_name
+        self.notify = notify
+        self.granted = False
+        self.abandoned = False
+
+
+class Slot:
+    """One admitted request; release() hands its place to the next in the queue."""
+
+    def __init__(self, controller: 'AdmissionController', class_name: str, waited: float):
+        self.controller = controller
+        self.class_name = class_name
+        self.waited = waited
+        self.started = time.monotonic()
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        """Free the slot; safe to call more than once."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(time.monotonic() - self.started)
+
+    def __enter__(self) -> 'Slot':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """Bounded, priority-ordered admission in front of the provider manager."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_queue: int = 64,
+        classes: Optional[Dict[str, Dict]] = None,
+        default_class: str = 'interactive',
+        batch_class: str = 'bulk',
+        ewma_alpha: float = 0.2
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrency: Requests served at once
+            max_queue: Requests waiting at once, across classes
+            classes: Priority classes by name, each with 'priority' (lower is
+                served first) and 'max_wait' (seconds a request may queue)
+            default_class: Class of requests that don't name one
+            batch_class: Class of batch requests that don't name one
+            ewma_alpha: Weight of the newest sample in the service and wait averages
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.classes = {name: dict(spec) for name, spec in (classes or DEFAULT_CLASSES).items()}
+        for name in (default_class, batch_class):
+            if name not in self.classes:
+                raise ValueError(f"Admission class '{name}' is not defined")
+        self.default_class = default_class
+        self.batch_class = batch_class
+        self.ewma_alpha = ewma_alpha
+
+        self._active = 0
+        self._queue: List = []  # heap of (priority, arrival, waiter)
+        self._arrivals = itertools.count()
+        self._service_time: Optional[float] = None
+        self._stats = {name: {"admitted": 0, "rejected": 0, "avgWait": 0.0} for name in self.classes}
+        self._lock = threading.Lock()
+
+    def _class(self, class_name: Optional[str]) -> str:
+        class_name = class_name or self.default_class
+        if class_name not in self.classes:
+            raise ValueError(f"Unknown priority class '{class_name}'; expected one of {sorted(self.classes)}")
+        return class_name
+
+    def _estimate_wait(self, priority: int) -> float:
+        """
+        Expected queue wait for a new request: everyone already queued at the
+        same or a higher priority goes first, and slots free up at
+        max_concurrency / service time per second.
+        """
+        if self._service_time is None:
+            return 0.0
+        ahead = sum(1 for _, _, waiter in self._queue if not waiter.abandoned and waiter.priority <= priority)
+        return (ahead + 1) * self._service_time / self.max_concurrency
+
+    def _reject(self, class_name: str, reason: str, retry_after: float) -> AdmissionRejectedError:
+        self._stats[class_name]['rejected'] += 1
+        metrics.ADMISSION_REJECTED.inc(class_name)
+        logger.info(f"Rejected {class_name} request: {reason}")
+        return AdmissionRejectedError(f"Server busy: {reason}", retry_after)
+
+    def _try_enter(self, class_name: str, notify: Callable[[], None]):
+        """Admit now (returns a Slot), queue (returns the waiter) or reject (raises)."""
+        spec = self.classes[class_name]
+        with self._lock:
+            if self._active < self.max_concurrency and not self._queued():
+                self._active += 1
+                self._record_wait(class_name, 0.0)
+                return Slot(self, class_name, 0.0)
+
+            estimated = self._estimate_wait(spec['priority'])
+            if self._queued() >= self.max_queue:
+                raise self._reject(class_name, "queue is full", estimated)
+            if estimated > spec['max_wait']:
+                raise self._reject(class_name, f"expected queue wait {estimated:.2f}s exceeds "
+                                               f"{spec['max_wait']:g}s for {class_name} requests", estimated)
+
+            waiter = _Waiter(spec['priority'], class_name, notify)
+            heapq.heappush(self._queue, (spec['priority'], next(self._arrivals), waiter))
+            return waiter
+
+    def _settle(self, waiter: _Waiter, queued_at: float) -> Slot:
+        """After waiting: take the granted slot, or leave the queue and reject."""
+        waited = time.monotonic() - queued_at
+        with self._lock:
+            if waiter.granted:
+                self._record_wait(waiter.class_name, waited)
+                return Slot(self, waiter.class_name, waited)
+            waiter.abandoned = True
+            raise self._reject(waiter.class_name, f"not admitted within {waited:.2f}s",
+                               self._estimate_wait(waiter.priority))
+
+    def enter(self, class_name: Optional[str] = None) -> Slot:
+        """
+        Wait for a slot; use the result as a context manager or call release().
+
+        Raises:
+            AdmissionRejectedError: If the request would wait longer than its class allows
+            ValueError: If class_name is not a configured class
+        """
+        class_name = self._class(class_name)
+        granted = threading.Event()
+        entry = self._try_enter(class_name, granted.set)
+        if isinstance(entry, Slot):
+            return entry
+
+        queued_at = time.monotonic()
+        granted.wait(self.classes[class_name]['max_wait'])
+        return self._settle(entry, queued_at)
+
+    async def aenter(self, class_name: Optional[str] = None) -> Slot:
+        """Async counterpart of enter()."""
+        class_name = self._class(class_name)
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        entry = self._try_enter(class_name, lambda: loop.call_soon_threadsafe(granted.set))
+        if isinstance(entry, Slot):
+            return entry
+
+        queued_at = time.monotonic()
+        try:
+            await asyncio.wait_for(granted.wait(), self.classes[class_name]['max_wait'])
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled while queued: leave the queue, or pass on a slot granted meanwhile
+            with self._lock:
+                entry.abandoned = True
+                granted_slot = entry.granted
+            if granted_slot:
+                self._release(None)
+            raise
+        return self._settle(entry, queued_at)
+
+    def _queued(self) -> int:
+        return sum(1 for _, _, waiter in self._queue if not waiter.abandoned)
+
+    def _record_wait(self, class_name: str, waited: float):
+        stats = self._stats[class_name]
+        stats['admitted'] += 1
+        stats['avgWait'] += self.ewma_alpha * (waited - stats['avgWait'])
+        metrics.ADMISSION_WAIT.observe(waited, class_name)
+
+    def _release(self, service_time: Optional[float]):
+        """Hand the freed slot to the highest-priority waiter, or free it."""
+        with self._lock:
+            if service_time is not None:
+                if self._service_time is None:
+                    self._service_time = service_time
+                else:
+                    self._service_time += self.ewma_alpha * (service_time - self._service_time)
+
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                waiter.notify()
+                return
+            self._active -= 1
+
+    def queue_depths(self) -> Dict:
+        """Requests waiting per class, keyed for a metrics gauge."""
+        with self._lock:
+            depths = {(name,): 0 for name in self.classes}
+            for _, _, waiter in self._queue:
+                if not waiter.abandoned:
+                    depths[(waiter.class_name,)] += 1
+            return depths
+
+    def status(self) -> Dict:
+        """Concurrency, queue depth and wait averages for status reporting."""
+        with self._lock:
+            queued = {name: 0 for name in self.classes}
+            for _, _, waiter in self._queue:
+                if not waiter.abandoned:
+                    queued[waiter.class_name] += 1
+            return {
+                "active": self._active,
+                "maxConcurrency": self.max_concurrency,
+                "queued": queued,
+                "maxQueue": self.max_queue,
+                "avgServiceTime": round(self._service_time, 3) if self._service_time is not None else None,
+                "classes": {
+                    name: dict(stats, avgWait=round(stats['avgWait'], 3)) for name, stats in self._stats.items()
+                }
+            }
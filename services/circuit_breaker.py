@@ -0,0 +1,155 @@
+"""
+Per-Provider Circuit Breaker
+
+Stops routing to a provider whose recent calls mostly fail, so requests fall
+back immediately instead of paying its timeouts and retries. After a cooldown
+a single trial request is let through; its outcome closes or re-opens the
+circuit.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+    pass
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of call outcomes."""
+
+    def __init__(
+        self,
+        name: str = 'provider',
+        window: float = 60.0,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        cooldown: float = 30.0
+    ):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Provider name, used in log messages
+            window: Seconds of call outcomes considered
+            min_calls: Calls needed in the window before the circuit can open
+            failure_rate: Fraction of failed calls (errors and timeouts) that opens it
+            cooldown: Seconds an open circuit waits before a trial request
+        """
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+
+        self._outcomes = deque()  # (timestamp, succeeded)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.time())
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.cooldown:
+            return HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call may go to the provider now. In half-open state only
+        one trial is admitted; a trial that never reports back is replaced
+        after another cooldown.
+        """
+        now = time.time()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == OPEN:
+                return False
+
+            if self._probe_started is not None and now - self._probe_started < self.cooldown:
+                return False
+            self._state = HALF_OPEN
+            self._probe_started = now
+            logger.info(f"Circuit for {self.name} half-open; sending a trial request")
+            return True
+
+    def record_success(self):
+        now = time.time()
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed after a successful trial")
+                self._state = CLOSED
+                self._probe_started = None
+                self._outcomes.clear()
+            self._record(now, True)
+
+    def record_failure(self):
+        now = time.time()
+        with self._lock:
+            if self._state != CLOSED:
+                # Failed trial (or a straggler from before opening): wait another cooldown
+                self._open(now)
+                return
+
+            self._record(now, False)
+            failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    def release(self):
+        """
+        Forget an admitted call that says nothing about the provider, like one
+        cut short by the caller's deadline, so a half-open breaker can send
+        another trial straight away.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_started = None
+
+    def _record(self, now: float, succeeded: bool):
+        self._outcomes.append((now, succeeded))
+        self._prune(now)
+
+    def _prune(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now: float):
+        if self._state == CLOSED:
+            logger.warning(f"Circuit for {self.name} opened; skipping it for {self.cooldown}s")
+        self._state = OPEN
+        self._opened_at = now
+        self._probe_started = None
+
+    def status(self) -> Dict:
+        """State and window counters for status reporting."""
+        now = time.time()
+        with self._lock:
+            state = self._current_state(now)
+            self._prune(now)
+            failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+            retry_in: Optional[float] = None
+            if state == OPEN:
+                retry_in = round(self.cooldown - (now - self._opened_at), 1)
+            return {
+                "state": state,
+                "calls": len(self._outcomes),
+                "failures": failures,
+                "retryIn": retry_in
+            }
@@ -0,0 +1,197 @@
+"""
+Request Deadlines
+
+A request carries one end-to-end deadline in a context variable. The manager
+hands each provider attempt a share of what is left, and providers cap their
+HTTP timeouts and backoff sleeps with remaining(), so a request never
+outlives its budget however many providers and retries it goes through.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+# (request deadline, monotonic time the innermost scope expires)
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceededError(Exception):
+    """Raised when a request's time budget runs out."""
+    pass
+
+
+class Deadline:
+    """One request's time budget and how its provider attempts spent it."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.started = time.monotonic()
+        self.expires_at = self.started + seconds
+        self.attempts: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def allot(self, providers_left: int, share: float) -> float:
+        """
+        Seconds the next provider attempt may use: a share of what is left,
+        holding the rest back for fallbacks, or everything for the last one.
+        """
+        remaining = self.remaining()
+        return remaining if providers_left <= 1 else remaining * share
+
+    def context(self, seconds: Optional[float] = None) -> contextvars.Context:
+        """
+        A copy of the current context running under this deadline, narrowed
+        to seconds from now if given. For work that can't be wrapped in
+        scope(), like a generator resumed across yields.
+        """
+        expires_at = self.expires_at
+        if seconds is not None:
+            expires_at = min(expires_at, time.monotonic() + seconds)
+        context = contextvars.copy_context()
+        context.run(_current.set, (self, expires_at))
+        return context
+
+    def record(self, provider_name: str, allotted: float, started: float, outcome: str):
+        """Add a provider attempt to the ledger; started is a time.monotonic() value."""
+        entry = {
+            "provider": provider_name,
+            "allotted": round(allotted, 3),
+            "spent": round(time.monotonic() - started, 3),
+            "outcome": outcome
+        }
+        with self._lock:
+            self.attempts.append(entry)
+
+    def report(self) -> Dict:
+        """Budget summary attached to responses."""
+        with self._lock:
+            attempts = [dict(attempt) for attempt in self.attempts]
+        return {
+            "deadline": self.seconds,
+            "spent": round(time.monotonic() - self.started, 3),
+            "providers": attempts
+        }
+
+
+def current() -> Optional[Deadline]:
+    """The deadline of the request being served, if any."""
+    state = _current.get()
+    return state[0] if state else None
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the innermost scope, or None without a deadline."""
+    state = _current.get()
+    if state is None:
+        return None
+    return max(0.0, state[1] - time.monotonic())
+
+
+def cap(timeout: float) -> float:
+    """
+    Limit a timeout to the time left.
+
+    Raises:
+        DeadlineExceededError: If no time is left
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceededError("Deadline exceeded")
+    return min(timeout, left)
+
+
+def sleep(seconds: float) -> bool:
+    """
+    Back off for seconds unless that would use up the time left.
+
+    Returns:
+        True after sleeping; False, without sleeping, if a retry after the
+        sleep could not finish in time anyway
+    """
+    left = remaining()
+    if left is not None and seconds >= left:
+        return False
+    time.sleep(seconds)
+    return True
+
+
+async def asleep(seconds: float) -> bool:
+    """Async counterpart of sleep()."""
+    left = remaining()
+    if left is not None and seconds >= left:
+        return False
+    await asyncio.sleep(seconds)
+    return True
+
+
+@contextmanager
+def scope(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """Run the enclosed request under a new deadline; None runs it without one."""
+    if seconds is None:
+        yield None
+        return
+    deadline = Deadline(seconds)
+    token = _current.set((deadline, deadline.expires_at))
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+class Attempt:
+    """
+    How one provider attempt ended: success, deadline (the allotment ran
+    out, so the caller's budget rather than the provider cut it short),
+    error or cancelled. None while running or without a deadline.
+    """
+
+    def __init__(self):
+        self.outcome: Optional[str] = None
+
+    @property
+    def out_of_time(self) -> bool:
+        return self.outcome == 'deadline'
+
+
+@contextmanager
+def attempt(provider_name: str, seconds: float) -> Iterator[Attempt]:
+    """
+    Narrow the deadline to one provider attempt's allotment and record how
+    much of it the attempt used.
+    """
+    state = _current.get()
+    result = Attempt()
+    if state is None:
+        yield result
+        return
+
+    deadline, expires_at = state
+    started = time.monotonic()
+    attempt_expires_at = min(expires_at, started + seconds)
+    token = _current.set((deadline, attempt_expires_at))
+    # Anything that escapes as a BaseException, like a cancelled hedge, was abandoned
+    outcome = 'cancelled'
+    try:
+        yield result
+        outcome = 'success'
+    except DeadlineExceededError:
+        outcome = 'deadline'
+        raise
+    except Exception:
+        # A provider timeout caused by the allotment running out counts as the deadline
+        outcome = 'deadline' if time.monotonic() >= attempt_expires_at else 'error'
+        raise
+    finally:
+        _current.reset(token)
+        result.outcome = outcome
+        deadline.record(provider_name, seconds, started, outcome)
@@ -0,0 +1,194 @@
+"""
+Pooled HTTP Client
+
+Each provider owns one HttpPool so connections (and TLS sessions) are kept
+alive across calls and retries instead of being re-established every time.
+"""
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import httpx
+
+from services import tracing
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpPool:
+    """Keep-alive connection pool configured from a provider's `pool` settings."""
+
+    def __init__(self, settings: Optional[Dict] = None, name: str = 'provider'):
+        """
+        Create the pool.
+
+        Args:
+            settings: Provider `pool` block with max_connections,
+                max_keepalive_connections, keepalive_expiry and http2
+            name: Provider name, used in log messages
+        """
+        settings = settings or {}
+        self.name = name
+        self.max_connections = settings.get('max_connections', 10)
+        self.max_keepalive_connections = settings.get('max_keepalive_connections', self.max_connections)
+        self.keepalive_expiry = settings.get('keepalive_expiry', 30.0)
+        self.http2 = bool(settings.get('http2', False))
+
+        if self.http2 and not _http2_available():
+            logger.warning(f"HTTP/2 requested for {name} but the 'h2' package is not installed; using HTTP/1.1")
+            self.http2 = False
+
+        self.limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        self.client = httpx.Client(limits=self.limits, http2=self.http2)
+
+        # An async client binds its connections to an event loop, so each
+        # loop gets its own, created on first use from inside that loop
+        self._aclients = {}
+
+        self._lock = threading.Lock()
+        self._active = 0
+        self._closing = False
+
+    def post(self, url: str, **kwargs: Any) -> Tuple[httpx.Response, bool]:
+        """
+        Send a POST request through the pool.
+
+        Returns:
+            Tuple of (response, whether an existing connection was reused)
+        """
+        reused = [True]
+        phases = tracing.HttpPhases(self.name)
+
+        def trace(event_name: str, info: Dict):
+            if event_name.startswith('connection.connect_tcp'):
+                reused[0] = False
+            phases(event_name, info)
+
+        with self._lock:
+            self._active += 1
+            retired = self.client.is_closed
+        try:
+            if retired:
+                # A retry from a request that started before this provider was
+                # retired; finish it on a one-off connection
+                reused[0] = False
+                with httpx.Client(http2=self.http2) as client:
+                    response = client.post(url, **kwargs)
+            else:
+                response = self.client.post(url, extensions={'trace': trace}, **kwargs)
+        finally:
+            self._release()
+
+        return response, reused[0]
+
+    @contextmanager
+    def stream(self, url: str, **kwargs: Any) -> Iterator[Tuple[httpx.Response, bool]]:
+        """
+        POST and read the response body incrementally.
+
+        Yields:
+            Tuple of (open response, whether an existing connection was reused);
+            the connection goes back to the pool when the block exits
+        """
+        reused = [True]
+        phases = tracing.HttpPhases(self.name)
+
+        def trace(event_name: str, info: Dict):
+            if event_name.startswith('connection.connect_tcp'):
+                reused[0] = False
+            phases(event_name, info)
+
+        with self._lock:
+            self._active += 1
+            retired = self.client.is_closed
+        try:
+            if retired:
+                with httpx.Client(http2=self.http2) as client:
+                    with client.stream('POST', url, **kwargs) as response:
+                        yield response, False
+            else:
+                with self.client.stream('POST', url, extensions={'trace': trace}, **kwargs) as response:
+                    yield response, reused[0]
+        finally:
+            self._release()
+
+    async def apost(self, url: str, **kwargs: Any) -> Tuple[httpx.Response, bool]:
+        """Async counterpart of post()."""
+        reused = [True]
+        phases = tracing.HttpPhases(self.name)
+
+        async def trace(event_name: str, info: Dict):
+            if event_name.startswith('connection.connect_tcp'):
+                reused[0] = False
+            phases(event_name, info)
+
+        with self._lock:
+            self._active += 1
+            retired = self._closing
+            aclient = None if retired else self._loop_client(asyncio.get_running_loop())
+        try:
+            if retired:
+                reused[0] = False
+                async with httpx.AsyncClient(http2=self.http2) as client:
+                    response = await client.post(url, **kwargs)
+            else:
+                response = await aclient.post(url, extensions={'trace': trace}, **kwargs)
+        finally:
+            self._release()
+
+        return response, reused[0]
+
+    @property
+    def aclient(self) -> Optional[httpx.AsyncClient]:
+        """The running event loop's async client, or None if it hasn't made one yet."""
+        with self._lock:
+            return self._aclients.get(asyncio.get_running_loop())
+
+    def _loop_client(self, loop: asyncio.AbstractEventLoop) -> httpx.AsyncClient:
+        """The async client for loop, creating it on first use. Call with the lock held."""
+        client = self._aclients.get(loop)
+        if client is None:
+            # Clients of loops that have since closed can't be used or closed; let them go
+            for closed in [other for other in self._aclients if other.is_closed()]:
+                del self._aclients[closed]
+            client = self._aclients[loop] = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+        return client
+
+    def _release(self):
+        with self._lock:
+            self._active -= 1
+            close_now = self._closing and self._active == 0
+        if close_now:
+            self._close_clients()
+
+    def close(self):
+        """Close the pool once requests already in flight have finished."""
+        with self._lock:
+            self._closing = True
+            close_now = self._active == 0
+        if close_now:
+            self._close_clients()
+            logger.info(f"Closed connection pool for {self.name}")
+
+    def _close_clients(self):
+        self.client.close()
+
+        with self._lock:
+            aclients, self._aclients = self._aclients, {}
+        for loop, aclient in aclients.items():
+            if not aclient.is_closed and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(aclient.aclose(), loop)
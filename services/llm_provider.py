@@ -1,14 +1,94 @@
 """
 Base LLM Provider Class - All specific providers will inherit from this
 """
+import asyncio
 import os
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Any, AsyncIterator, Callable, Generator, Iterator, Optional
 
+from services import deadline, tracing
+from services.deadline import DeadlineExceededError
+from services.retry_policy import RetryPolicy
+from services.token_counter import APPROXIMATE, get_token_counter
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+class _SlotWaiter:
+    def __init__(self, notify: Callable[[], None]):
+        self.notify = notify
+        self.granted = False
+        self.abandoned = False
+
+class _SlotPool:
+    """
+    A provider's max_concurrency slots, shared by sync and async callers.
+    A released slot is handed straight to the longest waiter, so neither
+    kind of caller polls and waiters are served in arrival order.
+    """
+    
+    def __init__(self, size: int):
+        self._free = size
+        self._waiters = deque()
+        self._lock = threading.Lock()
+    
+    def _try_acquire(self, notify: Callable[[], None]) -> Optional[_SlotWaiter]:
+        """Take a free slot (returns None) or join the queue (returns the waiter)."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return None
+            waiter = _SlotWaiter(notify)
+            self._waiters.append(waiter)
+            return waiter
+    
+    def _settle(self, waiter: _SlotWaiter) -> bool:
+        """After waiting: True if the slot was granted, otherwise leave the queue."""
+        with self._lock:
+            if not waiter.granted:
+                waiter.abandoned = True
+            return waiter.granted
+    
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        granted = threading.Event()
+        waiter = self._try_acquire(granted.set)
+        if waiter is None:
+            return True
+        granted.wait(timeout)
+        return self._settle(waiter)
+    
+    async def aacquire(self, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        waiter = self._try_acquire(lambda: loop.call_soon_threadsafe(granted.set))
+        if waiter is None:
+            return True
+        try:
+            await asyncio.wait_for(granted.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled while queued: leave the queue, or pass on a slot granted meanwhile
+            if self._settle(waiter):
+                self.release()
+            raise
+        return self._settle(waiter)
+    
+    def release(self):
+        """Hand the slot to the longest waiter, or free it."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                waiter.notify()
+                return
+            self._free += 1
+
 class LLMProvider(ABC):
     """Base abstract class for all LLM providers."""
     
@@ -25,6 +105,11 @@ class LLMProvider(ABC):
         self.timeout = config.get('timeout', 10)
         self.retry_count = config.get('retry_count', 1)
         
+        # Optional cap on calls in flight to this provider from this process
+        self.max_concurrency = config.get('max_concurrency')
+        self._slots = _SlotPool(self.max_concurrency) if self.max_concurrency else None
+        self._retry_policy = None
+        
         # Process API keys - replace ${ENV_VAR} with actual environment variables
         self._process_api_keys()
         
@@ -43,6 +128,78 @@ class LLMProvider(ABC):
             if not self.config['api_key']:
                 logger.warning(f"Environment variable {env_var} not set for provider {self.name}")
     
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold one of the provider's max_concurrency slots, waiting for a free one.
+        
+        Args:
+            timeout: Longest wait; defaults to the time left in the current deadline
+            
+        Raises:
+            DeadlineExceededError: If no slot frees up in time
+        """
+        if self._slots is None:
+            yield
+            return
+        if timeout is None:
+            timeout = deadline.remaining()
+        with tracing.span('slot_wait', provider=self.name):
+            acquired = self._slots.acquire(timeout=timeout)
+        if not acquired:
+            raise DeadlineExceededError(f"No free {self.name} slot within {timeout:.2f}s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+    
+    @asynccontextmanager
+    async def aslot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Async counterpart of slot(). Waits on the event loop for a released
+        slot, and a cancelled waiter never ends up holding one.
+        """
+        if self._slots is None:
+            yield
+            return
+        if timeout is None:
+            timeout = deadline.remaining()
+        with tracing.span('slot_wait', provider=self.name):
+            acquired = await self._slots.aacquire(timeout=timeout)
+        if not acquired:
+            raise DeadlineExceededError(f"No free {self.name} slot within {timeout:.2f}s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+    
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        """
+        Retry policy for this provider's requests, built on first use so it
+        picks up a retry_count default set by the subclass. Tuned with the
+        optional `retry` config block.
+        """
+        if self._retry_policy is None:
+            self._retry_policy = RetryPolicy(
+                max_retries=self.retry_count,
+                retry_hint=self.retry_hint,
+                provider=self.name,
+                **self.config.get('retry', {})
+            )
+        return self._retry_policy
+    
+    def retry_hint(self, error: Exception) -> Optional[float]:
+        """
+        Seconds the provider's error response suggests waiting before a retry,
+        for APIs that say so somewhere other than a Retry-After header.
+        """
+        return None
+    
+    def request_timeout(self) -> float:
+        """HTTP timeout for the next attempt, capped by the request deadline."""
+        return deadline.cap(self.timeout)
+    
     @abstractmethod
     def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
         """
@@ -61,7 +218,54 @@ class LLMProvider(ABC):
         """
         pass
     
-    @abstractmethod
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        """
+        Async counterpart of generate() returning the same dictionary.
+        
+        Providers with a native async client should override this; the default
+        runs generate() in a worker thread so any provider can be awaited.
+        """
+        return await asyncio.to_thread(self.generate, prompt, max_tokens, temperature)
+    
+    def stream(self, prompt: str, max_tokens: int, temperature: float) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Generate text incrementally.
+        
+        Yields chunks of response text as they arrive and returns the same
+        dictionary as generate() once the completion ends, so callers can use
+        `result = yield from provider.stream(...)`.
+        
+        Providers with a streaming API should override this; the default
+        yields the whole response from generate() as a single chunk.
+        """
+        result = self.generate(prompt, max_tokens, temperature)
+        if result.get('response'):
+            yield result['response']
+        return result
+    
+    def close(self):
+        """
+        Release resources held by the provider, such as pooled connections.
+        Called when the provider is retired by a configuration reload.
+        """
+        pass
+    
+    @property
+    def tokenizer_spec(self) -> str:
+        """
+        Tokenizer used to count this provider's tokens: the `tokenizer`
+        config key if set, otherwise the provider's default.
+        """
+        return self.config.get('tokenizer') or self.default_tokenizer(self.config)
+    
+    @classmethod
+    def default_tokenizer(cls, config: Dict) -> str:
+        """
+        Tokenizer spec for providers without a `tokenizer` config key. Takes
+        the raw config entry so it can be resolved without building the provider.
+        """
+        return APPROXIMATE
+    
     def count_tokens(self, text: str) -> int:
         """
         Count the number of tokens in the text.
@@ -72,4 +276,4 @@ class LLMProvider(ABC):
         Returns:
             Number of tokens
         """
-        pass
\ No newline at end of file
+        return get_token_counter().count(text, self.tokenizer_spec)
@@ -0,0 +1,388 @@
+"""
+Metrics Registry
+
+Counters, histograms and gauges rendered in the Prometheus text format for
+/metrics. Recording is lock-free: every thread updates its own shard, and
+shards are only summed when metrics are read. Shards of exited threads are
+folded into one retired total, so a server running a thread per request
+doesn't accumulate them. Gauges are read from callbacks
+at that point, so they cost nothing in between.
+
+With several worker processes, each process writes its snapshot to its own
+file in a shared directory (settings.metrics.path), and whichever worker
+serves /metrics merges them: counters and histograms are summed over every
+file, gauges over the processes still running. Point the directory at a
+location cleared on deploy, since files of exited workers are kept so their
+counts don't go backwards.
+"""
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import weakref
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from services.deadline import DeadlineExceededError
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+THROUGHPUT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+def error_class(error: BaseException) -> str:
+    """
+    Short, bounded label for an error: the HTTP status or transport failure
+    behind it if there is one (following the 'raise ... from' chain of
+    wrapped provider errors), otherwise the exception type.
+    """
+    seen = error
+    while seen is not None:
+        if isinstance(seen, DeadlineExceededError):
+            return 'deadline'
+        if isinstance(seen, httpx.HTTPStatusError):
+            return f"http_{seen.response.status_code}"
+        if isinstance(seen, httpx.TimeoutException):
+            return 'timeout'
+        if isinstance(seen, httpx.TransportError):
+            return 'connection'
+        seen = seen.__cause__
+    return type(error).__name__
+
+
+class _Shard:
+    """One thread's metric values; only that thread writes to it."""
+
+    def __init__(self, owner: Optional[threading.Thread] = None):
+        self.values: Dict[Tuple, float] = {}
+        self.histograms: Dict[Tuple, List[float]] = {}
+        self._owner = weakref.ref(owner) if owner is not None else None
+
+    def owner_alive(self) -> bool:
+        owner = self._owner() if self._owner is not None else None
+        return owner is not None and owner.is_alive()
+
+    def merge(self, other: '_Shard'):
+        """Add other's values to this shard; other must no longer be written to."""
+        for key, value in list(other.values.items()):
+            self.values[key] = self.values.get(key, 0.0) + value
+        for key, series in list(other.histograms.items()):
+            total = self.histograms.setdefault(key, [0.0] * len(series))
+            for index, count in enumerate(list(series)):
+                total[index] += count
+
+
+class _Metric:
+    def __init__(self, registry: 'Registry', name: str, help_text: str, kind: str, labels: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.labels = tuple(labels)
+
+
+class Counter(_Metric):
+    def inc(self, *label_values: str, amount: float = 1.0):
+        """Add amount to the series with the given label values (in declaration order)."""
+        values = self.registry._shard().values
+        key = (self.name, label_values)
+        values[key] = values.get(key, 0.0) + amount
+
+
+class Histogram(_Metric):
+    def __init__(self, registry: 'Registry', name: str, help_text: str, labels: Sequence[str],
+                 buckets: Sequence[float]):
+        super().__init__(registry, name, help_text, HISTOGRAM, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: str):
+        """Record one observation in the series with the given label values."""
+        histograms = self.registry._shard().histograms
+        key = (self.name, label_values)
+        series = histograms.get(key)
+        if series is None:
+            # Per-bucket counts (the last one is +Inf), then sum
+            series = histograms[key] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+
+class Gauge(_Metric):
+    def __init__(self, registry: 'Registry', name: str, help_text: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[Tuple, float]]):
+        super().__init__(registry, name, help_text, GAUGE, labels)
+        self.collect = collect
+
+
+class Registry:
+    """All metrics of this process, plus the export to and merge from other workers."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._shards: List[_Shard] = []
+        # Values recorded by threads that have since exited
+        self._retired = _Shard()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        self.path: Optional[str] = None
+        self.flush_interval = 5.0
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labels != metric.labels:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                if isinstance(metric, Gauge):
+                    existing.collect = metric.collect
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help_text, COUNTER, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, labels: Sequence[str],
+              collect: Callable[[], Dict[Tuple, float]]) -> Gauge:
+        """
+        Register a gauge read from collect() at snapshot time; collect returns
+        {label values: value}. Registering the same name again replaces the callback.
+        """
+        return self._register(Gauge(self, name, help_text, labels, collect))
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._retire_dead()
+                self._shards.append(shard)
+        return shard
+
+    def _retire_dead(self):
+        """Fold the shards of exited threads into the retired total; call with the lock held."""
+        live = []
+        for shard in self._shards:
+            if shard.owner_alive():
+                live.append(shard)
+            else:
+                self._retired.merge(shard)
+        self._shards = live
+
+    def snapshot(self) -> Dict:
+        """This process's values: summed counters and histograms, current gauges."""
+        total = _Shard()
+        with self._lock:
+            self._retire_dead()
+            total.merge(self._retired)
+            shards = list(self._shards)
+            metrics = list(self._metrics.values())
+
+        for shard in shards:
+            # merge() copies first: the owning thread may add a series while we read
+            total.merge(shard)
+        values, histograms = total.values, total.histograms
+
+        gauges = {}
+        for metric in metrics:
+            if isinstance(metric, Gauge):
+                try:
+                    for label_values, value in metric.collect().items():
+                        gauges[(metric.name, tuple(label_values))] = value
+                except Exception as e:
+                    logger.warning(f"Failed to collect gauge {metric.name}: {str(e)}")
+
+        return {
+            "pid": os.getpid(),
+            "values": [[name, list(labels), value] for (name, labels), value in values.items()],
+            "histograms": [[name, list(labels), series] for (name, labels), series in histograms.items()],
+            "gauges": [[name, list(labels), value] for (name, labels), value in gauges.items()]
+        }
+
+    def configure(self, settings: Optional[Dict]):
+        """
+        Apply settings.metrics: with a path, share snapshots with the other
+        workers through files there, written every flush_interval seconds.
+        """
+        settings = settings or {}
+        path = settings.get('path')
+        self.flush_interval = settings.get('flush_interval', 5.0)
+        if path == self.path:
+            return
+        self.path = path
+        if path:
+            os.makedirs(path, exist_ok=True)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _file(self, pid: int) -> str:
+        return os.path.join(self.path, f"metrics-{pid}.json")
+
+    def flush(self):
+        """Write this process's snapshot for the other workers."""
+        if not self.path:
+            return
+        target = self._file(os.getpid())
+        tmp_path = f"{target}.tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(self.snapshot(), file)
+            os.replace(tmp_path, target)
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot {target}: {str(e)}")
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def _snapshots(self) -> List[Tuple[Dict, bool]]:
+        """(snapshot, process alive) for every worker, this one read fresh."""
+        own = self.snapshot()
+        if not self.path:
+            return [(own, True)]
+
+        self.flush()
+        snapshots = [(own, True)]
+        for path in glob.glob(os.path.join(self.path, 'metrics-*.json')):
+            try:
+                with open(path, 'r') as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get('pid') != own['pid']:
+                snapshots.append((snapshot, _alive(snapshot.get('pid'))))
+        return snapshots
+
+    def render(self) -> str:
+        """All workers' metrics in the Prometheus text exposition format."""
+        values: Dict[Tuple, float] = {}
+        histograms: Dict[Tuple, List[float]] = {}
+        for snapshot, alive in self._snapshots():
+            for name, labels, value in snapshot['values']:
+                key = (name, tuple(labels))
+                values[key] = values.get(key, 0.0) + value
+            for name, labels, series in snapshot['histograms']:
+                total = histograms.setdefault((name, tuple(labels)), [0.0] * len(series))
+                for index, count in enumerate(series):
+                    total[index] += count
+            if alive:
+                for name, labels, value in snapshot['gauges']:
+                    key = (name, tuple(labels))
+                    values[key] = values.get(key, 0.0) + value
+
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            if isinstance(metric, Histogram):
+                for (name, label_values), series in sorted(histograms.items()):
+                    if name == metric.name:
+                        lines.extend(_histogram_lines(metric, label_values, series))
+            else:
+                for (name, label_values), value in sorted(values.items()):
+                    if name == metric.name:
+                        lines.append(f"{name}{_labels(metric.labels, label_values)} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def _alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _histogram_lines(metric: Histogram, label_values: Sequence[str], series: List[float]) -> List[str]:
+    lines = []
+    cumulative = 0.0
+    bounds = [repr(float(bound)) for bound in metric.buckets] + ['+Inf']
+    for bound, count in zip(bounds, series[:-1]):
+        cumulative += count
+        le = f'le="{bound}"'
+        lines.append(f"{metric.name}_bucket{_labels(metric.labels, label_values, le)} {_number(cumulative)}")
+    lines.append(f"{metric.name}_sum{_labels(metric.labels, label_values)} {_number(series[-1])}")
+    lines.append(f"{metric.name}_count{_labels(metric.labels, label_values)} {_number(cumulative)}")
+    return lines
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    'llm_request_duration_seconds', "End-to-end generation latency", ('mode', 'outcome')
+)
+ATTEMPT_DURATION = REGISTRY.histogram(
+    'llm_provider_attempt_duration_seconds', "Latency of one provider call, retries included",
+    ('provider', 'outcome')
+)
+THROUGHPUT = REGISTRY.histogram(
+    'llm_provider_tokens_per_second', "Completion tokens per second of successful provider calls",
+    ('provider',), buckets=THROUGHPUT_BUCKETS
+)
+TOKENS = REGISTRY.counter('llm_provider_tokens_total', "Tokens processed by providers", ('provider', 'kind'))
+PROVIDER_ERRORS = REGISTRY.counter(
+    'llm_provider_errors_total', "Failed provider calls by error class", ('provider', 'error')
+)
+RETRIES = REGISTRY.counter('llm_provider_retries_total', "Retried provider requests by error class",
+                           ('provider', 'error'))
+FALLBACKS = REGISTRY.counter(
+    'llm_fallbacks_total', "Requests that moved past a provider, by reason", ('provider', 'reason')
+)
+CACHE_LOOKUPS = REGISTRY.counter('llm_cache_lookups_total', "Response cache lookups", ('layer', 'result'))
+ADMISSION_REJECTED = REGISTRY.counter(
+    'llm_admission_rejected_total', "Requests turned away by admission control", ('class',)
+)
+ADMISSION_WAIT = REGISTRY.histogram(
+    'llm_admission_wait_seconds', "Time admitted requests spent queued", ('class',)
+)
+
+
+def render() -> str:
+    """The /metrics response body."""
+    return REGISTRY.render()
+
+
+def configure_metrics(settings: Optional[Dict]) -> Registry:
+    """Apply settings.metrics to the process-wide registry."""
+    REGISTRY.configure(settings)
+    return REGISTRY
@@ -1,66 +1,373 @@
-import json
+import asyncio
+import contextvars
+import copy
+import math
 import os
+import threading
 import time
-from typing import Dict, List, Any, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+from typing import Dict, Iterator, List, Any, Optional, Tuple
 import importlib
 
+import yaml
+
 from utils.logger import get_logger
+from services import deadline, metrics, tracing
+from services.admission import AdmissionController, Slot
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from services.deadline import DeadlineExceededError
 from services.llm_provider import LLMProvider
+from services.provider_stats import LatencyTracker
+from services.rate_limiter import RateLimitedError, RateLimiter, RateLimitTicket
+from services.routing import AdaptiveRouter
+from services.response_cache import CACHE_MODES, CacheMissError, ResponseCache, make_cache_key
+from services.retry_policy import is_caller_error
+from services.similarity_cache import SimilarityCache
+from services.single_flight import CoalesceTimeoutError, SingleFlight
+from services.token_counter import LOADING, configure_token_counter
+from services.usage_stats import UsageStats
+from services.usage_store import UsageStore, create_usage_store
 from utils.cost_tracker import calculate_cost
 
 logger = get_logger(__name__)
 
+# Set while a batch runs so its usage records are written in one go
+_usage_batch = contextvars.ContextVar('usage_batch', default=None)
+
+# Per-request completion limits by provider name, set after context-window filtering
+_completion_limits = contextvars.ContextVar('completion_limits', default=None)
+
+
+def _leader_out_of_time(error: Exception) -> bool:
+    """
+    Whether a coalesced leader failed only because its own deadline ran
+    out; its followers have budgets of their own, so they try again.
+    """
+    return isinstance(error, DeadlineExceededError)
+
+
+class ContextWindowError(Exception):
+    """Raised when no provider's context window can hold the prompt plus completion."""
+    pass
+
+
+def load_config_file(config_path: str) -> Dict:
+    """Read and parse a providers YAML file."""
+    with open(config_path, 'r') as file:
+        return yaml.safe_load(file) or {}
+
+
 class ProviderManager:
     """
     Manages multiple LLM providers, handles routing, fallback, and tracking.
     """
     
-    def __init__(self, config: Dict):
-        """Initialize the provider manager with configuration."""
+    def __init__(self, config: Dict, config_path: Optional[str] = None,
+                 usage_store: Optional[UsageStore] = None):
+        """
+        Initialize the provider manager with configuration.
+        
+        Args:
+            config: Parsed provider configuration
+            config_path: Optional path the configuration was read from. When set,
+                reload_if_changed() watches its mtime and hot-reloads providers.
+            usage_store: Store for usage records. Defaults to the one described
+                by settings.usage_store.
+        """
         self.config = config
+        self.config_path = config_path
         self.providers = []
         self.settings = config.get('settings', {})
         
+        if usage_store is None:
+            usage_store = create_usage_store(self.settings.get('usage_store'))
+        self.usage_store = usage_store
+        self.usage_stats = UsageStats(usage_store, **self.settings.get('usage_stats', {}))
+        
+        # Identical requests in flight at the same time share one upstream call
+        self.single_flight = SingleFlight()
+        
+        # Observed latencies by provider name, kept across reloads. Circuit
+        # breakers are too, unless settings.circuit_breaker changes.
+        self.latency = {}
+        self.breakers = {}
+        self.router = None
+        self.admission = None
+        self._build_components(self.settings)
+        self._register_gauges()
+        # Rate limiters by provider name; rebuilt with the provider when its entry
+        # changes (carrying the bucket levels over) and dropped with it
+        self.rate_limiters = {}
+        self._executor = None
+        self._batch_executor = None
+        self._executor_lock = threading.Lock()
+        
+        # Raw config entry each live provider was built from, keyed by name.
+        # Providers mutate their own config (e.g. API key expansion), so keep a copy.
+        self._provider_specs = {}
+        self._reload_lock = threading.Lock()
+        self._reload_requested = False
+        self._config_mtime = self._stat_config()
+        
         # Load all providers
         self._load_providers()
         
         # Sort providers by priority
         self.providers.sort(key=lambda p: p.priority)
+        self._warm_up_tokenizers(self.providers)
         
         logger.info(f"Initialized {len(self.providers)} providers")
     
+    @classmethod
+    def from_config_file(cls, config_path: str) -> 'ProviderManager':
+        """Build a manager from a YAML file and keep watching it for changes."""
+        return cls(load_config_file(config_path), config_path=config_path)
+    
     def _load_providers(self):
         """Dynamically load and initialize providers from configuration."""
         provider_configs = self.config.get('providers', [])
         
         for provider_config in provider_configs:
-            if not provider_config.get('enabled', True):
-                continue
-                
-            provider_type = provider_config.get('type')
-            if not provider_type:
-                logger.warning(f"Provider missing 'type' field: {provider_config.get('name', 'unknown')}")
+            provider = self._build_provider(provider_config)
+            if provider is not None:
+                self.providers.append(provider)
+    
+    def _build_provider(self, provider_config: Dict) -> Optional[LLMProvider]:
+        """Create a single provider instance from its config entry."""
+        if not provider_config.get('enabled', True):
+            return None
+            
+        provider_type = provider_config.get('type')
+        if not provider_type:
+            logger.warning(f"Provider missing 'type' field: {provider_config.get('name', 'unknown')}")
+            return None
+        
+        spec = copy.deepcopy(provider_config)
+            
+        try:
+            # Dynamically import the provider module
+            module_name = f"services.providers.{provider_type}_provider"
+            module = importlib.import_module(module_name)
+            
+            # Get the provider class (assuming it follows the naming convention)
+            class_name = f"{provider_type.capitalize()}Provider"
+            provider_class = getattr(module, class_name)
+            
+            # Create provider instance
+            provider = provider_class(provider_config)
+            rate_limit = provider_config.get('rate_limit')
+            if rate_limit:
+                limiter = RateLimiter(name=provider.name, **rate_limit)
+                limiter.inherit(self.rate_limiters.get(provider.name))
+                self.rate_limiters[provider.name] = limiter
+            else:
+                self.rate_limiters.pop(provider.name, None)
+            self._provider_specs[provider.name] = spec
+            
+            logger.info(f"Loaded provider: {provider.name}")
+            return provider
+        
+        except (ImportError, AttributeError, Exception) as e:
+            logger.error(f"Failed to load provider {provider_type}: {str(e)}")
+            return None
+    
+    def _stat_config(self) -> Optional[float]:
+        """Return the config file mtime, or None when not watching a file."""
+        if not self.config_path:
+            return None
+        try:
+            return os.stat(self.config_path).st_mtime
+        except OSError:
+            return None
+    
+    def request_reload(self):
+        """Force a reload on the next reload_if_changed() call (e.g. from SIGHUP)."""
+        self._reload_requested = True
+    
+    def needs_reload(self) -> bool:
+        """Cheap per-request check: whether the config file's mtime moved or a reload was requested."""
+        if not self.config_path:
+            return False
+        return self._reload_requested or self._stat_config() != self._config_mtime
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the config file if needs_reload() says it changed.
+        
+        Returns:
+            True if a reload was performed
+        """
+        if not self.needs_reload():
+            return False
+        
+        # Another thread is already reloading; keep serving the current set
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        
+        try:
+            mtime = self._stat_config()
+            if mtime == self._config_mtime and not self._reload_requested:
+                return False
+            self._reload_requested = False
+            self._config_mtime = mtime
+            
+            try:
+                config = load_config_file(self.config_path)
+            except Exception as e:
+                logger.error(f"Failed to reload config {self.config_path}: {str(e)}")
+                return False
+            
+            self._apply_config(config)
+            return True
+        finally:
+            self._reload_lock.release()
+    
+    def reload(self, config: Dict):
+        """Apply a new configuration, rebuilding only providers whose entry changed."""
+        with self._reload_lock:
+            self._apply_config(config)
+    
+    def _apply_config(self, config: Dict):
+        current = {provider.name: provider for provider in self.providers}
+        old_specs = self._provider_specs
+        self._provider_specs = {}
+        providers = []
+        rebuilt = 0
+        
+        for provider_config in config.get('providers', []):
+            name = provider_config.get('name', 'unknown')
+            existing = current.get(name)
+            
+            if existing is not None and old_specs.get(name) == provider_config:
+                providers.append(existing)
+                self._provider_specs[name] = old_specs[name]
                 continue
-                
+            
+            provider = self._build_provider(provider_config)
+            if provider is not None:
+                providers.append(provider)
+                rebuilt += 1
+        
+        providers.sort(key=lambda p: p.priority)
+        retired = [provider for provider in self.providers if provider not in providers]
+        active = {provider.name for provider in providers}
+        self.rate_limiters = {name: limiter for name, limiter in self.rate_limiters.items() if name in active}
+        
+        # Each attribute is swapped in a single assignment; in-flight requests
+        # keep iterating the list they snapshotted
+        settings = config.get('settings', {})
+        self._build_components(settings, previous=self.settings)
+        self.config = config
+        self.settings = settings
+        self.providers = providers
+        self._warm_up_tokenizers(providers)
+        
+        logger.info(f"Reloaded configuration: {rebuilt} provider(s) rebuilt, "
+                    f"{len(retired)} retired, {len(providers)} active")
+        self._retire_providers(retired)
+    
+    def _build_components(self, settings: Dict, previous: Optional[Dict] = None):
+        """
+        Build the components configured by settings sections. On a reload
+        (previous given) only those whose section changed are rebuilt; the
+        router keeps its estimates. Sections read per request (hedging,
+        deadline, coalescing, context_window) need no rebuild, and the usage
+        store can't be swapped under a running process, so a change to it
+        only logs that a restart is needed.
+        """
+        def changed(section: str) -> bool:
+            return previous is None or settings.get(section) != previous.get(section)
+        
+        rebuilt = []
+        if changed('response_cache'):
+            cache_settings = dict(settings.get('response_cache', {}))
+            self.response_cache = ResponseCache(**cache_settings) if cache_settings.pop('enabled', False) else None
+            rebuilt.append('response_cache')
+        if changed('similarity_cache'):
+            similarity_settings = dict(settings.get('similarity_cache', {}))
+            self.similarity_cache = (
+                SimilarityCache(**similarity_settings) if similarity_settings.pop('enabled', False) else None
+            )
+            rebuilt.append('similarity_cache')
+        if changed('routing'):
+            routing_settings = dict(settings.get('routing', {}))
+            router = AdaptiveRouter(**routing_settings) if routing_settings.pop('enabled', False) else None
+            if router is not None:
+                router.inherit(self.router)
+            self.router = router
+            rebuilt.append('routing')
+        if changed('admission'):
+            # Slots already handed out are released to the controller they came from
+            admission_settings = dict(settings.get('admission', {}))
+            self.admission = (
+                AdmissionController(**admission_settings) if admission_settings.pop('enabled', False) else None
+            )
+            rebuilt.append('admission')
+        if changed('circuit_breaker'):
+            # Recreated on next use with the new thresholds, starting closed
+            self.breakers = {}
+            rebuilt.append('circuit_breaker')
+        if changed('token_counter'):
+            self.token_counter = configure_token_counter(settings.get('token_counter'))
+            rebuilt.append('token_counter')
+        if changed('metrics'):
+            self.metrics = metrics.configure_metrics(settings.get('metrics'))
+        if changed('tracing'):
+            self.tracer = tracing.configure_tracing(settings.get('tracing'))
+        
+        if previous is None:
+            return
+        if rebuilt:
+            logger.info(f"Rebuilt {', '.join(rebuilt)} for the new settings")
+        for section in ('usage_store', 'usage_stats'):
+            if changed(section):
+                logger.warning(f"settings.{section} changed; restart the server to apply it")
+    
+    def _warm_up_tokenizers(self, providers: List[LLMProvider]):
+        """Load provider tokenizers in the background; counts are estimated until then."""
+        self.token_counter.warm_up({provider.tokenizer_spec for provider in providers})
+    
+    def _retire_providers(self, providers: List[LLMProvider]):
+        """Release resources held by providers dropped on reload."""
+        for provider in providers:
             try:
-                # Dynamically import the provider module
-                module_name = f"services.providers.{provider_type}_provider"
-                module = importlib.import_module(module_name)
-                
-                # Get the provider class (assuming it follows the naming convention)
-                class_name = f"{provider_type.capitalize()}Provider"
-                provider_class = getattr(module, class_name)
-                
-                # Create provider instance
-                provider = provider_class(provider_config)
-                self.providers.append(provider)
-                
-                logger.info(f"Loaded provider: {provider.name}")
+                provider.close()
+            except Exception as e:
+                logger.warning(f"Error closing retired provider {provider.name}: {str(e)}")
+            logger.info(f"Retired provider: {provider.name}")
+    
+    def admit(self, priority: Optional[str] = None, batch: bool = False) -> Optional[Slot]:
+        """
+        Wait for an admission slot ahead of generate(), stream() or
+        generate_batch(). The caller releases it when the response is done.
+        
+        Args:
+            priority: Priority class name; defaults to settings.admission.default_class,
+                or batch_class for batches
+            batch: Whether the slot is for a whole batch
             
-            except (ImportError, AttributeError, Exception) as e:
-                logger.error(f"Failed to load provider {provider_type}: {str(e)}")
+        Returns:
+            The slot, or None when admission control is disabled
+            
+        Raises:
+            AdmissionRejectedError: If the queue can't serve the request within its class's max_wait
+            ValueError: If priority is not a configured class
+        """
+        if self.admission is None:
+            return None
+        with tracing.span('admission'):
+            return self.admission.enter(priority or (self.admission.batch_class if batch else None))
     
-    def generate(self, prompt: str, max_tokens: int = None, temperature: float = None) -> Dict:
+    async def aadmit(self, priority: Optional[str] = None, batch: bool = False) -> Optional[Slot]:
+        """Async counterpart of admit()."""
+        if self.admission is None:
+            return None
+        with tracing.span('admission'):
+            return await self.admission.aenter(priority or (self.admission.batch_class if batch else None))
+    
+    def generate(self, prompt: str, max_tokens: int = None, temperature: float = None,
+                 cache: str = 'default', timeout: float = None) -> Dict:
         """
         Generate text using the most cost-effective provider with fallback logic.
         
@@ -68,89 +375,1030 @@ class ProviderManager:
             prompt: The text prompt
             max_tokens: Maximum tokens to generate
             temperature: Temperature for generation
+            cache: Response cache mode - default, bypass, or only (never call a provider)
+            timeout: End-to-end deadline in seconds; defaults to settings.deadline
             
         Returns:
             Dictionary with generation results, provider used, cost, etc.
-        """
-        if not max_tokens:
-            max_tokens = self.settings.get('default_max_tokens', 100)
             
-        if not temperature:
-            temperature = self.settings.get('default_temperature', 0.7)
+        Raises:
+            DeadlineExceededError: If the deadline passes before any provider answers
+        """
+        started = time.perf_counter()
+        try:
+            with deadline.scope(self._resolve_deadline(timeout)) as budget:
+                result = self._with_budget(self._generate(prompt, max_tokens, temperature, cache), budget)
+        except Exception as e:
+            self._observe_request('generate', started, error=e)
+            raise
+        self._observe_request('generate', started, result)
+        return result
+    
+    def _generate(self, prompt: str, max_tokens: Optional[int], temperature: Optional[float], cache: str) -> Dict:
+        max_tokens, temperature = self._resolve_params(max_tokens, temperature)
+        # Snapshot the provider set so a concurrent reload can't change it mid-request
+        providers = self._route(self.providers, max_tokens)
         
+        cache_ticket, cached = self._cache_lookup(providers, prompt, max_tokens, temperature, cache)
+        if cached is not None:
+            return cached
+        
+        with tracing.span('token_count'):
+            candidates, limits = self._fit_context(providers, prompt, max_tokens)
+        
+        def produce():
+            if self._hedging_enabled(candidates):
+                return self._generate_hedged(candidates, prompt, max_tokens, temperature)
+            return self._generate_in_order(candidates, prompt, max_tokens, temperature)
+        
+        limits_token = _completion_limits.set(limits)
+        try:
+            coalesce_key = self._coalesce_key(providers, prompt, max_tokens, temperature, cache)
+            if coalesce_key is None:
+                result = produce()
+            else:
+                try:
+                    result, shared = self.single_flight.do(coalesce_key, produce, timeout=deadline.remaining(),
+                                                                retry=_leader_out_of_time)
+                except CoalesceTimeoutError as e:
+                    raise DeadlineExceededError("Request deadline exceeded waiting on an identical request") from e
+                if shared:
+                    return self._finish_coalesced(result)
+        finally:
+            _completion_limits.reset(limits_token)
+        
+        self._cache_store(cache_ticket, result)
+        return result
+    
+    def _generate_in_order(self, providers: List[LLMProvider], prompt: str,
+                           max_tokens: int, temperature: float) -> Dict:
         # Try each provider in order of priority
-        for provider in self.providers:
+        for index, provider in enumerate(providers):
+            if deadline.remaining() == 0:
+                break
             try:
                 logger.info(f"Attempting to generate with provider: {provider.name}")
                 
-                result = provider.generate(
-                    prompt=prompt,
-                    max_tokens=max_tokens,
-                    temperature=temperature
-                )
+                result = self._timed_generate(provider, prompt, max_tokens, temperature,
+                                              providers_left=len(providers) - index)
                 
-                # Calculate cost
-                token_info = result.get('tokens', {})
-                cost = calculate_cost(
-                    provider_name=provider.name,
-                    prompt_tokens=token_info.get('prompt', 0),
-                    completion_tokens=token_info.get('completion', 0),
-                    provider_config=provider.config
-                )
+                return self._finish(provider, result)
+                
+            except (CircuitOpenError, RateLimitedError) as e:
+                logger.info(str(e))
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                continue
                 
-                # Add cost to result
-                result['cost'] = cost
-                result['modelUsed'] = provider.name
+            except Exception as e:
+                logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                continue
+        
+        # If we get here, all providers failed
+        raise self._all_failed()
+    
+    async def agenerate(self, prompt: str, max_tokens: int = None, temperature: float = None,
+                        cache: str = 'default', timeout: float = None) -> Dict:
+        """
+        Async counterpart of generate(): same routing and fallback, but each
+        provider attempt is awaited instead of blocking a thread.
+        """
+        started = time.perf_counter()
+        try:
+            with deadline.scope(self._resolve_deadline(timeout)) as budget:
+                result = self._with_budget(await self._agenerate(prompt, max_tokens, temperature, cache), budget)
+        except Exception as e:
+            self._observe_request('generate', started, error=e)
+            raise
+        self._observe_request('generate', started, result)
+        return result
+    
+    async def _agenerate(self, prompt: str, max_tokens: Optional[int], temperature: Optional[float],
+                         cache: str) -> Dict:
+        max_tokens, temperature = self._resolve_params(max_tokens, temperature)
+        providers = self._route(self.providers, max_tokens)
+        
+        cache_ticket, cached = self._cache_lookup(providers, prompt, max_tokens, temperature, cache)
+        if cached is not None:
+            return cached
+        
+        # Count a long prompt off the event loop; _fit_context then hits the memo
+        with tracing.span('token_count'):
+            await self._acount_prompt(providers, prompt)
+            candidates, limits = self._fit_context(providers, prompt, max_tokens)
+        
+        def produce():
+            if self._hedging_enabled(candidates):
+                return self._agenerate_hedged(candidates, prompt, max_tokens, temperature)
+            return self._agenerate_in_order(candidates, prompt, max_tokens, temperature)
+        
+        limits_token = _completion_limits.set(limits)
+        try:
+            coalesce_key = self._coalesce_key(providers, prompt, max_tokens, temperature, cache)
+            if coalesce_key is None:
+                result = await produce()
+            else:
+                try:
+                    result, shared = await self.single_flight.ado(coalesce_key, produce, timeout=deadline.remaining(),
+                                                                retry=_leader_out_of_time)
+                except CoalesceTimeoutError as e:
+                    raise DeadlineExceededError("Request deadline exceeded waiting on an identical request") from e
+                if shared:
+                    return self._finish_coalesced(result)
+        finally:
+            _completion_limits.reset(limits_token)
+        
+        self._cache_store(cache_ticket, result)
+        return result
+    
+    async def _agenerate_in_order(self, providers: List[LLMProvider], prompt: str,
+                                  max_tokens: int, temperature: float) -> Dict:
+        for index, provider in enumerate(providers):
+            if deadline.remaining() == 0:
+                break
+            try:
+                logger.info(f"Attempting to generate with provider: {provider.name}")
                 
-                # Log usage
-                self._log_usage(result)
+                result = await self._atimed_generate(provider, prompt, max_tokens, temperature,
+                                                     providers_left=len(providers) - index)
                 
-                logger.info(f"Successfully generated with {provider.name}. "
-                           f"Tokens: {token_info.get('total', 0)}, Cost: ${cost:.6f}")
+                return self._finish(provider, result)
                 
-                return result
+            except (CircuitOpenError, RateLimitedError) as e:
+                logger.info(str(e))
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                continue
                 
             except Exception as e:
                 logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
                 continue
         
-        # If we get here, all providers failed
-        raise Exception("All providers failed to generate response")
+        raise self._all_failed()
     
-    def _log_usage(self, result: Dict):
-        """Log usage data to storage."""
+    def stream(self, prompt: str, max_tokens: int = None, temperature: float = None,
+               cache: str = 'default', timeout: float = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Generate text incrementally as (event, data) pairs.
+        
+        Yields 'chunk' events carrying {"text": ...} as the provider produces
+        them, then a single 'done' event with tokens, cost and provider. A
+        provider that fails before its first chunk falls back to the next one;
+        once text has been relayed a failure is raised to the caller instead.
+        Hedging does not apply to streams. The deadline bounds each provider's
+        connection attempts, retries and reads, but not the length of a
+        stream that is already flowing.
+        """
+        started = time.perf_counter()
+        finished = False
         try:
-            # Add timestamp
-            result['timestamp'] = time.time()
+            for event, data in self._stream(prompt, max_tokens, temperature, cache, timeout):
+                if event == 'done':
+                    finished = True
+                    self._observe_request('stream', started, data)
+                yield event, data
+        except GeneratorExit:
+            # The client went away mid-stream
+            if not finished:
+                metrics.REQUEST_DURATION.observe(time.perf_counter() - started, 'stream', 'cancelled')
+            raise
+        except Exception as e:
+            self._observe_request('stream', started, error=e)
+            raise
+    
+    def _stream(self, prompt: str, max_tokens: Optional[int], temperature: Optional[float],
+                cache: str, timeout: Optional[float]) -> Iterator[Tuple[str, Dict]]:
+        max_tokens, temperature = self._resolve_params(max_tokens, temperature)
+        providers = self._route(self.providers, max_tokens)
+        
+        cache_ticket, cached = self._cache_lookup(providers, prompt, max_tokens, temperature, cache)
+        if cached is not None:
+            if cached.get('response'):
+                yield 'chunk', {"text": cached['response']}
+            yield 'done', self._stream_summary(cached)
+            return
+        
+        with tracing.span('token_count'):
+            candidates, limits = self._fit_context(providers, prompt, max_tokens)
+        seconds = self._resolve_deadline(timeout)
+        budget = deadline.Deadline(seconds) if seconds is not None else None
+        
+        for index, provider in enumerate(candidates):
+            if budget is not None and budget.expired():
+                break
+            logger.info(f"Attempting to stream with provider: {provider.name}")
+            first_chunk_at = None
             
-            # Load existing logs
-            logs_path = 'storage/usage_logs.json'
-            logs = []
+            try:
+                breaker = self._admit(provider)
+                ticket = self._throttle_admitted(provider, breaker, prompt, limits.get(provider.name, max_tokens))
+            except (CircuitOpenError, RateLimitedError) as e:
+                logger.info(str(e))
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                continue
             
-            if os.path.exists(logs_path):
-                with open(logs_path, 'r') as file:
+            # A generator is resumed from whatever context the server iterates
+            # it in, so the provider runs inside an explicit context instead
+            allotted = self._attempt_seconds(len(candidates) - index, budget)
+            context = budget.context(allotted) if budget is not None else contextvars.copy_context()
+            attempt_started = time.monotonic()
+            outcome = 'cancelled'
+            
+            started = time.time()
+            try:
+                with provider.slot(timeout=context.run(deadline.remaining)):
+                    started = time.time()
+                    chunks = provider.stream(prompt=prompt, max_tokens=limits.get(provider.name, max_tokens),
+                                             temperature=temperature)
                     try:
-                        logs = json.load(file)
-                    except json.JSONDecodeError:
-                        logs = []
+                        while True:
+                            try:
+                                text = context.run(next, chunks)
+                            except StopIteration as stop:
+                                result = stop.value
+                                break
+                            if first_chunk_at is None:
+                                first_chunk_at = time.time()
+                            yield 'chunk', {"text": text}
+                    finally:
+                        context.run(chunks.close)
+                outcome = 'success'
+                    
+            except Exception as e:
+                timed_out = isinstance(e, DeadlineExceededError) or (
+                    budget is not None and time.monotonic() >= min(budget.expires_at, attempt_started + allotted))
+                outcome = 'deadline' if timed_out else 'error'
+                self._record_failure(provider, breaker, ticket, e, time.time() - started, timed_out)
+                if first_chunk_at is not None:
+                    raise
+                logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                continue
+            
+            finally:
+                if budget is not None:
+                    budget.record(provider.name, allotted, attempt_started, outcome)
+            
+            finished = time.time()
+            self._record_success(provider, breaker, finished - started, result, ticket)
+            result['streamed'] = True
+            if provider.name in limits:
+                result['clampedMaxTokens'] = limits[provider.name]
+            result['timeToFirstChunk'] = round((first_chunk_at or finished) - started, 3)
+            result = self._finish(provider, result)
+            
+            self._cache_store(cache_ticket, result)
+            yield 'done', self._with_budget(self._stream_summary(result), budget)
+            return
+        
+        raise self._all_failed(budget)
+    
+    @staticmethod
+    def _stream_summary(result: Dict) -> Dict:
+        """The final stream event repeats everything but the text already sent."""
+        return {key: value for key, value in result.items() if key != 'response'}
+    
+    def generate_batch(self, items: List[Dict], timeout: float = None) -> List[Dict]:
+        """
+        Generate several prompts concurrently.
+        
+        Each item goes through generate() on its own worker, so routing,
+        fallback and caching behave as for single requests, while each
+        provider's max_concurrency bounds how many calls reach it at once.
+        Usage records for the whole batch are written in one bulk append.
+        
+        Args:
+            items: Dicts with prompt and optional max_tokens, temperature, cache
+                and timeout
+            timeout: Deadline for items without their own. Item deadlines
+                count from when the batch arrives, not from when a worker
+                picks the item up.
+            
+        Returns:
+            One entry per item in input order: the generate() result, or a dict
+            with error, details and status if that item failed
+        """
+        max_items = self.settings.get('batch', {}).get('max_items', 100)
+        if len(items) > max_items:
+            raise ValueError(f"Batch of {len(items)} items exceeds the limit of {max_items}")
+        
+        self._count_batch_prompts(items)
+        
+        executor = self._get_batch_executor()
+        records = []
+        submitted_at = time.monotonic()
+        token = _usage_batch.set(records)
+        try:
+            futures = [
+                executor.submit(contextvars.copy_context().run, self._generate_batch_item, item, timeout, submitted_at)
+                for item in items
+            ]
+            results = [future.result() for future in futures]
+        finally:
+            _usage_batch.reset(token)
+            if records:
+                self.usage_store.append_many(records)
+        
+        return results
+    
+    def _count_batch_prompts(self, items: List[Dict]):
+        """Count every prompt in the batch up front, one batched encode per tokenizer."""
+        prompts = [item['prompt'] for item in items if isinstance(item, dict) and isinstance(item.get('prompt'), str)]
+        specs = {provider.tokenizer_spec for provider in self.providers if provider.config.get('context_size')}
+        if not prompts or not self.settings.get('context_window', {}).get('enabled', True):
+            return
+        for spec in specs:
+            self.token_counter.count_batch(prompts, spec)
+    
+    def _generate_batch_item(self, item: Dict, default_timeout: Optional[float], submitted_at: float) -> Dict:
+        try:
+            if not isinstance(item, dict) or 'prompt' not in item:
+                raise ValueError("Missing required parameter: prompt")
             
-            # Append new log
-            logs.append(result)
+            max_tokens = item.get('max_tokens')
+            temperature = item.get('temperature')
+            timeout = self._resolve_deadline(item.get('timeout', default_timeout))
+            if timeout is not None:
+                # Time spent queued for a worker comes out of the item's budget
+                timeout -= time.monotonic() - submitted_at
+                if timeout <= 0:
+                    raise DeadlineExceededError("Request deadline exceeded while queued")
+            return self.generate(
+                prompt=item['prompt'],
+                max_tokens=int(max_tokens) if max_tokens is not None else None,
+                temperature=float(temperature) if temperature is not None else None,
+                cache=item.get('cache', 'default'),
+                timeout=timeout
+            )
+        
+        except CacheMissError as e:
+            return {"error": "No cached response", "details": str(e), "status": 504}
+        
+        except DeadlineExceededError as e:
+            return {"error": "Deadline exceeded", "details": str(e), "status": 504}
+        
+        except ContextWindowError as e:
+            return {"error": "Prompt too long", "details": str(e), "status": 413}
+        
+        except (TypeError, ValueError) as e:
+            return {"error": "Invalid request", "details": str(e), "status": 400}
+        
+        except Exception as e:
+            logger.warning(f"Batch item failed: {str(e)}")
+            return {"error": "Failed to generate response", "details": str(e), "status": 500}
+    
+    def _cache_lookup(self, providers: List[LLMProvider], prompt: str, max_tokens: int,
+                      temperature: float, mode: str):
+        """
+        Consult the exact-match cache, then the near-duplicate cache.
+        
+        Returns:
+            Tuple of (ticket for storing the result afterwards or None, cached result or None)
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Invalid cache mode '{mode}', expected one of {', '.join(CACHE_MODES)}")
+        
+        def usable(layer):
+            return (
+                layer is not None
+                and mode != 'bypass'
+                and (mode == 'only' or layer.is_cacheable(temperature))
+            )
+        
+        exact = usable(self.response_cache)
+        similar = usable(self.similarity_cache)
+        if not exact and not similar:
+            if mode == 'only':
+                raise CacheMissError("Response cache is not available for this request")
+            return None, None
+        
+        provider_names = [p.name for p in providers]
+        ticket = {}
+        result = None
+        with tracing.span('cache_lookup'):
+            if exact:
+                ticket['key'] = make_cache_key(prompt, max_tokens, temperature, provider_names)
+                result = self.response_cache.get(ticket['key'])
+                metrics.CACHE_LOOKUPS.inc('exact', 'miss' if result is None else 'hit')
             
-            # Write updated logs
-            with open(logs_path, 'w') as file:
-                json.dump(logs, file)
+            if result is None and similar:
+                ticket['scope'] = SimilarityCache.make_scope(max_tokens, temperature, provider_names)
+                ticket['signature'] = self.similarity_cache.signature(prompt)
+                match = self.similarity_cache.lookup(ticket['scope'], ticket['signature'])
+                metrics.CACHE_LOOKUPS.inc('similar', 'miss' if match is None else 'hit')
+                if match is not None:
+                    result, similarity = match
+                    result['cacheMatch'] = 'approximate'
+                    result['similarity'] = round(similarity, 3)
+        
+        if result is None:
+            if mode == 'only':
+                raise CacheMissError("No cached response for this request")
+            return ticket, None
+        
+        # Nothing was bought from a provider for this answer
+        result['cost'] = 0.0
+        result['cached'] = True
+        self._log_usage(result)
+        logger.info(f"Served response from cache (originally {result.get('modelUsed')})")
+        return ticket, result
+    
+    def _cache_store(self, ticket: Optional[Dict], result: Dict):
+        if not ticket:
+            return
+        with tracing.span('cache_store'):
+            if 'key' in ticket:
+                self.response_cache.put(ticket['key'], result)
+            if 'signature' in ticket:
+                self.similarity_cache.put(ticket['scope'], ticket['signature'], result)
+    
+    def _coalesce_key(self, providers: List[LLMProvider], prompt: str, max_tokens: int,
+                      temperature: float, mode: str) -> Optional[str]:
+        """Key under which identical concurrent requests share a call, or None to go alone."""
+        coalescing = self.settings.get('coalescing', {})
+        if not coalescing.get('enabled', True) or mode == 'bypass':
+            return None
+        # Followers receive the leader's sample rather than drawing their own
+        if temperature > 0 and not coalescing.get('coalesce_nondeterministic', True):
+            return None
+        return make_cache_key(prompt, max_tokens, temperature, [p.name for p in providers])
+    
+    def _finish_coalesced(self, result: Dict) -> Dict:
+        """Tag a follower's copy of the leader's result; only the leader was billed."""
+        result['cost'] = 0.0
+        result['coalesced'] = True
+        self._log_usage(result)
+        return result
+    
+    def get_cache_stats(self) -> Dict:
+        """Per-process counters for each enabled cache layer."""
+        stats = {}
+        if self.response_cache is not None:
+            stats['exact'] = self.response_cache.stats()
+        if self.similarity_cache is not None:
+            stats['approximate'] = self.similarity_cache.stats()
+        return stats
+    
+    def _resolve_params(self, max_tokens: Optional[int], temperature: Optional[float]):
+        """Fill in default generation parameters from settings."""
+        settings = self.settings
+        
+        if not max_tokens:
+            max_tokens = settings.get('default_max_tokens', 100)
+            
+        # 0 is a valid temperature (greedy decoding), so only fill in when missing
+        if temperature is None:
+            temperature = settings.get('default_temperature', 0.7)
+        
+        return max_tokens, temperature
+    
+    def _timed_generate(self, provider: LLMProvider, prompt: str, max_tokens: int, temperature: float,
+                        providers_left: int = 1) -> Dict:
+        limit = self._completion_limit(provider, max_tokens)
+        breaker = self._admit(provider)
+        with tracing.span('rate_limit', provider=provider.name):
+            ticket = self._throttle_admitted(provider, breaker, prompt, limit)
+        started = time.time()
+        # The slot wait is part of the attempt, so it is bounded by the allotment too
+        try:
+            with deadline.attempt(provider.name, self._attempt_seconds(providers_left)) as attempt, \
+                    provider.slot():
+                started = time.time()
+                with tracing.span('attempt', provider=provider.name):
+                    result = provider.generate(prompt=prompt, max_tokens=limit, temperature=temperature)
+        except Exception as e:
+            self._record_failure(provider, breaker, ticket, e, time.time() - started, attempt.out_of_time)
+            raise
+        self._record_success(provider, breaker, time.time() - started, result, ticket)
+        if limit != max_tokens:
+            result['clampedMaxTokens'] = limit
+        return result
+    
+    async def _atimed_generate(self, provider: LLMProvider, prompt: str, max_tokens: int, temperature: float,
+                               providers_left: int = 1) -> Dict:
+        limit = self._completion_limit(provider, max_tokens)
+        breaker = self._admit(provider)
+        with tracing.span('rate_limit', provider=provider.name):
+            ticket = await self._athrottle_admitted(provider, breaker, prompt, limit)
+        started = time.time()
+        try:
+            with deadline.attempt(provider.name, self._attempt_seconds(providers_left)) as attempt:
+                async with provider.aslot():
+                    started = time.time()
+                    with tracing.span('attempt', provider=provider.name):
+                        result = await provider.agenerate(prompt=prompt, max_tokens=limit, temperature=temperature)
+        except asyncio.CancelledError:
+            # A hedge loser says nothing about the provider; free a half-open
+            # trial for another request and hand back the unused tokens
+            if breaker is not None:
+                breaker.release()
+            if ticket is not None:
+                ticket.cancel()
+            raise
+        except Exception as e:
+            self._record_failure(provider, breaker, ticket, e, time.time() - started, attempt.out_of_time)
+            raise
+        self._record_success(provider, breaker, time.time() - started, result, ticket)
+        if limit != max_tokens:
+            result['clampedMaxTokens'] = limit
+        return result
+    
+    @staticmethod
+    def _observe_request(mode: str, started: float, result: Optional[Dict] = None,
+                         error: Optional[Exception] = None):
+        """Record a finished request's latency, labelled by how it ended."""
+        if error is not None:
+            outcome = metrics.error_class(error)
+        else:
+            outcome = 'cached' if result.get('cached') else 'success'
+        metrics.REQUEST_DURATION.observe(time.perf_counter() - started, mode, outcome)
+    
+    def _register_gauges(self):
+        """Gauges read at scrape time from this manager's state; admission may be rebuilt on reload."""
+        def queue_depths():
+            admission = self.admission
+            return admission.queue_depths() if admission is not None else {}
+        
+        def active():
+            admission = self.admission
+            return {(): admission.status()['active']} if admission is not None else {}
+        
+        metrics.REGISTRY.gauge('llm_admission_queue_depth', "Requests waiting for admission", ('class',), queue_depths)
+        metrics.REGISTRY.gauge('llm_admission_active', "Requests being served", (), active)
+    
+    def _resolve_deadline(self, timeout: Optional[float]) -> Optional[float]:
+        """
+        Seconds the request may take: the caller's timeout or the server
+        default, capped at settings.deadline.max_seconds. None when disabled.
+        """
+        settings = self.settings.get('deadline', {})
+        if not settings.get('enabled', True):
+            return None
+        if timeout is None:
+            timeout = settings.get('default_seconds', 30.0)
+        timeout = float(timeout)
+        if timeout <= 0:
+            raise ValueError("timeout must be positive")
+        return min(timeout, settings.get('max_seconds', 120.0))
+    
+    def _attempt_seconds(self, providers_left: int, budget: Optional[deadline.Deadline] = None) -> float:
+        """The current deadline's allotment for the next provider attempt."""
+        budget = budget or deadline.current()
+        if budget is None:
+            return 0.0
+        return budget.allot(providers_left, self.settings.get('deadline', {}).get('attempt_share', 0.5))
+    
+    @staticmethod
+    def _with_budget(result: Dict, budget: Optional[deadline.Deadline]) -> Dict:
+        """Report how the deadline was spent; cache hits never touched it."""
+        if budget is not None and not result.get('cached'):
+            result['budget'] = budget.report()
+        return result
+    
+    @staticmethod
+    def _all_failed(budget: Optional[deadline.Deadline] = None) -> Exception:
+        """The error for a request no provider answered."""
+        budget = budget or deadline.current()
+        if budget is not None and budget.expired():
+            return DeadlineExceededError(f"Request deadline of {budget.seconds:g}s exceeded before any provider answered")
+        return Exception("All providers failed to generate response")
+    
+    async def _acount_prompt(self, providers: List[LLMProvider], prompt: str):
+        """Warm the token counter for the tokenizers _fit_context will use."""
+        if not self.settings.get('context_window', {}).get('enabled', True):
+            return
+        specs = {provider.tokenizer_spec for provider in providers if provider.config.get('context_size')}
+        for spec in specs:
+            await self.token_counter.acount(prompt, spec)
+    
+    @staticmethod
+    def _completion_limit(provider: LLMProvider, max_tokens: int) -> int:
+        limits = _completion_limits.get()
+        return limits.get(provider.name, max_tokens) if limits else max_tokens
+    
+    def _fit_context(self, providers: List[LLMProvider], prompt: str, max_tokens: int):
+        """
+        Drop providers whose context window can't hold the prompt plus the
+        completion, after clamping the completion to each provider's own
+        max_tokens. The prompt is counted with each provider's tokenizer (once
+        per distinct tokenizer) and padded by a safety margin, since the count
+        only approximates what the provider sees.
+        
+        Returns:
+            Tuple of (providers that fit, clamped max_tokens by provider name
+            for those whose limit is below the request)
+        
+        Raises:
+            ContextWindowError: If no provider fits
+        """
+        settings = self.settings.get('context_window', {})
+        if not settings.get('enabled', True) or not providers:
+            return providers, {}
+        
+        margin = 1 + settings.get('prompt_token_margin', 0.1)
+        fitting = []
+        limits = {}
+        largest_prompt = 0
+        
+        for provider in providers:
+            provider_max = provider.config.get('max_tokens')
+            completion = min(max_tokens, provider_max) if provider_max else max_tokens
+            
+            context_size = provider.config.get('context_size')
+            if context_size:
+                # Memoised, so providers sharing a tokenizer share one count
+                prompt_tokens = math.ceil(provider.count_tokens(prompt) * margin)
+                largest_prompt = max(largest_prompt, prompt_tokens)
+            if context_size and prompt_tokens + completion > context_size:
+                logger.info(f"Skipping provider {provider.name}: ~{prompt_tokens} prompt + {completion} completion "
+                            f"tokens exceed its {context_size}-token context")
+                continue
+            
+            fitting.append(provider)
+            if completion != max_tokens:
+                limits[provider.name] = completion
+        
+        if not fitting:
+            raise ContextWindowError(
+                f"Prompt of ~{largest_prompt} tokens plus {max_tokens} completion tokens "
+                f"does not fit any provider's context window"
+            )
+        return fitting, limits
+    
+    def _record_success(self, provider: LLMProvider, breaker: Optional[CircuitBreaker], seconds: float, result: Dict,
+                        ticket: Optional[RateLimitTicket] = None):
+        """Feed a successful call into the latency, circuit, rate-limit and routing statistics."""
+        tokens = result.get('tokens', {})
+        if ticket is not None:
+            ticket.settle(tokens.get('total'))
+        self._latency_tracker(provider).record(seconds)
+        if breaker is not None:
+            breaker.record_success()
+        
+        completion = tokens.get('completion', 0)
+        metrics.ATTEMPT_DURATION.observe(seconds, provider.name, 'success')
+        metrics.TOKENS.inc(provider.name, 'prompt', amount=tokens.get('prompt', 0))
+        metrics.TOKENS.inc(provider.name, 'completion', amount=completion)
+        if completion and seconds > 0:
+            metrics.THROUGHPUT.observe(completion / seconds, provider.name)
+        
+        if self.router is not None:
+            cost = self._calculate_cost(provider, tokens)
+            self.router.record_success(provider.name, seconds, tokens.get('completion', 0), cost)
+    
+    def _record_failure(self, provider: LLMProvider, breaker: Optional[CircuitBreaker],
+                        ticket: Optional[RateLimitTicket] = None, error: Optional[Exception] = None,
+                        seconds: Optional[float] = None, out_of_time: bool = False):
+        """
+        Feed a failed call into the statistics. A call cut short by the
+        request's deadline (out_of_time), or rejected for the caller's own
+        mistake (a 4xx like bad parameters), says nothing about the provider's
+        health, so it doesn't count against its circuit or routing score.
+        """
+        # The request still counts against the provider's RPM, but its tokens weren't used
+        if ticket is not None:
+            ticket.cancel()
+        if error is not None:
+            error_class = metrics.error_class(error)
+            metrics.PROVIDER_ERRORS.inc(provider.name, error_class)
+            if seconds is not None:
+                metrics.ATTEMPT_DURATION.observe(seconds, provider.name, error_class)
+        if out_of_time or (error is not None and is_caller_error(error)):
+            if breaker is not None:
+                breaker.release()
+            return
+        if breaker is not None:
+            breaker.record_failure()
+        if self.router is not None:
+            self.router.record_failure(provider.name)
+    
+    def _route(self, providers: List[LLMProvider], max_tokens: int) -> List[LLMProvider]:
+        """Order a snapshot of the providers for one request of up to max_tokens completion tokens."""
+        if self.router is None:
+            return providers
+        with tracing.span('route'):
+            return self.router.order(providers, max_tokens)
+    
+    def _breaker(self, provider: LLMProvider) -> Optional[CircuitBreaker]:
+        """The provider's circuit breaker, or None when breakers are disabled."""
+        settings = dict(self.settings.get('circuit_breaker', {}))
+        if not settings.pop('enabled', True):
+            return None
+        breaker = self.breakers.get(provider.name)
+        if breaker is None:
+            breaker = self.breakers.setdefault(provider.name, CircuitBreaker(name=provider.name, **settings))
+        return breaker
+    
+    def _admit(self, provider: LLMProvider) -> Optional[CircuitBreaker]:
+        """
+        Fail fast if the provider's circuit is open; otherwise return its
+        breaker. Checked before the rate limiter, so an open circuit neither
+        waits for nor spends the provider's request budget.
+        """
+        breaker = self._breaker(provider)
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError(f"Skipping provider {provider.name}: circuit open")
+        return breaker
+    
+    def _throttle_admitted(self, provider: LLMProvider, breaker: Optional[CircuitBreaker], prompt: str,
+                           max_tokens: int) -> Optional[RateLimitTicket]:
+        """
+        _throttle() for a call the breaker has admitted. If the call never goes
+        out, the breaker's half-open trial is handed back for another request.
+        """
+        try:
+            return self._throttle(provider, prompt, max_tokens)
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+    
+    async def _athrottle_admitted(self, provider: LLMProvider, breaker: Optional[CircuitBreaker], prompt: str,
+                                  max_tokens: int) -> Optional[RateLimitTicket]:
+        """Async counterpart of _throttle_admitted()."""
+        try:
+            return await self._athrottle(provider, prompt, max_tokens)
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+    
+    def _throttle(self, provider: LLMProvider, prompt: str, max_tokens: int) -> Optional[RateLimitTicket]:
+        """
+        Reserve the provider's rate-limit capacity for a call, charging the
+        prompt's tokens plus the whole completion until the real usage is known.
+        
+        Raises:
+            RateLimitedError: If the request should skip this provider
+        """
+        limiter = self.rate_limiters.get(provider.name)
+        if limiter is None:
+            return None
+        return limiter.acquire(provider.count_tokens(prompt) + max_tokens)
+    
+    async def _athrottle(self, provider: LLMProvider, prompt: str, max_tokens: int) -> Optional[RateLimitTicket]:
+        """Async counterpart of _throttle()."""
+        limiter = self.rate_limiters.get(provider.name)
+        if limiter is None:
+            return None
+        return await limiter.aacquire(provider.count_tokens(prompt) + max_tokens)
+    
+    def _latency_tracker(self, provider: LLMProvider) -> LatencyTracker:
+        tracker = self.latency.get(provider.name)
+        if tracker is None:
+            tracker = self.latency.setdefault(provider.name, LatencyTracker())
+        return tracker
+    
+    def _hedging_enabled(self, providers: List[LLMProvider]) -> bool:
+        return len(providers) > 1 and self.settings.get('hedging', {}).get('enabled', False)
+    
+    def _hedge_delay(self, provider: LLMProvider) -> Optional[float]:
+        """
+        How long to wait on a provider before hedging with the next one:
+        the configured percentile of its observed latency. None until enough
+        samples exist.
+        """
+        hedging = self.settings.get('hedging', {})
+        tracker = self.latency.get(provider.name)
+        if tracker is None or tracker.count < hedging.get('min_samples', 20):
+            return None
+        
+        delay = tracker.percentile(hedging.get('percentile', 95))
+        return max(delay, hedging.get('min_delay', 0.05))
+    
+    def _hedge_wait(self, queue: List[LLMProvider], pending: Dict) -> Optional[float]:
+        """How long to wait for the attempts in flight before hedging or giving up."""
+        timeout = None
+        if queue and len(pending) == 1:
+            timeout = self._hedge_delay(next(iter(pending.values())))
+        left = deadline.remaining()
+        if left is not None:
+            timeout = left if timeout is None else min(timeout, left)
+        return timeout
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    max_workers = self.settings.get('hedging', {}).get('max_workers', 32)
+                    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        return self._executor
+    
+    def _get_batch_executor(self) -> ThreadPoolExecutor:
+        # Separate from the hedging pool so batch items waiting on hedges can't starve it
+        if self._batch_executor is None:
+            with self._executor_lock:
+                if self._batch_executor is None:
+                    max_workers = self.settings.get('batch', {}).get('max_workers', 16)
+                    self._batch_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch')
+        return self._batch_executor
+    
+    def _generate_hedged(self, providers: List[LLMProvider], prompt: str,
+                         max_tokens: int, temperature: float) -> Dict:
+        """
+        Try providers in priority order, starting the next one in parallel
+        whenever the one in flight runs past its hedge delay. The first success
+        wins; the other attempt is abandoned and logged as a hedge loser.
+        """
+        executor = self._get_executor()
+        queue = list(providers)
+        pending = {}
+        hedged = False
+        
+        def launch():
+            provider = queue.pop(0)
+            logger.info(f"Attempting to generate with provider: {provider.name}")
+            context = contextvars.copy_context()
+            future = executor.submit(context.run, self._timed_generate, provider, prompt, max_tokens, temperature,
+                                     len(queue) + 1)
+            pending[future] = provider
+        
+        launch()
+        while pending:
+            timeout = self._hedge_wait(queue, pending)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            
+            if not done and (not queue or deadline.remaining() == 0):
+                # Threads can't be interrupted; whatever is still running is abandoned
+                for loser_future, loser in pending.items():
+                    loser_future.cancel()
+                    loser_future.add_done_callback(partial(self._log_hedge_loser, loser))
+                break
+            
+            if not done:
+                hedged = True
+                logger.info(f"Hedging slow provider {next(iter(pending.values())).name} with {queue[0].name}")
+                launch()
+                continue
+            
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                    metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                    continue
+                
+                # Threads can't be interrupted; the losing call is logged whenever it ends
+                for loser_future, loser in pending.items():
+                    loser_future.cancel()
+                    loser_future.add_done_callback(partial(self._log_hedge_loser, loser))
+                
+                if hedged:
+                    result['hedged'] = True
+                return self._finish(provider, result)
+            
+            if not pending and queue:
+                launch()
+        
+        raise self._all_failed()
+    
+    async def _agenerate_hedged(self, providers: List[LLMProvider], prompt: str,
+                                max_tokens: int, temperature: float) -> Dict:
+        """Async counterpart of _generate_hedged(); the loser is cancelled outright."""
+        queue = list(providers)
+        pending = {}
+        hedged = False
+        
+        def launch():
+            provider = queue.pop(0)
+            logger.info(f"Attempting to generate with provider: {provider.name}")
+            task = asyncio.ensure_future(
+                self._atimed_generate(provider, prompt, max_tokens, temperature, len(queue) + 1)
+            )
+            pending[task] = provider
+        
+        launch()
+        while pending:
+            timeout = self._hedge_wait(queue, pending)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            
+            if not done and (not queue or deadline.remaining() == 0):
+                for loser_task, loser in pending.items():
+                    loser_task.cancel()
+                    loser_task.add_done_callback(partial(self._log_hedge_loser, loser))
+                break
+            
+            if not done:
+                hedged = True
+                logger.info(f"Hedging slow provider {next(iter(pending.values())).name} with {queue[0].name}")
+                launch()
+                continue
+            
+            for task in done:
+                provider = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning(f"Provider {provider.name} failed: {str(e)}")
+                    metrics.FALLBACKS.inc(provider.name, metrics.error_class(e))
+                    continue
+                
+                for loser_task, loser in pending.items():
+                    loser_task.cancel()
+                    loser_task.add_done_callback(partial(self._log_hedge_loser, loser))
+                
+                if hedged:
+                    result['hedged'] = True
+                return self._finish(provider, result)
+            
+            if not pending and queue:
+                launch()
+        
+        raise self._all_failed()
+    
+    def _log_hedge_loser(self, provider: LLMProvider, future):
+        """Record the outcome of the abandoned side of a hedged request."""
+        record = {
+            "modelUsed": provider.name,
+            "hedged": True,
+            "cost": 0.0,
+            "tokens": {"prompt": 0, "completion": 0, "total": 0}
+        }
+        
+        if future.cancelled():
+            record['hedgeOutcome'] = 'cancelled'
+        elif future.exception() is not None:
+            record['hedgeOutcome'] = 'failed'
+        else:
+            # It finished anyway, so we paid for it
+            result = future.result()
+            record['hedgeOutcome'] = 'lost'
+            record['response'] = result.get('response')
+            record['tokens'] = result.get('tokens', record['tokens'])
+            record['cost'] = self._calculate_cost(provider, record['tokens'])
+        
+        self._log_usage(record)
+    
+    def _calculate_cost(self, provider: LLMProvider, token_info: Dict) -> float:
+        with tracing.span('cost'):
+            return calculate_cost(
+                provider_name=provider.name,
+                prompt_tokens=token_info.get('prompt', 0),
+                completion_tokens=token_info.get('completion', 0),
+                provider_config=provider.config
+            )
+    
+    def _finish(self, provider: LLMProvider, result: Dict) -> Dict:
+        """Attach cost and provider to a successful result and log its usage."""
+        # Calculate cost
+        token_info = result.get('tokens', {})
+        cost = self._calculate_cost(provider, token_info)
+        
+        # Add cost to result
+        result['cost'] = cost
+        result['modelUsed'] = provider.name
+        
+        # Log usage
+        self._log_usage(result)
+        
+        logger.info(f"Successfully generated with {provider.name}. "
+                   f"Tokens: {token_info.get('total', 0)}, Cost: ${cost:.6f}")
+        
+        return result
+    
+    def _log_usage(self, result: Dict):
+        """Queue usage data for the usage store."""
+        try:
+            # Add timestamp
+            result['timestamp'] = time.time()
+            
+            batch = _usage_batch.get()
+            if batch is not None:
+                # Snapshot now; callers keep mutating the result they return
+                batch.append(copy.deepcopy(result))
+            else:
+                with tracing.span('usage_log'):
+                    self.usage_store.append(result)
                 
         except Exception as e:
             logger.error(f"Failed to log usage: {str(e)}")
     
     def get_provider_status(self) -> List[Dict]:
         """Get status of all providers."""
-        return [
-            {
+        statuses = []
+        for provider in self.providers:
+            status = {
                 "name": provider.name,
                 "enabled": provider.config.get('enabled', True),
                 "priority": provider.priority
             }
-            for provider in self.providers
-        ]
\ No newline at end of file
+            breaker = self._breaker(provider)
+            if breaker is not None:
+                status['circuit'] = breaker.status()
+            if self.router is not None:
+                status['routing'] = self.router.estimates(provider.name)
+            limiter = self.rate_limiters.get(provider.name)
+            if limiter is not None:
+                status['rateLimit'] = limiter.status()
+            status['tokenizer'] = {
+                "spec": provider.tokenizer_spec,
+                "state": self.token_counter.readiness(provider.tokenizer_spec)
+            }
+            statuses.append(status)
+        return statuses
+    
+    def tokenizers_ready(self) -> bool:
+        """Whether every provider's tokenizer has finished loading (or given up)."""
+        return all(self.token_counter.readiness(p.tokenizer_spec) != LOADING for p in self.providers)
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Per-Provider Runtime Statistics
+"""
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyTracker:
+    """Rolling window of a provider's recent successful call latencies."""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    @property
+    def count(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """
+        Latency at the given percentile of the window.
+
+        Args:
+            pct: Percentile between 0 and 100
+
+        Returns:
+            Latency in seconds, or None if nothing has been recorded yet
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+
+        rank = max(0, min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1)))))
+        return samples[rank]
+
+
+class EwmaStats:
+    """Exponentially weighted estimates of a provider's latency, throughput, cost and error rate."""
+
+    # Spread in completion lengths (as a share of the mean) needed before the
+    # fixed and per-token parts of the latency are told apart
+    MIN_TOKEN_SPREAD = 0.1
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency = None  # seconds per successful call
+        self.throughput = None  # completion tokens per second
+        self.tokens = None  # completion tokens per successful call
+        # Second moments (tokens squared, tokens x seconds) for fitting latency against length
+        self.tokens_sq = None
+        self.tokens_seconds = None
+        self.cost = None  # USD per successful call
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def _blend(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return current + self.alpha * (value - current)
+
+    def record_success(self, seconds: float, completion_tokens: int, cost: float, now: float):
+        with self._lock:
+            self.latency = self._blend(self.latency, seconds)
+            if completion_tokens and seconds > 0:
+                self.throughput = self._blend(self.throughput, completion_tokens / seconds)
+            tokens = completion_tokens or 0
+            self.tokens = self._blend(self.tokens, tokens)
+            self.tokens_sq = self._blend(self.tokens_sq, tokens * tokens)
+            self.tokens_seconds = self._blend(self.tokens_seconds, tokens * seconds)
+            self.cost = self._blend(self.cost, cost)
+            self.error_rate = self._blend(self.error_rate, 0.0)
+            self.samples += 1
+            self.updated_at = now
+
+    def expected_latency(self, completion_tokens: Optional[int] = None) -> Optional[float]:
+        """
+        Seconds a successful call producing completion_tokens should take:
+        a fixed overhead (queueing, time to first token) plus the tokens at
+        the provider's generation rate. Both parts are fitted from recent
+        calls of different lengths; until there are some, the whole-call
+        throughput scales the average latency. Without completion_tokens,
+        the average call latency.
+        """
+        with self._lock:
+            latency, tokens = self.latency, self.tokens
+            if latency is None or not completion_tokens or not tokens:
+                return latency
+
+            seconds_per_token = None
+            variance = self.tokens_sq - tokens * tokens
+            if variance > (self.MIN_TOKEN_SPREAD * tokens) ** 2:
+                covariance = self.tokens_seconds - tokens * latency
+                if covariance > 0:
+                    seconds_per_token = covariance / variance
+            if seconds_per_token is None:
+                if not self.throughput:
+                    return latency
+                seconds_per_token = 1.0 / self.throughput
+
+        overhead = max(0.0, latency - seconds_per_token * tokens)
+        return overhead + seconds_per_token * completion_tokens
+
+    def record_failure(self, now: float):
+        with self._lock:
+            self.error_rate = self._blend(self.error_rate, 1.0)
+            self.samples += 1
+            self.updated_at = now
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "latency": self.latency,
+                "throughput": self.throughput,
+                "tokens": self.tokens,
+                "tokensSq": self.tokens_sq,
+                "tokensSeconds": self.tokens_seconds,
+                "cost": self.cost,
+                "errorRate": self.error_rate,
+                "samples": self.samples,
+                "updatedAt": self.updated_at
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict, alpha: float = 0.2) -> 'EwmaStats':
+        stats = cls(alpha=alpha)
+        stats.latency = data.get('latency')
+        stats.throughput = data.get('throughput')
+        stats.tokens = data.get('tokens')
+        stats.tokens_sq = data.get('tokensSq')
+        stats.tokens_seconds = data.get('tokensSeconds')
+        stats.cost = data.get('cost')
+        stats.error_rate = data.get('errorRate', 0.0)
+        stats.samples = data.get('samples', 0)
+        stats.updated_at = data.get('updatedAt', 0.0)
+        return stats
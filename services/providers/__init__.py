@@ -1,14 +1,28 @@
 """
 Provider package initialization file
+
+Provider modules are imported on first access, so importing one provider (or
+this package) doesn't pay for the others and their dependencies.
 """
-# Import all provider classes for easy access
-from services.providers.openai_provider import OpenaiProvider
-from services.providers.huggingface_provider import HuggingfaceProvider
-from services.providers.llama_provider import LlamaProvider
-
-# List of available provider classes
-AVAILABLE_PROVIDERS = {
-    'openai': OpenaiProvider,
-    'huggingface': HuggingfaceProvider,
-    'llama': LlamaProvider
-}
\ No newline at end of file
+import importlib
+
+# Provider type -> (module, class name) of the available provider classes
+_PROVIDER_CLASSES = {
+    'groq': ('services.providers.groq_provider', 'GroqProvider'),
+    'huggingface': ('services.providers.huggingface_provider', 'HuggingfaceProvider'),
+    'llama': ('services.providers.llama_provider', 'LlamaProvider')
+}
+
+def get_provider_class(provider_type: str):
+    """Import and return the provider class for a provider type."""
+    module_name, class_name = _PROVIDER_CLASSES[provider_type]
+    return getattr(importlib.import_module(module_name), class_name)
+
+def __getattr__(name):
+    # Keep `from services.providers import GroqProvider` and AVAILABLE_PROVIDERS working
+    if name == 'AVAILABLE_PROVIDERS':
+        return {provider_type: get_provider_class(provider_type) for provider_type in _PROVIDER_CLASSES}
+    for provider_type, (_, class_name) in _PROVIDER_CLASSES.items():
+        if name == class_name:
+            return get_provider_class(provider_type)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,8 @@
+import json
 import time
 import os
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, Generator
+from services.http_pool import HttpPool
 from services.llm_provider import LLMProvider
 from utils.logger import get_logger
 
@@ -21,8 +22,10 @@ class GroqProvider(LLMProvider):
         self.api_url = config.get("endpoint", "https://api.groq.com/openai/v1/chat/completions")
         self.retry_count = config.get("retry_count", 3)
         self.timeout = config.get("timeout", 10)
+        self.http = HttpPool(config.get("pool"), name=self.name)
 
-    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    def _build_request(self, prompt: str, max_tokens: int, temperature: float,
+                       stream: bool = False) -> Dict[str, Any]:
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
@@ -35,46 +38,106 @@ class GroqProvider(LLMProvider):
             "temperature": temperature
         }
 
-        retries = 0
-        last_error = None
+        if stream:
+            data["stream"] = True
+            data["stream_options"] = {"include_usage": True}
+
+        return {"headers": headers, "json": data}
+
+    def _parse_response(self, result: Dict, start_time: float, reused: bool) -> Dict[str, Any]:
+        message = result.get("choices", [{}])[0].get("message", {}).get("content", "")
+
+        usage = result.get("usage", {})
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        total_tokens = usage.get("total_tokens", prompt_tokens + completion_tokens)
+
+        duration = time.time() - start_time
+
+        return {
+            "response": message,
+            "tokens": {
+                "prompt": prompt_tokens,
+                "completion": completion_tokens,
+                "total": total_tokens
+            },
+            "time": duration,
+            "connectionReused": reused
+        }
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+
         start_time = time.time()
 
-        while retries <= self.retry_count:
+        def attempt():
+            response, reused = self.http.post(self.api_url, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), start_time, reused)
+
+        return self.retry_policy.run(attempt, "Groq")
+
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+
+        start_time = time.time()
+
+        async def attempt():
+            response, reused = await self.http.apost(self.api_url, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), start_time, reused)
+
+        return await self.retry_policy.arun(attempt, "Groq")
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float) -> Generator[str, None, Dict[str, Any]]:
+        request = self._build_request(prompt, max_tokens, temperature, stream=True)
+
+        retry = self.retry_policy.session("Groq")
+        start_time = time.time()
+
+        while True:
+            sent = False
             try:
-                response = requests.post(self.api_url, headers=headers, json=data, timeout=self.timeout)
-                response.raise_for_status()
-                result = response.json()
-
-                message = result.get("choices", [{}])[0].get("message", {}).get("content", "")
-
-                usage = result.get("usage", {})
-                prompt_tokens = usage.get("prompt_tokens", 0)
-                completion_tokens = usage.get("completion_tokens", 0)
-                total_tokens = usage.get("total_tokens", prompt_tokens + completion_tokens)
-
-                duration = time.time() - start_time
-
-                return {
-                    "response": message,
-                    "tokens": {
-                        "prompt": prompt_tokens,
-                        "completion": completion_tokens,
-                        "total": total_tokens
-                    },
-                    "time": duration
-                }
-
-            except requests.exceptions.RequestException as e:
-                last_error = str(e)
-                logger.warning(f"Groq API request failed (attempt {retries + 1}/{self.retry_count + 1}): {last_error}")
-                retries += 1
-                if retries <= self.retry_count:
-                    time.sleep(2 ** retries * 0.5)
-
-        raise Exception(f"Groq provider failed after {self.retry_count + 1} attempts: {last_error}")
-    def count_tokens(self, prompt: str) -> int:
-        """
-        Estimate the number of tokens in the prompt.
-        This is a rough estimate assuming 1 token ≈ 4 characters.
-        """
-        return len(prompt) // 4
+                with self.http.stream(self.api_url, timeout=self.request_timeout(), **request) as (response, reused):
+                    response.raise_for_status()
+
+                    # Server-sent events: "data: {chunk}" lines, ending with "data: [DONE]"
+                    parts = []
+                    usage = None
+                    for line in response.iter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        payload = line[len("data:"):].strip()
+                        if payload == "[DONE]":
+                            break
+                        chunk = json.loads(payload)
+                        choices = chunk.get("choices") or [{}]
+                        text = choices[0].get("delta", {}).get("content") or ""
+                        if text:
+                            parts.append(text)
+                            sent = True
+                            yield text
+                        usage = chunk.get("usage") or chunk.get("x_groq", {}).get("usage") or usage
+
+                message = "".join(parts)
+                if usage is None:
+                    usage = {
+                        "prompt_tokens": self.count_tokens(prompt),
+                        "completion_tokens": self.count_tokens(message)
+                    }
+                result = {"choices": [{"message": {"content": message}}], "usage": usage}
+                return self._parse_response(result, start_time, reused)
+
+            except Exception as e:
+                # Text already relayed can't be taken back, so only retry before the first chunk
+                if sent:
+                    raise
+                retry.failed(e)
+
+    def close(self):
+        self.http.close()
+
+    @classmethod
+    def default_tokenizer(cls, config: Dict) -> str:
+        # Groq doesn't publish its tokenizers; cl100k is a close stand-in for Llama 3
+        return "tiktoken:cl100k_base"
@@ -1,13 +1,12 @@
-import time
-import requests
-from typing import Dict, Any
-from transformers import AutoTokenizer, logging as hf_logging
+from typing import Dict, Any, Optional
 
+import httpx
+
+from services.http_pool import HttpPool
 from services.llm_provider import LLMProvider
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
-hf_logging.set_verbosity_error()  # Suppress HF warnings
 
 
 class HuggingfaceProvider(LLMProvider):
@@ -23,23 +22,14 @@ class HuggingfaceProvider(LLMProvider):
 
         self.retry_count = config.get('retry_count', 3)
         self.timeout = config.get('timeout', 10)
+        self.http = HttpPool(config.get('pool'), name=self.name)
 
-        # Load tokenizer for accurate token count
-        try:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model)
-        except Exception as e:
-            logger.warning(f"Failed to load tokenizer for model {self.model}. Falling back to estimate. Error: {e}")
-            self.tokenizer = None
-
-    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    def _build_request(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
 
-        api_url = f"https://api-inference.huggingface.co/models/{self.model}"
-        prompt_tokens = self.count_tokens(prompt)
-
         data = {
             "inputs": prompt,
             "parameters": {
@@ -49,55 +39,71 @@ class HuggingfaceProvider(LLMProvider):
             }
         }
 
-        retries = 0
-        last_error = None
-
-        while retries <= self.retry_count:
-            try:
-                response = requests.post(api_url, headers=headers, json=data, timeout=self.timeout)
-                response.raise_for_status()
-                result = response.json()
-
-                # Extract response text
-                if isinstance(result, list) and "generated_text" in result[0]:
-                    completion_text = result[0]["generated_text"]
-                elif isinstance(result, dict) and "generated_text" in result:
-                    completion_text = result["generated_text"]
-                else:
-                    completion_text = str(result)
-
-                completion_tokens = self.count_tokens(completion_text)
-                total_tokens = prompt_tokens + completion_tokens
-
-                return {
-                    "response": completion_text,
-                    "tokens": {
-                        "prompt": prompt_tokens,
-                        "completion": completion_tokens,
-                        "total": total_tokens
-                    }
-                }
-
-            except Exception as e:
-                last_error = str(e)
-                logger.warning(f"Hugging Face API request failed (attempt {retries + 1}/{self.retry_count + 1}): {last_error}")
-                retries += 1
-
-                if retries <= self.retry_count:
-                    time.sleep(2 ** retries * 0.5)
-                    if "is currently loading" in last_error.lower():
-                        time.sleep(5)
-
-        raise Exception(f"Hugging Face provider failed after {self.retry_count + 1} attempts: {last_error}")
-
-    def count_tokens(self, text: str) -> int:
-        """Count tokens using actual model tokenizer."""
+        return {"headers": headers, "json": data}
+
+    def _parse_response(self, result: Any, prompt_tokens: int, reused: bool) -> Dict[str, Any]:
+        # Extract response text
+        if isinstance(result, list) and "generated_text" in result[0]:
+            completion_text = result[0]["generated_text"]
+        elif isinstance(result, dict) and "generated_text" in result:
+            completion_text = result["generated_text"]
+        else:
+            completion_text = str(result)
+
+        completion_tokens = self.count_tokens(completion_text)
+        total_tokens = prompt_tokens + completion_tokens
+
+        return {
+            "response": completion_text,
+            "tokens": {
+                "prompt": prompt_tokens,
+                "completion": completion_tokens,
+                "total": total_tokens
+            },
+            "connectionReused": reused
+        }
+
+    @property
+    def api_url(self) -> str:
+        # An explicit endpoint points at a dedicated Inference Endpoint or a local stub
+        return self.config.get('endpoint') or f"https://api-inference.huggingface.co/models/{self.model}"
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+        prompt_tokens = self.count_tokens(prompt)
+
+        def attempt():
+            response, reused = self.http.post(self.api_url, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), prompt_tokens, reused)
+
+        return self.retry_policy.run(attempt, "Hugging Face")
+
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+        prompt_tokens = self.count_tokens(prompt)
+
+        async def attempt():
+            response, reused = await self.http.apost(self.api_url, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), prompt_tokens, reused)
+
+        return await self.retry_policy.arun(attempt, "Hugging Face")
+
+    def retry_hint(self, error: Exception) -> Optional[float]:
+        # A cold model answers 503 {"error": "... is currently loading", "estimated_time": 20.0}
+        if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code != 503:
+            return None
         try:
-            if self.tokenizer:
-                return len(self.tokenizer.encode(text, add_special_tokens=False))
-            else:
-                # Fallback estimate
-                return max(len(text.split()) * 3 // 4, 1)
-        except Exception as e:
-            logger.error(f"Token counting failed: {e}")
-            return 1
+            estimated_time = error.response.json().get('estimated_time')
+        except ValueError:
+            return None
+        return float(estimated_time) if isinstance(estimated_time, (int, float)) else None
+
+    def close(self):
+        self.http.close()
+
+    @classmethod
+    def default_tokenizer(cls, config: Dict) -> str:
+        # The model's own tokenizer, loaded by the token counter on first use
+        return f"hf:{config.get('model', 'google/flan-t5-base')}"
@@ -1,7 +1,7 @@
-import time
-import requests
-from typing import Dict, Any
+import json
+from typing import Dict, Any, Generator
 
+from services.http_pool import HttpPool
 from services.llm_provider import LLMProvider
 from utils.logger import get_logger
 
@@ -14,8 +14,10 @@ class LlamaProvider(LLMProvider):
         super().__init__(config)
         self.endpoint = config.get('endpoint', 'http://localhost:11434/api/generate')
         self.model = config.get('model', 'llama2')
+        self.http = HttpPool(config.get('pool'), name=self.name)
 
-    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+    def _build_request(self, prompt: str, max_tokens: int, temperature: float,
+                       stream: bool = False) -> Dict[str, Any]:
         headers = {
             "Content-Type": "application/json"
         }
@@ -23,53 +25,96 @@ class LlamaProvider(LLMProvider):
         data = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False,
+            "stream": stream,
             "options": {
                 "temperature": temperature,
                 "num_predict": max_tokens
             }
         }
 
+        return {"headers": headers, "json": data}
+
+    def _parse_response(self, result: Dict, prompt_tokens: int, reused: bool) -> Dict[str, Any]:
+        completion_text = result.get('response', '')
+
+        # Estimate tokens since Ollama doesn't return token counts
+        completion_tokens = self.count_tokens(completion_text)
+        total_tokens = prompt_tokens + completion_tokens
+
+        return {
+            "response": completion_text,
+            "tokens": {
+                "prompt": prompt_tokens,
+                "completion": completion_tokens,
+                "total": total_tokens
+            },
+            "connectionReused": reused
+        }
+
+    def generate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+        prompt_tokens = self.count_tokens(prompt)
+
+        def attempt():
+            response, reused = self.http.post(self.endpoint, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), prompt_tokens, reused)
+
+        return self.retry_policy.run(attempt, "Ollama")
+
+    async def agenerate(self, prompt: str, max_tokens: int, temperature: float) -> Dict[str, Any]:
+        request = self._build_request(prompt, max_tokens, temperature)
+        prompt_tokens = self.count_tokens(prompt)
+
+        async def attempt():
+            response, reused = await self.http.apost(self.endpoint, timeout=self.request_timeout(), **request)
+            response.raise_for_status()
+            return self._parse_response(response.json(), prompt_tokens, reused)
+
+        return await self.retry_policy.arun(attempt, "Ollama")
+
+    def stream(self, prompt: str, max_tokens: int, temperature: float) -> Generator[str, None, Dict[str, Any]]:
+        request = self._build_request(prompt, max_tokens, temperature, stream=True)
         prompt_tokens = self.count_tokens(prompt)
 
-        retries = 0
-        last_error = None
+        retry = self.retry_policy.session("Ollama")
 
-        while retries <= self.retry_count:
+        while True:
+            sent = False
             try:
-                response = requests.post(
-                    self.endpoint,
-                    headers=headers,
-                    json=data,
-                    timeout=self.timeout
-                )
-
-                response.raise_for_status()
-                result = response.json()
-
-                completion_text = result.get('response', '')
-
-                # Estimate tokens since Ollama doesn't return token counts
-                completion_tokens = self.count_tokens(completion_text)
-                total_tokens = prompt_tokens + completion_tokens
-
-                return {
-                    "response": completion_text,
-                    "tokens": {
-                        "prompt": prompt_tokens,
-                        "completion": completion_tokens,
-                        "total": total_tokens
-                    }
-                }
+                with self.http.stream(self.endpoint, timeout=self.request_timeout(), **request) as (response, reused):
+                    response.raise_for_status()
+
+                    # Ollama streams one JSON object per line; the last has done=true
+                    parts = []
+                    final = {}
+                    for line in response.iter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        text = chunk.get('response', '')
+                        if text:
+                            parts.append(text)
+                            sent = True
+                            yield text
+                        if chunk.get('done'):
+                            final = chunk
+                            break
+
+                result = self._parse_response({"response": ''.join(parts)}, prompt_tokens, reused)
+                # The final chunk carries real token counts when Ollama reports them
+                if 'eval_count' in final:
+                    tokens = result['tokens']
+                    tokens['prompt'] = final.get('prompt_eval_count', tokens['prompt'])
+                    tokens['completion'] = final['eval_count']
+                    tokens['total'] = tokens['prompt'] + tokens['completion']
+                return result
 
             except Exception as e:
-                last_error = str(e)
-                logger.warning(f"Ollama request failed (attempt {retries+1}/{self.retry_count+1}): {last_error}")
-                retries += 1
-                time.sleep(2 ** retries * 0.5)
-
-        raise Exception(f"Ollama provider failed after {self.retry_count+1} attempts: {last_error}")
+                # Text already relayed can't be taken back, so only retry before the first chunk
+                if sent:
+                    raise
+                retry.failed(e)
 
-    def count_tokens(self, text: str) -> int:
-        words = text.split()
-        return len(words) * 4 // 3 or 1
+    def close(self):
+        self.http.close()
@@ -0,0 +1,210 @@
+"""
+Per-Provider Rate Limiter
+
+Token buckets for a provider's requests-per-minute and tokens-per-minute
+limits, so requests are held back or routed elsewhere before the provider
+starts answering 429. A request reserves its estimated tokens up front and
+the reservation is reconciled with the real usage once the call finishes.
+Capacity reserved ahead of time puts later requests behind earlier ones, so
+waiting requests are served in arrival order.
+"""
+import asyncio
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from services import deadline
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+WAIT = 'wait'
+SKIP = 'skip'
+
+
+class RateLimitedError(Exception):
+    """Raised instead of calling a provider that is over its rate limit."""
+    pass
+
+
+class TokenBucket:
+    """Refills continuously up to a per-minute capacity; reservations may overdraw it."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available; call refill() first."""
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def adjust(self, amount: float):
+        """Take amount (or give it back, if negative)."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimitTicket:
+    """A request's reservation against its provider's limits."""
+
+    def __init__(self, limiter: 'RateLimiter', tokens: int, waited: float):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.waited = waited
+        self._settled = False
+
+    def settle(self, actual_tokens: Optional[int]):
+        """Replace the estimate with the tokens the call really used."""
+        if self._settled:
+            return
+        self._settled = True
+        if actual_tokens is not None:
+            self.limiter._adjust_tokens(actual_tokens - self.tokens)
+
+    def cancel(self):
+        """Give the reserved tokens back for a call that didn't go ahead."""
+        self.settle(0)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits for one provider in this process."""
+
+    def __init__(
+        self,
+        name: str = 'provider',
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        on_limit: str = WAIT,
+        max_wait: float = 2.0,
+        max_queue: int = 8
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            name: Provider name, used in messages
+            rpm: Requests per minute, or None for no request limit
+            tpm: Tokens (prompt + completion) per minute, or None for no token limit
+            on_limit: 'wait' to queue for the next free slot, 'skip' to move
+                straight on to the next provider
+            max_wait: Longest a request queues; a longer wait skips instead
+            max_queue: Most requests queued at once; further ones skip
+        """
+        if on_limit not in (WAIT, SKIP):
+            raise ValueError(f"on_limit must be '{WAIT}' or '{SKIP}', not '{on_limit}'")
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.on_limit = on_limit
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._waiting = 0
+        self._skipped = 0
+        self._lock = threading.Lock()
+
+    def inherit(self, previous: Optional['RateLimiter']):
+        """
+        Continue from the bucket levels of the limiter this one replaces (on a
+        config reload), so rebuilding a provider doesn't hand it a fresh
+        minute's worth of capacity. Levels are capped at the new limits.
+        """
+        if previous is None:
+            return
+        now = time.monotonic()
+        with previous._lock:
+            levels = []
+            for bucket in (previous.requests, previous.tokens):
+                if bucket is not None:
+                    bucket.refill(now)
+                levels.append(bucket.level if bucket is not None else None)
+        with self._lock:
+            for bucket, level in zip((self.requests, self.tokens), levels):
+                if bucket is not None and level is not None:
+                    bucket.level = min(bucket.capacity, level)
+                    bucket.updated = now
+
+    def _reserve(self, tokens: int) -> Tuple[RateLimitTicket, float]:
+        """Reserve capacity for one request and return how long it must wait for it."""
+        now = time.monotonic()
+        with self._lock:
+            if self.tokens is not None:
+                # A request bigger than the whole bucket waits for a full one instead of forever
+                tokens = min(tokens, int(self.tokens.capacity))
+            charges = [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+                       if bucket is not None]
+
+            wait = 0.0
+            for bucket, amount in charges:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(amount))
+
+            if wait > 0:
+                max_wait = self.max_wait
+                left = deadline.remaining()
+                if left is not None:
+                    max_wait = min(max_wait, left)
+                if self.on_limit == SKIP or self._waiting >= self.max_queue or wait > max_wait:
+                    self._skipped += 1
+                    raise RateLimitedError(f"Skipping provider {self.name}: rate limit reached "
+                                           f"(next slot in {wait:.2f}s)")
+                self._waiting += 1
+
+            for bucket, amount in charges:
+                bucket.adjust(amount)
+            return RateLimitTicket(self, tokens, wait), wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self._waiting -= 1
+
+    def _adjust_tokens(self, amount: int):
+        if self.tokens is not None:
+            with self._lock:
+                self.tokens.refill(time.monotonic())
+                self.tokens.adjust(amount)
+
+    def acquire(self, tokens: int) -> RateLimitTicket:
+        """
+        Reserve one request and an estimated number of tokens, waiting for
+        capacity if configured to.
+
+        Raises:
+            RateLimitedError: If the request should go to another provider instead
+        """
+        ticket, wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                time.sleep(wait)
+            finally:
+                self._done_waiting()
+        return ticket
+
+    async def aacquire(self, tokens: int) -> RateLimitTicket:
+        """Async counterpart of acquire()."""
+        ticket, wait = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                ticket.cancel()
+                raise
+            finally:
+                self._done_waiting()
+        return ticket
+
+    def status(self) -> Dict:
+        """Remaining capacity and queue counters for status reporting."""
+        now = time.monotonic()
+        with self._lock:
+            status = {"onLimit": self.on_limit, "queued": self._waiting, "skipped": self._skipped}
+            for key, bucket in (('rpm', self.requests), ('tpm', self.tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    status[key] = {"limit": int(bucket.capacity), "available": int(bucket.level)}
+            return status
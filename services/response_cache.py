@@ -0,0 +1,182 @@
+"""
+Exact-Match Response Cache
+
+Caches generation results keyed on the normalised prompt and the parameters
+that affect the answer. An in-memory LRU bounded by bytes sits in front of an
+optional SQLite tier that survives restarts and is shared by worker processes.
+"""
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_MODES = ('default', 'bypass', 'only')
+
+# Result fields worth replaying on a hit; per-call metadata is dropped
+CACHED_FIELDS = ('response', 'tokens', 'modelUsed')
+
+
+class CacheMissError(Exception):
+    """Raised when a request asks for cache: only and nothing is cached."""
+    pass
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse runs of whitespace and trim the ends."""
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+
+def make_cache_key(prompt: str, max_tokens: int, temperature: float, providers: Iterable[str]) -> str:
+    """Stable key for a request; the provider set matters because answers differ by model."""
+    payload = json.dumps(
+        [normalize_prompt(prompt), max_tokens, round(float(temperature), 4), sorted(providers)],
+        separators=(',', ':')
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """In-memory LRU/TTL response cache with an optional on-disk tier."""
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 3600.0,
+        disk_path: Optional[str] = None,
+        cache_nondeterministic: bool = False
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes: Upper bound on serialised entry size held in memory
+            ttl: Seconds an entry stays valid
+            disk_path: Optional SQLite file for the second tier
+            cache_nondeterministic: Also cache requests with temperature > 0
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.cache_nondeterministic = cache_nondeterministic
+
+        self._entries = OrderedDict()  # key -> (expires_at, size, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._disk = None
+        if disk_path:
+            disk_path = os.path.abspath(disk_path)
+            os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, timeout=5)
+            self._disk_lock = threading.Lock()
+            with self._disk_lock:
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+                )
+                self._disk.commit()
+
+    def is_cacheable(self, temperature: float) -> bool:
+        """Sampling at temperature > 0 is non-deterministic, so skip it unless configured."""
+        return temperature <= 0 or self.cache_nondeterministic
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached result, or None."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, size, payload = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(payload)
+                self._remove(key)
+
+        row = self._disk_get(key, now)
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # Keep the disk row's expiry so promotion doesn't extend the entry's life
+        expires_at, payload = row
+        self._remember(key, payload, expires_at)
+        return json.loads(payload)
+
+    def put(self, key: str, result: Dict):
+        """Cache the replayable parts of a successful result."""
+        entry = {field: copy.deepcopy(result[field]) for field in CACHED_FIELDS if field in result}
+        payload = json.dumps(entry)
+        expires_at = time.time() + self.ttl
+
+        self._remember(key, payload, expires_at)
+
+        if self._disk is not None:
+            try:
+                with self._disk_lock:
+                    with self._disk:
+                        self._disk.execute(
+                            "INSERT OR REPLACE INTO responses (key, expires_at, payload) VALUES (?, ?, ?)",
+                            (key, expires_at, payload)
+                        )
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to write response cache entry to disk: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and current memory usage."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._bytes
+            }
+
+    def _remember(self, key: str, payload: str, expires_at: float):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires_at, size, payload)
+            self._bytes += size
+
+            # Evict least recently used entries until back under the byte bound
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        """(expires_at, payload) of an unexpired disk entry, or None."""
+        if self._disk is None:
+            return None
+        try:
+            with self._disk_lock:
+                row = self._disk.execute(
+                    "SELECT expires_at, payload FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to read response cache entry from disk: {str(e)}")
+            return None
+        return (row[0], row[1]) if row else None
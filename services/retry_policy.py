@@ -0,0 +1,202 @@
+"""
+Provider Retry Policy
+
+One retry loop shared by every provider. Errors are classified first: only
+timeouts, connection failures, 429 and most 5xx responses are retried, since
+repeating a rejected request (bad key, bad parameters) just adds latency. The
+wait before a retry honours the server's Retry-After, or a provider-specific
+hint, and otherwise uses decorrelated jitter so workers don't retry in
+lock-step. Every sleep is bounded by the request deadline.
+"""
+import email.utils
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+
+from services import deadline, metrics, tracing
+from services.deadline import DeadlineExceededError
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Statuses worth asking again; other 4xx mean the request itself was rejected
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is transient, so the same request may succeed later."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status in RETRYABLE_STATUS or (status >= 500 and status != 501)
+    if isinstance(error, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)):
+        return True
+    # A body cut off mid-way fails to parse; the next attempt may get all of it
+    return isinstance(error, json.JSONDecodeError)
+
+
+# Rejections that still say something about the provider: its key or account is bad
+PROVIDER_FAULT_STATUS = {401, 403}
+
+
+def is_caller_error(error: Exception) -> bool:
+    """
+    Whether an error (or the one it wraps) is a 4xx the caller caused, like
+    bad parameters. Such a rejection says nothing about the provider's health.
+    """
+    seen = error
+    while seen is not None:
+        if isinstance(seen, httpx.HTTPStatusError):
+            status = seen.response.status_code
+            return 400 <= status < 500 and status not in RETRYABLE_STATUS and status not in PROVIDER_FAULT_STATUS
+        seen = seen.__cause__
+    return False
+
+
+def parse_retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if the error has one."""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """How many times, and after how long, a provider retries a failed request."""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 10.0,
+        max_retry_after: float = 30.0,
+        retry_hint: Optional[Callable[[Exception], Optional[float]]] = None,
+        provider: Optional[str] = None
+    ):
+        """
+        Initialize the policy.
+
+        Args:
+            max_retries: Retries after the first attempt
+            base_delay: Smallest backoff, and the first backoff's lower bound
+            max_delay: Largest jittered backoff
+            max_retry_after: Longest server-requested wait honoured; a longer
+                Retry-After gives up so the request can fall back instead
+            retry_hint: Provider-specific wait suggested by an error, used
+                when there is no Retry-After header
+            provider: Provider name that retries are counted under in metrics
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_hint = retry_hint
+        self.provider = provider
+        self._random = random.Random()
+
+    def session(self, name: str) -> 'RetrySession':
+        """Start tracking the attempts of one request."""
+        return RetrySession(self, name)
+
+    def run(self, attempt: Callable[[], Any], name: str) -> Any:
+        """Call attempt until it succeeds or the policy gives up."""
+        session = self.session(name)
+        while True:
+            try:
+                return attempt()
+            except Exception as e:
+                session.failed(e)
+
+    async def arun(self, attempt: Callable[[], Awaitable[Any]], name: str) -> Any:
+        """Async counterpart of run(); attempt returns the awaitable to retry."""
+        session = self.session(name)
+        while True:
+            try:
+                return await attempt()
+            except Exception as e:
+                await session.afailed(e)
+
+    def jitter(self, previous: float) -> float:
+        """Decorrelated jitter: uniform between the base delay and three times the last one."""
+        return min(self.max_delay, self._random.uniform(self.base_delay, max(previous, self.base_delay) * 3))
+
+
+class RetrySession:
+    """Attempts of one request under a RetryPolicy."""
+
+    def __init__(self, policy: RetryPolicy, name: str):
+        self.policy = policy
+        self.name = name
+        self.attempts = 0
+        self._previous_delay = policy.base_delay
+
+    def next_delay(self, error: Exception) -> float:
+        """
+        Record a failed attempt and decide how long to wait before the next.
+
+        Raises:
+            Exception: Wrapping error when it isn't retryable, the retries
+                are used up, or the server asks for a longer wait than allowed
+        """
+        self.attempts += 1
+        total = self.policy.max_retries + 1
+        if isinstance(error, DeadlineExceededError):
+            raise error
+
+        if not is_retryable(error):
+            logger.warning(f"{self.name} request failed (attempt {self.attempts}/{total}), not retrying: {error}")
+            raise Exception(f"{self.name} request failed: {error}") from error
+
+        if self.attempts >= total:
+            logger.warning(f"{self.name} request failed (attempt {self.attempts}/{total}): {error}")
+            raise Exception(f"{self.name} provider failed after {self.attempts} attempts: {error}") from error
+
+        requested = parse_retry_after(error)
+        if requested is None and self.policy.retry_hint is not None:
+            requested = self.policy.retry_hint(error)
+
+        if requested is not None:
+            if requested > self.policy.max_retry_after:
+                raise Exception(f"{self.name} asked to retry after {requested:.0f}s, "
+                                f"longer than the {self.policy.max_retry_after:.0f}s allowed: {error}") from error
+            # A little jitter on top keeps clients told the same time from arriving together
+            delay = requested + self.policy._random.uniform(0, self.policy.base_delay)
+        else:
+            delay = self.policy.jitter(self._previous_delay)
+        self._previous_delay = delay
+        metrics.RETRIES.inc(self.policy.provider or self.name, metrics.error_class(error))
+
+        logger.warning(f"{self.name} request failed (attempt {self.attempts}/{total}), "
+                       f"retrying in {delay:.2f}s: {error}")
+        return delay
+
+    def failed(self, error: Exception):
+        """Handle a failed attempt: raise if giving up, otherwise sleep before the next."""
+        delay = self.next_delay(error)
+        with tracing.span('backoff', provider=self.policy.provider or self.name):
+            slept = deadline.sleep(delay)
+        if not slept:
+            raise DeadlineExceededError(
+                f"{self.name} deadline reached after {self.attempts} attempt(s): {error}"
+            ) from error
+
+    async def afailed(self, error: Exception):
+        """Async counterpart of failed()."""
+        delay = self.next_delay(error)
+        with tracing.span('backoff', provider=self.policy.provider or self.name):
+            slept = await deadline.asleep(delay)
+        if not slept:
+            raise DeadlineExceededError(
+                f"{self.name} deadline reached after {self.attempts} attempt(s): {error}"
+            ) from error
@@ -0,0 +1,218 @@
+"""
+Adaptive Provider Routing
+
+Orders providers by a latency/cost objective computed from live EWMA
+estimates instead of priority alone. A little traffic is still sent to
+providers that are not the current best so their estimates stay fresh, and
+the estimates are persisted so a restarted process does not route blind.
+"""
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from itertools import groupby
+from typing import Dict, List, Optional
+
+from services.llm_provider import LLMProvider
+from services.provider_stats import EwmaStats
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class AdaptiveRouter:
+    """Epsilon-greedy router over per-provider EWMA statistics."""
+
+    def __init__(
+        self,
+        latency_weight: float = 1.0,
+        cost_weight: float = 1000.0,
+        alpha: float = 0.2,
+        epsilon: float = 0.05,
+        min_samples: int = 3,
+        stale_after: float = 300.0,
+        respect_priority: bool = True,
+        state_path: Optional[str] = 'storage/provider_stats.json',
+        snapshot_interval: float = 30.0
+    ):
+        """
+        Initialize the router, restoring saved estimates if present.
+
+        Args:
+            latency_weight: Objective weight per second of expected latency
+            cost_weight: Objective weight per USD of expected cost; the default
+                makes $0.001 per call as bad as one extra second
+            alpha: EWMA smoothing factor; higher adapts faster
+            epsilon: Share of requests sent to a provider other than the best
+            min_samples: Calls observed before a provider is ranked on its score
+            stale_after: Seconds without samples before a provider gets one
+                refresh request regardless of its score
+            respect_priority: Only reorder providers within the same priority
+            state_path: JSON file the estimates are persisted to
+            snapshot_interval: Minimum seconds between writes of state_path
+        """
+        self.latency_weight = latency_weight
+        self.cost_weight = cost_weight
+        self.alpha = alpha
+        self.epsilon = epsilon
+        self.min_samples = min_samples
+        self.stale_after = stale_after
+        self.respect_priority = respect_priority
+        self.state_path = os.path.abspath(state_path) if state_path else None
+        self.snapshot_interval = snapshot_interval
+
+        self.stats = {}  # provider name -> EwmaStats
+        self._refreshing = {}  # provider name -> when a stale refresh was handed out
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._last_snapshot = time.time()
+
+        self._load_state()
+        if self.state_path:
+            atexit.register(self.save_state)
+
+    def inherit(self, previous: Optional['AdaptiveRouter']):
+        """
+        Continue from the estimates of the router this one replaces (on a
+        config reload). The old router stops saving its state at exit, so it
+        can't overwrite the newer estimates.
+        """
+        if previous is None:
+            return
+        if previous.state_path:
+            atexit.unregister(previous.save_state)
+        with previous._lock:
+            stats = {name: EwmaStats.from_dict(estimates.to_dict(), alpha=self.alpha)
+                     for name, estimates in previous.stats.items()}
+        with self._lock:
+            self.stats.update(stats)
+
+    def _stats_for(self, name: str) -> EwmaStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.stats.setdefault(name, EwmaStats(alpha=self.alpha))
+        return stats
+
+    def record_success(self, name: str, seconds: float, completion_tokens: int, cost: float):
+        now = time.time()
+        self._stats_for(name).record_success(seconds, completion_tokens, cost, now)
+        self._maybe_save(now)
+
+    def record_failure(self, name: str):
+        now = time.time()
+        self._stats_for(name).record_failure(now)
+        self._maybe_save(now)
+
+    def score(self, name: str, max_tokens: Optional[int] = None) -> Optional[float]:
+        """
+        Objective value for a provider (lower is better), or None while it
+        has too few samples to judge. With max_tokens, the latency term is
+        the expected time to generate that many tokens, so a provider with
+        a low overhead but slow generation can win short requests and lose
+        long ones.
+        """
+        stats = self.stats.get(name)
+        if stats is None or stats.samples < self.min_samples:
+            return None
+        if stats.latency is None:
+            # Observed, but never successfully
+            return float('inf')
+
+        latency = stats.expected_latency(max_tokens)
+        objective = self.latency_weight * latency + self.cost_weight * (stats.cost or 0.0)
+        # A failed call is paid for again on the next provider
+        return objective / max(1.0 - stats.error_rate, 0.05)
+
+    def order(self, providers: List[LLMProvider], max_tokens: Optional[int] = None) -> List[LLMProvider]:
+        """
+        Return providers in the order they should be tried.
+
+        Args:
+            providers: Providers sorted by priority
+            max_tokens: Completion tokens the request may generate
+        """
+        if self.respect_priority:
+            groups = [list(group) for _, group in groupby(providers, key=lambda p: p.priority)]
+        else:
+            groups = [list(providers)]
+
+        now = time.time()
+        ordered = []
+        for group in groups:
+            ordered.extend(self._order_group(group, now, max_tokens))
+        return ordered
+
+    def _order_group(self, group: List[LLMProvider], now: float, max_tokens: Optional[int]) -> List[LLMProvider]:
+        if len(group) < 2:
+            return group
+
+        # Unproven providers go first until they have enough samples
+        scores = {p.name: self.score(p.name, max_tokens) for p in group}
+        unknown = [p for p in group if scores[p.name] is None]
+        known = sorted((p for p in group if p not in unknown), key=lambda p: scores[p.name])
+        ordered = unknown + known
+        if unknown:
+            return ordered
+
+        explore = None
+        with self._lock:
+            for provider in known[1:]:
+                stats = self.stats[provider.name]
+                if (now - stats.updated_at > self.stale_after
+                        and now - self._refreshing.get(provider.name, 0.0) > self.stale_after):
+                    self._refreshing[provider.name] = now
+                    explore = provider
+                    break
+
+            if explore is None and self._random.random() < self.epsilon:
+                explore = self._random.choice(known[1:])
+
+        if explore is not None:
+            ordered.remove(explore)
+            ordered.insert(0, explore)
+        return ordered
+
+    def estimates(self, name: str) -> Dict:
+        """Current estimates and score for status reporting."""
+        stats = self.stats.get(name)
+        estimates = stats.to_dict() if stats is not None else EwmaStats().to_dict()
+        estimates['score'] = self.score(name)
+        return estimates
+
+    def _maybe_save(self, now: float):
+        if self.state_path and now - self._last_snapshot >= self.snapshot_interval:
+            self.save_state()
+
+    def save_state(self):
+        """Persist the estimates now."""
+        if not self.state_path:
+            return
+
+        with self._lock:
+            self._last_snapshot = time.time()
+            state = {"providers": {name: stats.to_dict() for name, stats in self.stats.items()}}
+
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(state, file)
+            os.replace(tmp_path, self.state_path)
+        except Exception as e:
+            logger.error(f"Failed to write provider routing stats: {str(e)}")
+
+    def _load_state(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+
+        try:
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+            for name, data in state.get('providers', {}).items():
+                self.stats[name] = EwmaStats.from_dict(data, alpha=self.alpha)
+            logger.info(f"Restored routing estimates for {len(self.stats)} provider(s)")
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable provider routing stats: {str(e)}")
@@ -0,0 +1,226 @@
+"""
+Near-Duplicate Response Cache
+
+Matches prompts that differ only by casing, punctuation, whitespace or a word
+or two. Prompts are sketched locally with MinHash over character shingles and
+looked up through an LSH band index, so no embedding service is needed.
+"""
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CACHED_FIELDS = ('response', 'tokens', 'modelUsed')
+
+# Larger than any 64-bit hash divided into bins, so borrowed values never collide
+_EMPTY_BIN_OFFSET = 1 << 64
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace."""
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class MinHasher:
+    """
+    MinHash signatures over character shingles of normalised text.
+
+    Uses one-permutation hashing: each shingle is hashed once and assigned to
+    one of num_perm bins, keeping the minimum per bin, with empty bins filled
+    from their right-hand neighbour. This costs O(shingles) instead of
+    O(shingles * num_perm) and estimates Jaccard similarity the same way.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 4, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        # Fixed key so signatures agree across processes and restarts
+        self._key = str(seed).encode('utf-8')
+
+    def shingles(self, text: str) -> List[int]:
+        text = normalize_text(text)
+        size = self.shingle_size
+        if len(text) <= size:
+            grams = {text}
+        else:
+            grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+
+        return [
+            int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8, key=self._key).digest(), 'little')
+            for gram in grams
+        ]
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        num_perm = self.num_perm
+        bins = [None] * num_perm
+
+        for value in self.shingles(text):
+            index, rank = value % num_perm, value // num_perm
+            current = bins[index]
+            if current is None or rank < current:
+                bins[index] = rank
+
+        # Densify: an empty bin takes the next non-empty bin's value, offset by
+        # the distance so it stays distinguishable from that bin
+        signature = []
+        for index in range(num_perm):
+            distance = 0
+            while bins[(index + distance) % num_perm] is None:
+                distance += 1
+            signature.append(bins[(index + distance) % num_perm] + distance * _EMPTY_BIN_OFFSET)
+        return tuple(signature)
+
+    @staticmethod
+    def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+        """Estimated Jaccard similarity of two signatures."""
+        matches = sum(1 for x, y in zip(left, right) if x == y)
+        return matches / len(left)
+
+
+class SimilarityCache:
+    """Bounded LRU of results indexed by MinHash LSH bands."""
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 4,
+        max_entries: int = 5000,
+        ttl: float = 3600.0,
+        cache_nondeterministic: bool = False
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum estimated Jaccard similarity for a hit
+            num_perm: MinHash signature length
+            bands: LSH bands; num_perm must divide evenly. More bands find
+                lower-similarity candidates at the cost of more verification.
+            shingle_size: Character n-gram length
+            max_entries: Entries kept before least recently used are evicted
+            ttl: Seconds an entry stays valid
+            cache_nondeterministic: Also cache requests with temperature > 0
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_nondeterministic = cache_nondeterministic
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+        self._entries = OrderedDict()  # entry id -> (scope, signature, expires_at, result)
+        self._buckets = {}  # (scope, band, band hash) -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self._lookup_seconds = 0.0
+        self._lookup_max = 0.0
+
+    def is_cacheable(self, temperature: float) -> bool:
+        return temperature <= 0 or self.cache_nondeterministic
+
+    def signature(self, prompt: str) -> Tuple[int, ...]:
+        return self.hasher.signature(prompt)
+
+    @staticmethod
+    def make_scope(max_tokens: int, temperature: float, providers: Iterable[str]) -> str:
+        """Only prompts asked with the same parameters may share an answer."""
+        return f"{max_tokens}|{round(float(temperature), 4)}|{','.join(sorted(providers))}"
+
+    def _band_keys(self, scope: str, signature: Tuple[int, ...]):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            yield (scope, band, hash(chunk))
+
+    def lookup(self, scope: str, signature: Tuple[int, ...]) -> Optional[Tuple[Dict, float]]:
+        """
+        Find the most similar cached result above the threshold.
+
+        Returns:
+            Tuple of (copy of the cached result, estimated similarity) or None
+        """
+        started = time.perf_counter()
+        now = time.time()
+        best_id, best_similarity = None, 0.0
+
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(scope, signature):
+                candidates.update(self._buckets.get(key, ()))
+
+            for entry_id in candidates:
+                _, cached_signature, expires_at, _ = self._entries[entry_id]
+                if expires_at <= now:
+                    continue
+                similarity = MinHasher.similarity(signature, cached_signature)
+                if similarity >= self.threshold and similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+            result = None
+            if best_id is not None:
+                self._entries.move_to_end(best_id)
+                result = copy.deepcopy(self._entries[best_id][3])
+                self.hits += 1
+            else:
+                self.misses += 1
+
+            elapsed = time.perf_counter() - started
+            self._lookup_seconds += elapsed
+            self._lookup_max = max(self._lookup_max, elapsed)
+
+        if result is None:
+            return None
+        return result, best_similarity
+
+    def put(self, scope: str, signature: Tuple[int, ...], result: Dict):
+        """Index a successful result under its prompt signature."""
+        entry = {field: copy.deepcopy(result[field]) for field in CACHED_FIELDS if field in result}
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, signature, time.time() + self.ttl, entry)
+            for key in self._band_keys(scope, signature):
+                self._buckets.setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int):
+        scope, signature, _, _ = self._entries.pop(entry_id)
+        for key in self._band_keys(scope, signature):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def stats(self) -> Dict:
+        """Hit ratio, lookup latency and index size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRatio": self.hits / lookups if lookups else 0.0,
+                "avgLookupMs": (self._lookup_seconds / lookups * 1000) if lookups else 0.0,
+                "maxLookupMs": self._lookup_max * 1000,
+                "entries": len(self._entries),
+                "buckets": len(self._buckets)
+            }
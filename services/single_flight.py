@@ -0,0 +1,188 @@
+"""
+Single-Flight Request Coalescing
+
+Concurrent callers asking for the same key share one underlying call: the
+first becomes the leader and runs it, the rest wait and receive a copy of the
+leader's result (or its exception). Sync and async callers share the same
+in-flight table, so a Flask thread and an event-loop task can coalesce too.
+A leader failure that says nothing about the request, like the leader's own
+deadline running out, can be retried by its followers instead.
+"""
+import asyncio
+import copy
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class CoalesceTimeoutError(TimeoutError):
+    """Raised when a follower gives up waiting for the leader's call."""
+    pass
+
+
+class _Call:
+    """One in-flight call and everyone waiting on it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+        self.waiters = []  # (event loop, future) of async followers
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return copy.deepcopy(self.result)
+
+
+def _settle(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _give_up_at(timeout: Optional[float]) -> Optional[float]:
+    return time.monotonic() + timeout if timeout is not None else None
+
+
+def _left(give_up_at: Optional[float]) -> Optional[float]:
+    return max(0.0, give_up_at - time.monotonic()) if give_up_at is not None else None
+
+
+def _retry(call: _Call, retry: Optional[Callable[[Exception], bool]], give_up_at: Optional[float]) -> bool:
+    """Whether a follower should run a failed call again itself, time permitting."""
+    if call.error is None or retry is None or not retry(call.error):
+        return False
+    return give_up_at is None or time.monotonic() < give_up_at
+
+
+class SingleFlight:
+    """In-flight table keyed by request identity."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None,
+           retry: Optional[Callable[[Exception], bool]] = None) -> Tuple[Any, bool]:
+        """
+        Run fn unless a call with the same key is already in flight.
+
+        Args:
+            key: Request identity
+            fn: The call to run as leader
+            timeout: Longest a follower waits for the leader
+            retry: Whether a leader's error is its own rather than the
+                request's; a follower handed such an error runs the call
+                again, as leader if nobody else has started it
+
+        Returns:
+            Tuple of (result, shared). shared is False for the leader, which
+            gets fn's own return value, and True for followers, who each get
+            a deep copy of it.
+
+        Raises:
+            CoalesceTimeoutError: If a follower's timeout passes first; the
+                leader's call carries on for anyone else waiting
+        """
+        give_up_at = _give_up_at(timeout)
+        while True:
+            call, leader, _ = self._join(key)
+            if leader:
+                break
+            if not call.done.wait(_left(give_up_at)):
+                raise CoalesceTimeoutError(f"Gave up waiting on a coalesced request after {timeout:.3f}s")
+            if not _retry(call, retry, give_up_at):
+                return call.outcome(), True
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._publish(key, call, error=e)
+            raise
+        except BaseException:
+            # Interrupted (e.g. SystemExit); followers still need waking, with an ordinary failure
+            self._publish(key, call, error=Exception("Coalesced request was interrupted"))
+            raise
+        self._publish(key, call, result=result)
+        return result, False
+
+    async def ado(self, key: str, factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None,
+                  retry: Optional[Callable[[Exception], bool]] = None) -> Tuple[Any, bool]:
+        """Async counterpart of do(); factory returns the awaitable to run."""
+        give_up_at = _give_up_at(timeout)
+        while True:
+            call, leader, future = self._join(key, asyncio.get_running_loop())
+            if leader:
+                break
+            try:
+                await asyncio.wait_for(future, _left(give_up_at))
+            except asyncio.TimeoutError:
+                raise CoalesceTimeoutError(f"Gave up waiting on a coalesced request after {timeout:.3f}s") from None
+            if not _retry(call, retry, give_up_at):
+                return call.outcome(), True
+
+        try:
+            result = await factory()
+        except Exception as e:
+            self._publish(key, call, error=e)
+            raise
+        except BaseException:
+            # Followers did not ask to be cancelled; give them an ordinary failure
+            self._publish(key, call, error=Exception("Coalesced request was cancelled"))
+            raise
+        self._publish(key, call, result=result)
+        return result, False
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "inFlight": len(self._calls)
+            }
+
+    def _join(self, key: str, loop: asyncio.AbstractEventLoop = None) -> Tuple[_Call, bool, Any]:
+        """Become the leader for key, or register as a follower of the call in flight."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                return call, True, None
+
+            call.followers += 1
+            self.followers += 1
+            future = None
+            if loop is not None:
+                future = loop.create_future()
+                call.waiters.append((loop, future))
+            return call, False, future
+
+    def _publish(self, key: str, call: _Call, result: Any = None, error: Exception = None):
+        # Snapshot before handing back: the leader keeps mutating its own result
+        snapshot = copy.deepcopy(result) if error is None else None
+
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            call.result = snapshot
+            call.error = error
+            call.done.set()
+            waiters, call.waiters = call.waiters, []
+
+        if call.followers:
+            logger.info(f"Coalesced {call.followers} request(s) onto one upstream call")
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_settle, future)
+            except RuntimeError:
+                # The follower's event loop has already shut down
+                pass
@@ -1,69 +1,345 @@
 """
 Token Counter Utilities
+
+One token-counting service shared by all providers. Each provider names a
+tokenizer spec ("tiktoken:<encoding or model>", "hf:<model>" or "approx") and
+counts are memoised in an LRU keyed by spec and content hash, so a prompt is
+encoded at most once however many places ask for its length.
+
+tiktoken and transformers are imported only when a tokenizer is first loaded,
+and tokenizers load on a background thread: until one is ready, its texts are
+counted with the heuristic and those estimates are not memoised.
 """
-import tiktoken
-from typing import Dict, Optional, Union
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
+from services import tokenizer_store
 from utils.logger import get_logger
 
+if TYPE_CHECKING:
+    import tiktoken
+
 logger = get_logger(__name__)
 
+APPROXIMATE = 'approx'
+DEFAULT_SPEC = 'tiktoken:cl100k_base'
+
+# Tokenizer readiness, as reported on /health
+READY = 'ready'
+LOADING = 'loading'
+UNAVAILABLE = 'unavailable'
+
 # Cache for tiktoken encoders
 _ENCODERS = {}
 
-def get_encoder(model_name: str) -> Optional[tiktoken.Encoding]:
-    """Get or create a tiktoken encoder for the specified model."""
+# Cache for Hugging Face tokenizers; None marks one that failed to load
+_HF_TOKENIZERS = {}
+_HF_LOCK = threading.Lock()
+
+def get_encoder(model_name: str, store_path: Optional[str] = tokenizer_store.DEFAULT_STORE,
+                offline: bool = False) -> Optional['tiktoken.Encoding']:
+    """
+    Get or create a tiktoken encoder for the specified model or encoding name,
+    preferring a snapshot in the tokenizer store. With offline set, nothing
+    is downloaded.
+    """
     if model_name in _ENCODERS:
         return _ENCODERS[model_name]
-    
+
+    encoder = tokenizer_store.load(f"tiktoken:{model_name}", store_path)
+    if encoder is not None or offline:
+        _ENCODERS[model_name] = encoder
+        return encoder
+
     try:
-        if "gpt" in model_name:
+        import tiktoken
+
+        if model_name in tiktoken.list_encoding_names():
+            encoder = tiktoken.get_encoding(model_name)
+        elif "gpt" in model_name:
             encoder = tiktoken.encoding_for_model(model_name)
         else:
             # Default to cl100k_base for non-OpenAI models
             encoder = tiktoken.get_encoding("cl100k_base")
-        
+
         _ENCODERS[model_name] = encoder
         return encoder
-    
+
     except Exception as e:
+        # Remember the failure so every call doesn't retry the download
         logger.warning(f"Failed to create encoder for {model_name}: {str(e)}")
+        _ENCODERS[model_name] = None
         return None
 
+def get_hf_tokenizer(model_name: str, store_path: Optional[str] = tokenizer_store.DEFAULT_STORE,
+                     offline: bool = False):
+    """
+    Load a Hugging Face tokenizer on first use, preferring a snapshot in the
+    tokenizer store, or None if it can't be loaded.
+    """
+    if model_name in _HF_TOKENIZERS:
+        return _HF_TOKENIZERS[model_name]
+
+    with _HF_LOCK:
+        if model_name in _HF_TOKENIZERS:
+            return _HF_TOKENIZERS[model_name]
+
+        tokenizer = tokenizer_store.load(f"hf:{model_name}", store_path)
+        if tokenizer is not None or offline:
+            _HF_TOKENIZERS[model_name] = tokenizer
+            return tokenizer
+
+        try:
+            from transformers import AutoTokenizer, logging as hf_logging
+            hf_logging.set_verbosity_error()  # Suppress HF warnings
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+        except Exception as e:
+            logger.warning(f"Failed to load tokenizer for model {model_name}. Falling back to estimate. Error: {e}")
+            tokenizer = None
+        _HF_TOKENIZERS[model_name] = tokenizer
+        return tokenizer
+
+def _parse_spec(spec: str) -> Tuple[str, str]:
+    kind, _, name = spec.partition(':')
+    if kind == 'tiktoken':
+        name = name or 'cl100k_base'
+    return kind, name
+
+def is_loaded(spec: str) -> bool:
+    """Whether the tokenizer for spec has been loaded (or failed to load)."""
+    kind, name = _parse_spec(spec)
+    if kind == 'tiktoken':
+        return name in _ENCODERS
+    if kind == 'hf':
+        return name in _HF_TOKENIZERS
+    return True
+
+def load_tokenizer(spec: str, store_path: Optional[str] = tokenizer_store.DEFAULT_STORE, offline: bool = False):
+    """Load the tokenizer for spec, blocking; None for heuristic or unavailable specs."""
+    kind, name = _parse_spec(spec)
+    if kind == 'tiktoken':
+        return get_encoder(name, store_path, offline)
+    if kind == 'hf':
+        return get_hf_tokenizer(name, store_path, offline)
+    if kind != APPROXIMATE:
+        logger.warning(f"Unknown tokenizer spec '{spec}', using an estimate")
+    return None
+
 def count_tokens(text: str, model_name: str = "gpt-3.5-turbo") -> int:
     """
     Count tokens in text using the appropriate tokenizer.
-    
+
     Args:
         text: The text to count tokens for
         model_name: Name of the model to use for token counting
-        
+
     Returns:
         Number of tokens
     """
-    encoder = get_encoder(model_name)
-    
-    if encoder:
-        try:
-            return len(encoder.encode(text))
-        except Exception as e:
-            logger.error(f"Error encoding text: {str(e)}")
-    
-    # Fallback to approximate counting
-    return approximate_token_count(text)
+    return get_token_counter().count(text, f"tiktoken:{model_name}")
 
 def approximate_token_count(text: str) -> int:
     """
     Approximate token count when a proper tokenizer isn't available.
-    
+
     Args:
         text: The text to count tokens for
-        
+
     Returns:
         Approximate number of tokens
     """
     # Simple word-based approximation
     words = text.split()
-    
+
     # Common approximation for English text: ~4/3 tokens per word
-    return max(1, len(words) * 4 // 3)
\ No newline at end of file
+    return max(1, len(words) * 4 // 3)
+
+
+class TokenCounter:
+    """Memoising token counter over tiktoken, Hugging Face and heuristic tokenizers."""
+
+    def __init__(self, cache_size: int = 8192, offload_chars: int = 20000, max_workers: int = 2,
+                 background_load: bool = True, store_path: Optional[str] = tokenizer_store.DEFAULT_STORE,
+                 offline: bool = False):
+        """
+        Initialize the counter.
+
+        Args:
+            cache_size: Counts kept in the LRU
+            offload_chars: Texts at least this long are encoded on the worker
+                pool by acount(), keeping the event loop free
+            max_workers: Threads in that pool
+            background_load: Load tokenizers on a background thread and
+                estimate until they are ready, instead of loading inline
+            store_path: Tokenizer store checked before downloading
+            offline: Never download; specs missing from the store are estimated
+        """
+        self.cache_size = cache_size
+        self.offload_chars = offload_chars
+        self.max_workers = max_workers
+        self.background_load = background_load
+        self.store_path = store_path
+        self.offline = offline
+
+        self._cache = OrderedDict()  # (spec, content hash) -> count
+        self._lock = threading.Lock()
+        self._pool = None
+        self._loading = set()  # specs with a background load in progress
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str, spec: str):
+        return spec, hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+    def _lookup(self, key) -> Optional[int]:
+        with self._lock:
+            count = self._cache.get(key)
+            if count is None:
+                self.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def _remember(self, key, count: int):
+        with self._lock:
+            self._cache[key] = count
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def count(self, text: str, spec: str = DEFAULT_SPEC) -> int:
+        """Number of tokens in text under the given tokenizer spec."""
+        key = self._key(text, spec)
+        count = self._lookup(key)
+        if count is None:
+            counts, exact = self._encode([text], spec)
+            count = counts[0]
+            if exact:
+                self._remember(key, count)
+        return count
+
+    def count_batch(self, texts: List[str], spec: str = DEFAULT_SPEC) -> List[int]:
+        """Count several texts, encoding all cache misses in one batched call."""
+        keys = [self._key(text, spec) for text in texts]
+        counts = [self._lookup(key) for key in keys]
+
+        missing = [index for index, count in enumerate(counts) if count is None]
+        if missing:
+            encoded, exact = self._encode([texts[index] for index in missing], spec)
+            for index, count in zip(missing, encoded):
+                counts[index] = count
+                if exact:
+                    self._remember(keys[index], count)
+        return counts
+
+    async def acount(self, text: str, spec: str = DEFAULT_SPEC) -> int:
+        """count() for async callers; large uncached texts are encoded off the event loop."""
+        if len(text) < self.offload_chars:
+            return self.count(text, spec)
+
+        count = self._lookup(self._key(text, spec))
+        if count is not None:
+            return count
+        return await asyncio.get_running_loop().run_in_executor(self._get_pool(), self.count, text, spec)
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tokenize')
+        return self._pool
+
+    def warm_up(self, specs):
+        """Start loading the given tokenizers on background threads."""
+        for spec in specs:
+            if is_loaded(spec):
+                continue
+            with self._lock:
+                if spec in self._loading:
+                    continue
+                self._loading.add(spec)
+            threading.Thread(target=self._load, args=(spec,), name=f'tokenizer-{spec}', daemon=True).start()
+
+    def _load(self, spec: str):
+        try:
+            load_tokenizer(spec, self.store_path, self.offline)
+            logger.info(f"Tokenizer {spec} is {self.readiness(spec)}")
+        finally:
+            with self._lock:
+                self._loading.discard(spec)
+
+    def readiness(self, spec: str) -> str:
+        """READY, LOADING (counting with estimates meanwhile) or UNAVAILABLE."""
+        kind, _ = _parse_spec(spec)
+        if kind == APPROXIMATE:
+            return READY
+        if not is_loaded(spec):
+            return LOADING
+        return READY if load_tokenizer(spec, self.store_path, self.offline) is not None else UNAVAILABLE
+
+    def _encode(self, texts: List[str], spec: str) -> Tuple[List[int], bool]:
+        """
+        Returns:
+            Tuple of (counts, exact). exact is False for stand-in estimates
+            made while the tokenizer is still loading or after it failed to
+            encode, which must not be memoised.
+        """
+        if not is_loaded(spec):
+            if self.background_load:
+                self.warm_up([spec])
+                return [approximate_token_count(text) for text in texts], False
+            load_tokenizer(spec, self.store_path, self.offline)
+
+        kind, _ = _parse_spec(spec)
+        tokenizer = load_tokenizer(spec, self.store_path, self.offline)
+
+        try:
+            if kind == 'tiktoken' and tokenizer is not None:
+                # Count special-token text like "<|endoftext|>" as ordinary text
+                if len(texts) == 1:
+                    return [len(tokenizer.encode(texts[0], disallowed_special=()))], True
+                return [len(ids) for ids in tokenizer.encode_batch(texts, disallowed_special=())], True
+
+            if kind == 'hf' and tokenizer is not None:
+                return [len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']], True
+
+        except Exception as e:
+            logger.error(f"Error encoding text with {spec}: {str(e)}")
+            return [approximate_token_count(text) for text in texts], False
+
+        # Fallback to approximate counting; the tokenizer is unavailable for good
+        return [approximate_token_count(text) for text in texts], True
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._cache)
+            }
+
+
+_COUNTER = None
+_COUNTER_LOCK = threading.Lock()
+
+def get_token_counter() -> TokenCounter:
+    """The process-wide token counter, created with defaults on first use."""
+    global _COUNTER
+    if _COUNTER is None:
+        with _COUNTER_LOCK:
+            if _COUNTER is None:
+                _COUNTER = TokenCounter()
+    return _COUNTER
+
+def configure_token_counter(settings: Optional[Dict] = None) -> TokenCounter:
+    """Replace the process-wide token counter using settings.token_counter."""
+    global _COUNTER
+    with _COUNTER_LOCK:
+        _COUNTER = TokenCounter(**(settings or {}))
+    return _COUNTER
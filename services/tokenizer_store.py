@@ -0,0 +1,207 @@
+"""
+Offline Tokenizer Store
+
+Snapshots tokenizers into a local directory so workers without network
+access still count tokens exactly. This is an offline artifact cache, not a
+shared-memory loader: every process reads the snapshot and builds its own
+in-memory tokenizer from it.
+
+Usage:
+    python -m services.tokenizer_store snapshot [spec ...] [--config config/providers.yaml]
+    python -m services.tokenizer_store list
+"""
+import argparse
+import base64
+import json
+import os
+import re
+from typing import Dict, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_STORE = 'storage/tokenizers'
+
+TIKTOKEN_RANKS = 'ranks.tiktoken'
+HF_TOKENIZER = 'tokenizer.json'
+META = 'meta.json'
+
+
+class _FastTokenizer:
+    """Gives a `tokenizers.Tokenizer` the call signature of a transformers tokenizer."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def __call__(self, texts: List[str], add_special_tokens: bool = False) -> Dict:
+        encodings = self.tokenizer.encode_batch(texts, add_special_tokens=add_special_tokens)
+        return {"input_ids": [encoding.ids for encoding in encodings]}
+
+
+def artifact_dir(spec: str, root: str = DEFAULT_STORE) -> str:
+    """Directory holding the artifacts for a tokenizer spec."""
+    return os.path.join(root, re.sub(r'[^\w.-]+', '__', spec))
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_tiktoken(encoding, directory: str):
+    """Write a tiktoken encoding as a .tiktoken ranks file plus its metadata."""
+    os.makedirs(directory, exist_ok=True)
+    lines = [
+        base64.b64encode(token) + b' ' + str(rank).encode('ascii')
+        for token, rank in sorted(encoding._mergeable_ranks.items(), key=lambda item: item[1])
+    ]
+    _write_atomic(os.path.join(directory, TIKTOKEN_RANKS), b'\n'.join(lines) + b'\n')
+    meta = {
+        "kind": "tiktoken",
+        "name": encoding.name,
+        "pat_str": encoding._pat_str,
+        "special_tokens": encoding._special_tokens
+    }
+    _write_atomic(os.path.join(directory, META), json.dumps(meta, indent=2).encode('utf-8'))
+
+
+def load_tiktoken(directory: str):
+    """Build a tiktoken encoding from a snapshot."""
+    import tiktoken
+
+    with open(os.path.join(directory, META), 'r') as file:
+        meta = json.load(file)
+
+    ranks = {}
+    with open(os.path.join(directory, TIKTOKEN_RANKS), 'rb') as file:
+        for line in file:
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+
+    return tiktoken.Encoding(
+        name=meta['name'],
+        pat_str=meta['pat_str'],
+        mergeable_ranks=ranks,
+        special_tokens=meta['special_tokens']
+    )
+
+
+def save_hf(tokenizer, directory: str):
+    """Write a fast Hugging Face tokenizer (or its backend) as tokenizer.json."""
+    backend = getattr(tokenizer, 'backend_tokenizer', tokenizer)
+    if not hasattr(backend, 'to_str'):
+        raise ValueError("Only fast (Rust-backed) Hugging Face tokenizers can be snapshotted")
+
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(os.path.join(directory, HF_TOKENIZER), backend.to_str().encode('utf-8'))
+    _write_atomic(os.path.join(directory, META), json.dumps({"kind": "hf"}, indent=2).encode('utf-8'))
+
+
+def load_hf(directory: str) -> _FastTokenizer:
+    """Build a Hugging Face tokenizer from a snapshot without transformers or the Hub."""
+    from tokenizers import Tokenizer
+
+    return _FastTokenizer(Tokenizer.from_file(os.path.join(directory, HF_TOKENIZER)))
+
+
+def load(spec: str, root: Optional[str] = DEFAULT_STORE):
+    """
+    Load a tokenizer from the store.
+
+    Returns:
+        The tokenizer, or None if the store has no usable snapshot for spec
+    """
+    if not root:
+        return None
+    directory = artifact_dir(spec, root)
+    if not os.path.exists(os.path.join(directory, META)):
+        return None
+
+    kind = spec.partition(':')[0]
+    try:
+        tokenizer = load_tiktoken(directory) if kind == 'tiktoken' else load_hf(directory)
+        logger.info(f"Loaded tokenizer {spec} from {directory}")
+        return tokenizer
+    except Exception as e:
+        logger.warning(f"Failed to load stored tokenizer {spec} from {directory}: {str(e)}")
+        return None
+
+
+def snapshot(spec: str, root: str = DEFAULT_STORE) -> str:
+    """
+    Fetch a tokenizer (from the network if needed) and write it to the store.
+
+    Returns:
+        The artifact directory
+    """
+    kind, _, name = spec.partition(':')
+    directory = artifact_dir(spec, root)
+
+    if kind == 'tiktoken':
+        import tiktoken
+        name = name or 'cl100k_base'
+        if name in tiktoken.list_encoding_names():
+            encoding = tiktoken.get_encoding(name)
+        else:
+            encoding = tiktoken.encoding_for_model(name)
+        save_tiktoken(encoding, directory)
+    elif kind == 'hf':
+        from transformers import AutoTokenizer
+        save_hf(AutoTokenizer.from_pretrained(name, use_fast=True), directory)
+    else:
+        raise ValueError(f"Tokenizer spec '{spec}' has nothing to snapshot")
+
+    return directory
+
+
+def _config_specs(config_path: str) -> List[str]:
+    """Tokenizer specs of the enabled providers in a providers YAML file."""
+    from services.provider_manager import load_config_file
+    from services.providers import get_provider_class
+
+    specs = []
+    for provider_config in load_config_file(config_path).get('providers', []):
+        if not provider_config.get('enabled', True):
+            continue
+        spec = (provider_config.get('tokenizer')
+                or get_provider_class(provider_config['type']).default_tokenizer(provider_config))
+        if spec.partition(':')[0] in ('tiktoken', 'hf') and spec not in specs:
+            specs.append(spec)
+    return specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the offline tokenizer store")
+    parser.add_argument('--store', default=DEFAULT_STORE, help="store directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    snapshot_parser = commands.add_parser('snapshot', help="fetch tokenizers and write them to the store")
+    snapshot_parser.add_argument('specs', nargs='*', help="e.g. tiktoken:cl100k_base hf:google/flan-t5-base")
+    snapshot_parser.add_argument('--config', default='config/providers.yaml',
+                                 help="snapshot every provider's tokenizer when no specs are given")
+    commands.add_parser('list', help="show stored tokenizers")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        if os.path.isdir(args.store):
+            for entry in sorted(os.listdir(args.store)):
+                directory = os.path.join(args.store, entry)
+                size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+                print(f"{entry:<40} {size / 1024:>10.1f} KiB")
+        return
+
+    failed = 0
+    for spec in args.specs or _config_specs(args.config):
+        try:
+            print(f"{spec} -> {snapshot(spec, args.store)}")
+        except Exception as e:
+            failed += 1
+            print(f"{spec}: failed ({e})")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Request Tracing
+
+Per-phase timing spans for one request, kept in a context variable like the
+request deadline. Spans from anywhere on the request's path (config reload,
+admission, token counting, each provider attempt and its HTTP phases, cost
+calculation, usage logging) are collected on the request's Trace, which is
+summarised in a Server-Timing header, optionally returned as a `timings`
+field, and can be appended to a Chrome trace file for Perfetto or
+chrome://tracing. Without an active trace, span() does nothing.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+_current = contextvars.ContextVar('trace', default=None)
+
+# httpcore trace events (without the .started/.complete suffix) and the span each one becomes
+HTTP_PHASES = {
+    'connection.connect_tcp': 'http_connect',
+    'connection.start_tls': 'http_tls',
+    'http11.receive_response_headers': 'http_upstream',
+    'http2.receive_response_headers': 'http_upstream',
+    'http11.receive_response_body': 'http_read',
+    'http2.receive_response_body': 'http_read'
+}
+
+
+class Trace:
+    """The spans recorded while serving one request."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.started_wall = time.time()
+        self.ended: Optional[float] = None
+        self.spans: List[Dict] = []
+        self._token = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, args: Optional[Dict] = None):
+        """Record a span; start and end are time.perf_counter() values."""
+        span = {"name": name, "start": start, "end": end, "tid": threading.get_native_id(), "args": args or {}}
+        with self._lock:
+            if self.ended is None:
+                self.spans.append(span)
+
+    def _snapshot(self) -> List[Dict]:
+        with self._lock:
+            return list(self.spans)
+
+    def elapsed(self) -> float:
+        return (self.ended or time.perf_counter()) - self.started
+
+    def report(self) -> List[Dict]:
+        """Spans for the `timings` response field: offsets and durations in milliseconds."""
+        return [
+            dict(span['args'], name=span['name'],
+                 start=round((span['start'] - self.started) * 1000, 2),
+                 duration=round((span['end'] - span['start']) * 1000, 2))
+            for span in sorted(self._snapshot(), key=lambda span: span['start'])
+        ]
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value: total time per phase (per provider for
+        provider phases), in order of first occurrence, then the request total.
+        """
+        totals: Dict = {}
+        for span in sorted(self._snapshot(), key=lambda span: span['start']):
+            key = (span['name'], span['args'].get('provider'))
+            totals[key] = totals.get(key, 0.0) + span['end'] - span['start']
+
+        entries = []
+        for (name, provider), seconds in totals.items():
+            desc = f';desc="{provider}"' if provider else ''
+            entries.append(f"{name}{desc};dur={seconds * 1000:.1f}")
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(entries)
+
+    def chrome_events(self) -> List[Dict]:
+        """Complete ('X') events in the Chrome Trace Event format, the request first."""
+        pid = os.getpid()
+        origin = self.started_wall * 1e6
+
+        def event(name, start, end, tid, args):
+            return {
+                "name": name, "cat": "llm", "ph": "X", "pid": pid, "tid": tid,
+                "ts": round(origin + (start - self.started) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "args": args
+            }
+
+        spans = self._snapshot()
+        tid = spans[0]['tid'] if spans else threading.get_native_id()
+        events = [event(self.name, self.started, self.started + self.elapsed(), tid, {})]
+        for span in spans:
+            events.append(event(span['name'], span['start'], span['end'], span['tid'], span['args']))
+        return events
+
+
+class Tracer:
+    """Starts and finishes request traces according to settings.tracing."""
+
+    def __init__(self):
+        self.enabled = False
+        self.export_path: Optional[str] = None
+        self.export_sample_rate = 1.0
+        self._file = None
+        self._file_pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, settings: Optional[Dict]):
+        """Apply settings.tracing."""
+        settings = settings or {}
+        self.enabled = bool(settings.get('enabled', False))
+        self.export_sample_rate = float(settings.get('export_sample_rate', 1.0))
+        export_path = settings.get('export_path')
+        with self._lock:
+            if export_path != self.export_path and self._file is not None:
+                self._file.close()
+                self._file = None
+            self.export_path = export_path
+
+    def start(self, name: str) -> Optional[Trace]:
+        """Begin tracing the current request; None when tracing is disabled."""
+        if not self.enabled:
+            return None
+        trace = Trace(name)
+        trace._token = _current.set(trace)
+        return trace
+
+    def finish(self, trace: Optional[Trace]):
+        """Stop recording spans on trace and export it if sampled."""
+        if trace is None:
+            return
+        try:
+            _current.reset(trace._token)
+        except ValueError:
+            # Finished from a different context than it was started in
+            _current.set(None)
+        with trace._lock:
+            if trace.ended is None:
+                trace.ended = time.perf_counter()
+        if self.export_path and random.random() < self.export_sample_rate:
+            self.export(trace)
+
+    def export(self, trace: Trace):
+        """
+        Append the trace to this process's trace-<pid>.json under export_path.
+        The file is in the Chrome JSON array format, which viewers accept
+        without the closing bracket, so events can be appended as they come.
+        """
+        lines = ''.join(json.dumps(event) + ',\n' for event in trace.chrome_events())
+        with self._lock:
+            try:
+                if self._file is None or self._file_pid != os.getpid():
+                    os.makedirs(self.export_path, exist_ok=True)
+                    path = os.path.join(self.export_path, f"trace-{os.getpid()}.json")
+                    self._file = open(path, 'a')
+                    self._file_pid = os.getpid()
+                    if self._file.tell() == 0:
+                        self._file.write('[\n')
+                self._file.write(lines)
+                self._file.flush()
+            except OSError as e:
+                logger.warning(f"Failed to export trace to {self.export_path}: {str(e)}")
+
+
+TRACER = Tracer()
+
+
+def current() -> Optional[Trace]:
+    """The trace of the request being served, if any."""
+    return _current.get()
+
+
+def start(name: str) -> Optional[Trace]:
+    return TRACER.start(name)
+
+
+def finish(trace: Optional[Trace]):
+    TRACER.finish(trace)
+
+
+def configure_tracing(settings: Optional[Dict]) -> Tracer:
+    """Apply settings.tracing to the process-wide tracer."""
+    TRACER.configure(settings)
+    return TRACER
+
+
+@contextmanager
+def span(name: str, **args) -> Iterator[None]:
+    """Time the enclosed block as a span of the current request's trace."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, began, time.perf_counter(), args)
+
+
+class HttpPhases:
+    """
+    httpcore trace callback that turns connection and response events into
+    spans: connect, TLS handshake, waiting for the response headers (the
+    provider's inference time, for non-streaming calls) and reading the body.
+    """
+
+    def __init__(self, provider: str):
+        self.trace = _current.get()
+        self.provider = provider
+        self._open: Dict[str, float] = {}
+
+    def __call__(self, event_name: str, info: Dict):
+        if self.trace is None:
+            return
+        phase, _, stage = event_name.rpartition('.')
+        name = HTTP_PHASES.get(phase)
+        if name is None:
+            return
+        if stage == 'started':
+            self._open[phase] = time.perf_counter()
+        elif phase in self._open:
+            self.trace.add(name, self._open.pop(phase), time.perf_counter(), {"provider": self.provider})
@@ -0,0 +1,170 @@
+"""
+Incremental Usage Statistics
+
+Keeps running totals over the usage store so /stats never rescans history.
+Records are folded in once, by following the store's tail from a persisted
+cursor, which also picks up records written by other worker processes.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from services.usage_store import UsageStore
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class UsageStats:
+    """Running usage aggregates plus a ring buffer of the most recent records."""
+
+    def __init__(
+        self,
+        usage_store: UsageStore,
+        snapshot_path: Optional[str] = 'storage/usage_stats.json',
+        recent_size: int = 50,
+        snapshot_interval: float = 30.0
+    ):
+        """
+        Initialize the aggregator, restoring state from a snapshot if present.
+
+        Args:
+            usage_store: Store whose records are aggregated
+            snapshot_path: File used to persist aggregates and the store cursor
+            recent_size: Number of recent records kept for /stats
+            snapshot_interval: Minimum seconds between snapshot writes
+        """
+        self.usage_store = usage_store
+        self.snapshot_path = os.path.abspath(snapshot_path) if snapshot_path else None
+        self.recent_size = recent_size
+        self.snapshot_interval = snapshot_interval
+
+        self._lock = threading.Lock()
+        self._last_snapshot = 0.0
+        self._reset()
+        self._load_snapshot()
+
+        if self.snapshot_path:
+            atexit.register(self.save_snapshot)
+
+    def _reset(self):
+        self.cursor = None
+        self.total_requests = 0
+        self.total_cost = 0.0
+        self.total_tokens = 0
+        self.provider_usage = {}
+        self.hedged_requests = 0
+        self.cache_hits = 0
+        self.coalesced_requests = 0
+        self.recent = deque(maxlen=self.recent_size)
+
+    def add(self, record: Dict):
+        """Fold a single usage record into the aggregates."""
+        # Cache hits are requests served without buying any tokens
+        if record.get('cached'):
+            self.total_requests += 1
+            self.cache_hits += 1
+            self.recent.append(record)
+            return
+
+        # Coalesced followers shared the leader's upstream call, which was billed once
+        if record.get('coalesced'):
+            self.total_requests += 1
+            self.coalesced_requests += 1
+            self.recent.append(record)
+            return
+
+        self.total_cost += record.get('cost', 0) or 0
+        self.total_tokens += (record.get('tokens') or {}).get('total', 0) or 0
+
+        # The abandoned side of a hedged request costs money but isn't a request
+        if record.get('hedgeOutcome'):
+            return
+
+        self.total_requests += 1
+        if record.get('hedged'):
+            self.hedged_requests += 1
+
+        provider = record.get('modelUsed')
+        if provider:
+            self.provider_usage[provider] = self.provider_usage.get(provider, 0) + 1
+
+        self.recent.append(record)
+
+    def refresh(self):
+        """Fold in records committed to the store since the last refresh."""
+        with self._lock:
+            records, self.cursor = self.usage_store.read_since(self.cursor)
+            for record in records:
+                self.add(record)
+
+            if records and time.time() - self._last_snapshot >= self.snapshot_interval:
+                self._write_snapshot()
+
+    def summary(self) -> Dict:
+        """Summary totals in the /stats response format."""
+        return {
+            "totalRequests": self.total_requests,
+            "totalCost": self.total_cost,
+            "totalTokens": self.total_tokens,
+            "providerUsage": dict(self.provider_usage),
+            "hedgedRequests": self.hedged_requests,
+            "cacheHits": self.cache_hits,
+            "coalescedRequests": self.coalesced_requests
+        }
+
+    def recent_logs(self) -> List[Dict]:
+        """The most recent records, oldest first."""
+        return list(self.recent)
+
+    def save_snapshot(self):
+        """Persist aggregates and cursor now."""
+        with self._lock:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        if not self.snapshot_path:
+            return
+
+        snapshot = {
+            "cursor": self.cursor,
+            "summary": self.summary(),
+            "recent": list(self.recent)
+        }
+
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as file:
+                json.dump(snapshot, file)
+            os.replace(tmp_path, self.snapshot_path)
+            self._last_snapshot = time.time()
+        except Exception as e:
+            logger.error(f"Failed to write usage stats snapshot: {str(e)}")
+
+    def _load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+
+        try:
+            with open(self.snapshot_path, 'r') as file:
+                snapshot = json.load(file)
+
+            summary = snapshot.get('summary', {})
+            self.cursor = snapshot.get('cursor')
+            self.total_requests = summary.get('totalRequests', 0)
+            self.total_cost = summary.get('totalCost', 0.0)
+            self.total_tokens = summary.get('totalTokens', 0)
+            self.provider_usage = dict(summary.get('providerUsage', {}))
+            self.hedged_requests = summary.get('hedgedRequests', 0)
+            self.cache_hits = summary.get('cacheHits', 0)
+            self.coalesced_requests = summary.get('coalescedRequests', 0)
+            self.recent.extend(snapshot.get('recent', []))
+            self._last_snapshot = time.time()
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable usage stats snapshot, rebuilding: {str(e)}")
+            self._reset()
@@ -0,0 +1,419 @@
+"""
+Usage Log Storage
+
+Append-only stores for per-generation usage records. Records are buffered in
+process and flushed in batches by a background thread, so a request never pays
+for more than an in-memory append.
+"""
+import atexit
+import json
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils.logger import get_logger
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+logger = get_logger(__name__)
+
+DEFAULT_LEGACY_PATH = 'storage/usage_logs.json'
+
+
+class UsageStore(ABC):
+    """Base class for usage record stores."""
+
+    @abstractmethod
+    def append(self, record: Dict):
+        """Queue a single usage record for writing."""
+        pass
+
+    def append_many(self, records: List[Dict]):
+        """Queue several usage records for writing."""
+        for record in records:
+            self.append(record)
+
+    @abstractmethod
+    def iter_records(self) -> Iterator[Dict]:
+        """Iterate over all committed records, oldest first."""
+        pass
+
+    def read_since(self, cursor: Any = None) -> Tuple[List[Dict], Any]:
+        """
+        Read committed records appended after a cursor.
+
+        Args:
+            cursor: Value returned by a previous call, or None to read from the start
+
+        Returns:
+            Tuple of (new records, cursor to pass next time). Cursors are
+            JSON-serialisable so they can be persisted.
+        """
+        records = list(self.iter_records())
+        start = cursor or 0
+        return records[start:], len(records)
+
+    def flush(self):
+        """Write any buffered records."""
+        pass
+
+    def close(self):
+        """Flush and release resources."""
+        self.flush()
+
+
+class BufferedUsageStore(UsageStore):
+    """
+    Buffers records in memory and writes them in batches.
+
+    A batch is written when the buffer reaches max_buffer records or at most
+    flush_interval seconds after the first record was queued.
+    """
+
+    def __init__(self, flush_interval: float = 0.5, max_buffer: int = 256):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+
+        self._flusher = threading.Thread(target=self._flush_loop, name=f"{type(self).__name__}-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def append(self, record: Dict):
+        # Serialise now: the caller keeps mutating the dict it returns to clients
+        line = json.dumps(record, default=str)
+        with self._cond:
+            self._buffer.append(line)
+            if len(self._buffer) == 1 or len(self._buffer) >= self.max_buffer:
+                self._cond.notify()
+
+    def append_many(self, records: List[Dict]):
+        lines = [json.dumps(record, default=str) for record in records]
+        with self._cond:
+            self._buffer.extend(lines)
+            self._cond.notify()
+
+    def flush(self):
+        self._flush()
+
+    def _flush(self) -> bool:
+        """
+        Write the buffered records. A batch that fails to write goes back to
+        the front of the buffer for the next flush, since these records drive
+        cost accounting.
+
+        Returns:
+            False if the write failed
+        """
+        # Swap under the write lock so concurrent flushes write batches in order
+        with self._write_lock:
+            with self._cond:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return True
+            try:
+                self._write_batch(lines)
+            except Exception as e:
+                logger.error(f"Failed to write {len(lines)} usage record(s), keeping them for retry: {str(e)}")
+                with self._cond:
+                    self._buffer[:0] = lines
+                return False
+        return True
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        with self._cond:
+            self._cond.notify()
+        if self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._closed:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                # Give the batch up to flush_interval to fill
+                if len(self._buffer) < self.max_buffer and not self._closed:
+                    self._cond.wait(self.flush_interval)
+            if not self._flush():
+                # Back off before retrying rather than spinning on a failing store
+                with self._cond:
+                    if not self._closed:
+                        self._cond.wait(self.flush_interval)
+
+    @abstractmethod
+    def _write_batch(self, lines: List[str]):
+        """Persist a batch of JSON-encoded records."""
+        pass
+
+
+class JsonlUsageStore(BufferedUsageStore):
+    """
+    JSON Lines segments in a directory with size-based rollover.
+
+    Each batch is a single O_APPEND write made while holding an advisory lock
+    on the directory's lock file (where available), taken before the segment
+    is chosen. Several worker processes can therefore share the directory:
+    batches land in the order they were written, and once a newer segment
+    exists nothing is appended to an older one. A torn final line left by a
+    crash is skipped on read.
+    """
+
+    SEGMENT_PATTERN = re.compile(r'^usage-(\d+)\.jsonl$')
+    LOCK_NAME = 'usage.lock'
+
+    def __init__(self, path: str = 'storage/usage', segment_max_bytes: int = 10 * 1024 * 1024,
+                 fsync: bool = True, **kwargs):
+        self.path = os.path.abspath(path)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        os.makedirs(path, exist_ok=True)
+        super().__init__(**kwargs)
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.path, f"usage-{index:08d}.jsonl")
+
+    def _indexed_segments(self) -> List[Tuple[int, str]]:
+        found = []
+        for name in os.listdir(self.path):
+            match = self.SEGMENT_PATTERN.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.path, name)))
+        return sorted(found)
+
+    def segments(self) -> List[str]:
+        """Segment files ordered oldest first."""
+        return [path for _, path in self._indexed_segments()]
+
+    def _current_segment(self, incoming: int) -> str:
+        segments = self.segments()
+        if not segments:
+            return self._segment_path(1)
+
+        current = segments[-1]
+        size = os.path.getsize(current)
+        if size > 0 and size + incoming > self.segment_max_bytes:
+            index = int(self.SEGMENT_PATTERN.match(os.path.basename(current)).group(1))
+            return self._segment_path(index + 1)
+        return current
+
+    @contextmanager
+    def _directory_lock(self) -> Iterator[None]:
+        """Hold the directory's exclusive write lock, shared with other processes."""
+        fd = os.open(os.path.join(self.path, self.LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+    def _write_batch(self, lines: List[str]):
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        # Choose the segment under the lock too, so a rollover by another
+        # writer can't leave this batch behind in an older segment
+        with self._directory_lock():
+            fd = os.open(self._current_segment(len(data)), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, data)
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def iter_records(self) -> Iterator[Dict]:
+        for segment in self.segments():
+            with open(segment, 'rb') as file:
+                yield from self._parse_lines(file.read().splitlines(), segment)
+
+    def read_since(self, cursor: Any = None) -> Tuple[List[Dict], Any]:
+        """
+        Read records after a [segment index, byte offset] cursor, complete
+        lines only. Segments before the cursor's are skipped: writers append
+        only to the newest segment, so an older one is complete.
+        """
+        index, offset = cursor or (0, 0)
+        records = []
+
+        for segment_index, segment in self._indexed_segments():
+            if segment_index < index:
+                continue
+            start = offset if segment_index == index else 0
+
+            with open(segment, 'rb') as file:
+                file.seek(start)
+                data = file.read()
+
+            # Leave a partially written last line for the next read
+            end = data.rfind(b'\n') + 1
+            records.extend(self._parse_lines(data[:end].splitlines(), segment))
+            index, offset = segment_index, start + end
+
+        return records, [index, offset]
+
+    @staticmethod
+    def _parse_lines(lines: List[bytes], segment: str) -> Iterator[Dict]:
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                logger.warning(f"Skipping corrupt usage record in {segment}")
+
+
+class SqliteUsageStore(BufferedUsageStore):
+    """Usage records in a SQLite database running in WAL mode."""
+
+    def __init__(self, path: str = 'storage/usage.db', **kwargs):
+        self.path = os.path.abspath(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn_lock = threading.Lock()
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "record TEXT NOT NULL)"
+            )
+            self._conn.commit()
+        super().__init__(**kwargs)
+
+    def _write_batch(self, lines: List[str]):
+        with self._conn_lock:
+            with self._conn:
+                self._conn.executemany("INSERT INTO usage (record) VALUES (?)", [(line,) for line in lines])
+
+    def iter_records(self) -> Iterator[Dict]:
+        with self._conn_lock:
+            rows = self._conn.execute("SELECT record FROM usage ORDER BY id").fetchall()
+        for (line,) in rows:
+            yield json.loads(line)
+
+    def read_since(self, cursor: Any = None) -> Tuple[List[Dict], Any]:
+        """Read records with a row id above the cursor."""
+        last_id = cursor or 0
+        with self._conn_lock:
+            rows = self._conn.execute(
+                "SELECT id, record FROM usage WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        if rows:
+            last_id = rows[-1][0]
+        return [json.loads(line) for _, line in rows], last_id
+
+    def close(self):
+        super().close()
+        with self._conn_lock:
+            self._conn.close()
+
+
+USAGE_STORES = {
+    'jsonl': JsonlUsageStore,
+    'sqlite': SqliteUsageStore
+}
+
+
+def create_usage_store(settings: Optional[Dict] = None) -> UsageStore:
+    """
+    Build the usage store described by the `usage_store` settings block.
+
+    Args:
+        settings: Dictionary with `backend` (jsonl or sqlite) and backend options.
+            If `legacy_path` points at an existing JSON array log it is migrated.
+
+    Returns:
+        A ready-to-use usage store
+    """
+    settings = dict(settings or {})
+    backend = settings.pop('backend', 'jsonl')
+    legacy_path = settings.pop('legacy_path', DEFAULT_LEGACY_PATH)
+
+    store_class = USAGE_STORES.get(backend)
+    if store_class is None:
+        raise ValueError(f"Unknown usage store backend: {backend}")
+
+    store = store_class(**settings)
+
+    if legacy_path:
+        migrate_legacy_log(legacy_path, store)
+
+    return store
+
+
+def migrate_legacy_log(legacy_path: str, store: UsageStore) -> int:
+    """
+    One-time import of the old JSON array log into a usage store.
+
+    The legacy file is renamed before it is read so only one worker process
+    performs the import, and renamed to `<path>.migrated` once done.
+
+    Returns:
+        Number of records migrated
+    """
+    claimed = f"{legacy_path}.migrating"
+    try:
+        os.rename(legacy_path, claimed)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        logger.error(f"Could not claim legacy usage log {legacy_path}: {str(e)}")
+        return 0
+
+    try:
+        with open(claimed, 'r') as file:
+            records = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.error(f"Legacy usage log {legacy_path} is unreadable, leaving it at {claimed}: {str(e)}")
+        return 0
+
+    if not isinstance(records, list):
+        records = []
+
+    store.append_many(records)
+    store.flush()
+    os.replace(claimed, f"{legacy_path}.migrated")
+
+    logger.info(f"Migrated {len(records)} usage record(s) from {legacy_path}")
+    return len(records)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Usage log store maintenance")
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--config', default=os.environ.get('CONFIG_PATH', 'config/providers.yaml'))
+    parser.add_argument('--legacy-path', default=DEFAULT_LEGACY_PATH)
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file) or {}
+
+    store_settings = dict(config.get('settings', {}).get('usage_store', {}))
+    store_settings['legacy_path'] = None
+    usage_store = create_usage_store(store_settings)
+    count = migrate_legacy_log(args.legacy_path, usage_store)
+    usage_store.close()
+    print(f"Migrated {count} record(s)")
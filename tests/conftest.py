@@ -0,0 +1,11 @@
+"""
+Shared test fixtures
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path, monkeypatch):
+    """Run each test from a scratch directory so relative storage paths never touch the repo."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,127 @@
+"""
+Tests for admission control
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.admission import AdmissionController, AdmissionRejectedError
+
+
+def _controller(**overrides):
+    settings = dict(max_concurrency=1, max_queue=4, classes={
+        'interactive': {'priority': 0, 'max_wait': 1.0},
+        'bulk': {'priority': 1, 'max_wait': 1.0}
+    })
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+def test_admits_up_to_concurrency_then_queues():
+    """Test that a queued request gets the slot as soon as it is released."""
+    controller = _controller()
+    first = controller.enter()
+
+    threading.Timer(0.1, first.release).start()
+    with controller.enter() as second:
+        assert second.waited >= 0.05
+        assert controller.status()['active'] == 1
+    assert controller.status()['active'] == 0
+
+def test_higher_priority_served_first():
+    """Test that an interactive request overtakes bulk requests already queued."""
+    controller = _controller()
+    holder = controller.enter()
+    order = []
+
+    def wait(class_name):
+        with controller.enter(class_name):
+            order.append(class_name)
+
+    threads = [threading.Thread(target=wait, args=('bulk',))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=wait, args=('interactive',)))
+    threads[1].start()
+    time.sleep(0.05)
+    assert controller.status()['queued'] == {'interactive': 1, 'bulk': 1}
+
+    holder.release()
+    for thread in threads:
+        thread.join()
+    assert order == ['interactive', 'bulk']
+
+def test_rejects_when_expected_wait_breaks_slo():
+    """Test that a request is turned away up front once the queue is too slow for it."""
+    controller = _controller()
+    with controller.enter():
+        time.sleep(0.6)
+    # One request takes ~0.6s, so the second in line would wait ~1.2s
+    holder = controller.enter()
+    waiter = threading.Thread(target=lambda: controller.enter().release())
+    waiter.start()
+    time.sleep(0.05)
+
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        controller.enter()
+    assert rejected.value.retry_after == pytest.approx(1.2, abs=0.2)
+    assert rejected.value.retry_after_header == '2'
+
+    holder.release()
+    waiter.join()
+    assert controller.status()['classes']['interactive']['rejected'] == 1
+
+def test_queued_request_times_out():
+    """Test that a request not admitted within max_wait leaves the queue."""
+    controller = _controller(classes={'interactive': {'priority': 0, 'max_wait': 0.1},
+                                      'bulk': {'priority': 1, 'max_wait': 0.1}})
+    holder = controller.enter()
+
+    with pytest.raises(AdmissionRejectedError):
+        controller.enter()
+    assert controller.status()['queued'] == {'interactive': 0, 'bulk': 0}
+
+    holder.release()
+    controller.enter().release()
+    assert controller.status()['active'] == 0
+
+def test_full_queue_rejects():
+    """Test that the queue is bounded."""
+    controller = _controller(max_queue=1)
+    holder = controller.enter()
+    waiter = threading.Thread(target=lambda: controller.enter().release())
+    waiter.start()
+    time.sleep(0.05)
+
+    with pytest.raises(AdmissionRejectedError, match="queue is full"):
+        controller.enter('bulk')
+
+    holder.release()
+    waiter.join()
+
+def test_async_enter_and_cancel():
+    """Test that async waiters are granted slots and a cancelled waiter leaves no trace."""
+    controller = _controller()
+
+    async def run():
+        holder = await controller.aenter()
+        cancelled = asyncio.ensure_future(controller.aenter())
+        queued = asyncio.ensure_future(controller.aenter())
+        await asyncio.sleep(0.05)
+        cancelled.cancel()
+        holder.release()
+        slot = await queued
+        slot.release()
+
+    asyncio.run(run())
+    status = controller.status()
+    assert status['active'] == 0
+    assert status['queued'] == {'interactive': 0, 'bulk': 0}
+
+def test_unknown_class_is_rejected():
+    """Test that a request naming an undefined class is a client error."""
+    with pytest.raises(ValueError):
+        _controller().enter('urgent')
+    with pytest.raises(ValueError):
+        _controller(default_class='urgent')
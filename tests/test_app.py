@@ -0,0 +1,62 @@
+"""
+Tests for request validation in the Flask and ASGI apps
+"""
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as flask_app
+import asgi
+
+BAD_BODIES = [
+    {"prompt": "hi", "max_tokens": None},
+    {"prompt": "hi", "temperature": [1]},
+    {"prompt": "hi", "max_tokens": "abc"},
+    {"prompt": 123}
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    manager = MagicMock()
+    monkeypatch.setattr(flask_app, 'provider_manager', manager)
+    with flask_app.app.test_client() as client:
+        yield client, manager
+
+@pytest.mark.parametrize("path", ['/generate', '/generate/stream'])
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_malformed_fields_are_rejected(client, path, body):
+    """Test that wrongly typed fields get a 400 before any provider or admission slot is used."""
+    client, manager = client
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == "Invalid request"
+    manager.admit.assert_not_called()
+
+def test_batch_rejects_malformed_timeout(client):
+    """Test that a wrongly typed batch timeout is a 400."""
+    client, _ = client
+    response = client.post('/generate/batch', json={"items": [{"prompt": "hi"}], "timeout": [5]})
+
+    assert response.status_code == 400
+
+@pytest.fixture
+def asgi_client(monkeypatch):
+    manager = MagicMock()
+    manager.needs_reload.return_value = False
+    monkeypatch.setattr(asgi, 'provider_manager', manager)
+    # Without the context manager the lifespan (and its config load) doesn't run
+    yield TestClient(asgi.app), manager
+
+@pytest.mark.parametrize("path", ['/generate', '/generate/stream'])
+@pytest.mark.parametrize("body", BAD_BODIES)
+def test_asgi_malformed_fields_are_rejected(asgi_client, path, body):
+    """Test that the ASGI endpoints answer wrongly typed fields like the Flask ones."""
+    client, manager = asgi_client
+    response = client.post(path, json=body)
+
+    assert response.status_code == 400
+    assert response.json()['error'] == "Invalid request"
+    manager.aadmit.assert_not_called()
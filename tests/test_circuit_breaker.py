@@ -0,0 +1,58 @@
+"""
+Tests for the per-provider circuit breaker
+"""
+import time
+
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def test_opens_after_failure_rate_exceeded():
+    """Test that the circuit opens once enough calls in the window have failed."""
+    breaker = CircuitBreaker(min_calls=4, failure_rate=0.5, cooldown=30)
+
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() is False
+    assert breaker.status()['retryIn'] > 0
+
+def test_half_open_admits_a_single_trial():
+    """Test that only one request probes a provider after the cooldown."""
+    breaker = CircuitBreaker(min_calls=1, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow() is False
+
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() is True
+
+def test_failed_trial_reopens():
+    """Test that a failed trial request starts a new cooldown."""
+    breaker = CircuitBreaker(min_calls=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow() is True
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() is False
+
+def test_old_outcomes_leave_the_window():
+    """Test that failures older than the window no longer count."""
+    breaker = CircuitBreaker(window=0.05, min_calls=2, failure_rate=0.5)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.record_success()
+    breaker.record_success()
+
+    assert breaker.state == CLOSED
+    assert breaker.status()['failures'] == 0
@@ -0,0 +1,20 @@
+"""
+Tests for cost calculation
+"""
+import pytest
+
+from utils.cost_tracker import calculate_cost, estimate_cost
+
+
+def test_flat_cost_rate_applies_to_all_tokens():
+    """Test that a single cost_per_1k_tokens rate is charged for prompt and completion tokens."""
+    assert calculate_cost('groq', 1000, 500, {'cost_per_1k_tokens': 0.002}) == pytest.approx(0.003)
+    assert calculate_cost('hf', 1000, 500, {'cost_per_1k_tokens': {'prompt': 0.001, 'completion': 0.004}}) == \
+        pytest.approx(0.003)
+    assert calculate_cost('local', 1000, 500, {}) == 0.0
+
+def test_estimate_uses_the_same_rates():
+    """Test that estimates accept a flat rate too."""
+    estimate = estimate_cost("one two three", 1000, {'cost_per_1k_tokens': 0.002}, approx_tokens_per_word=1.0)
+    assert estimate['estimated_prompt_tokens'] == 3
+    assert estimate['estimated_completion_cost'] == pytest.approx(0.002)
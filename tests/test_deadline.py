@@ -0,0 +1,87 @@
+"""
+Tests for request deadlines
+"""
+import http.server
+import threading
+import time
+
+import pytest
+
+from services import deadline
+from services.deadline import DeadlineExceededError
+from services.providers.llama_provider import LlamaProvider
+
+
+class _SlowHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(2)
+        self.send_response(500)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def slow_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _SlowHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def test_no_deadline_leaves_timeouts_alone():
+    """Test that code outside a deadline scope behaves as before."""
+    assert deadline.remaining() is None
+    assert deadline.cap(10) == 10
+
+def test_cap_and_sleep_respect_remaining_time():
+    """Test that timeouts shrink to the time left and hopeless backoffs are skipped."""
+    with deadline.scope(0.5) as budget:
+        assert deadline.cap(10) <= 0.5
+        assert deadline.sleep(0.01) is True
+        assert deadline.sleep(1.0) is False
+        assert budget.remaining() > 0.4
+
+    with deadline.scope(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceededError):
+            deadline.cap(10)
+
+def test_attempt_narrows_and_records():
+    """Test that an attempt only sees its allotment and lands in the ledger."""
+    with deadline.scope(10) as budget:
+        with deadline.attempt('first', 0.2):
+            assert deadline.remaining() <= 0.2
+        with pytest.raises(ValueError):
+            with deadline.attempt('second', 1.0):
+                raise ValueError("boom")
+        assert deadline.remaining() > 9
+
+    report = budget.report()
+    assert [(a['provider'], a['outcome']) for a in report['providers']] == [('first', 'success'), ('second', 'error')]
+    assert report['providers'][0]['allotted'] == 0.2
+
+def test_allot_holds_back_budget_for_fallbacks():
+    """Test that earlier providers get a share and the last one gets the rest."""
+    budget = deadline.Deadline(10)
+    assert budget.allot(3, 0.5) == pytest.approx(5, abs=0.01)
+    assert budget.allot(1, 0.5) == pytest.approx(10, abs=0.01)
+
+def test_provider_retries_stop_at_deadline(slow_url):
+    """Test that a provider's timeout and retries are bounded by the request deadline."""
+    provider = LlamaProvider({'name': 'llama', 'endpoint': f"{slow_url}/api/generate",
+                              'timeout': 10, 'retry_count': 3})
+
+    started = time.monotonic()
+    with deadline.scope(0.3):
+        with pytest.raises(DeadlineExceededError):
+            provider.generate("Say hello", 10, 0)
+
+    assert time.monotonic() - started < 1.0
+    provider.close()
@@ -0,0 +1,98 @@
+"""
+Tests for the pooled HTTP client
+"""
+import http.server
+import threading
+
+import pytest
+
+from services.http_pool import HttpPool
+
+
+class _EchoHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _EchoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/"
+    server.shutdown()
+    server.server_close()
+
+def test_connection_is_reused(server_url):
+    """Test that the second request reports a reused keep-alive connection."""
+    pool = HttpPool({'max_connections': 2}, name='test')
+
+    first, first_reused = pool.post(server_url, json={})
+    second, second_reused = pool.post(server_url, json={})
+
+    assert first.json() == {'ok': True}
+    assert first_reused is False
+    assert second_reused is True
+    pool.close()
+
+def test_closed_pool_still_serves_stragglers(server_url):
+    """Test that a request issued after retirement completes on a fresh connection."""
+    pool = HttpPool(name='test')
+    pool.post(server_url, json={})
+    pool.close()
+
+    assert pool.client.is_closed
+    response, reused = pool.post(server_url, json={})
+    assert response.status_code == 200
+    assert reused is False
+
+def test_http2_without_h2_falls_back(monkeypatch):
+    """Test that requesting HTTP/2 without the h2 package degrades to HTTP/1.1."""
+    monkeypatch.setattr('services.http_pool._http2_available', lambda: False)
+    pool = HttpPool({'http2': True}, name='test')
+    assert pool.http2 is False
+    pool.close()
+
+def test_async_connection_is_reused(server_url):
+    """Test that the async client also keeps connections alive."""
+    import asyncio
+
+    pool = HttpPool(name='test')
+
+    async def run():
+        first = await pool.apost(server_url, json={})
+        second = await pool.apost(server_url, json={})
+        await pool.aclient.aclose()
+        return first[1], second[1]
+
+    assert asyncio.run(run()) == (False, True)
+    pool.close()
+
+def test_async_client_per_event_loop(server_url):
+    """Test that a pool used from a second event loop gets a client bound to that loop."""
+    import asyncio
+
+    pool = HttpPool(name='test')
+
+    async def run():
+        response, reused = await pool.apost(server_url, json={})
+        client = pool.aclient
+        await client.aclose()
+        return response.status_code, reused, client
+
+    first = asyncio.run(run())
+    second = asyncio.run(run())
+
+    assert first[:2] == second[:2] == (200, False)
+    assert first[2] is not second[2]
+    pool.close()
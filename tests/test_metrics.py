@@ -0,0 +1,125 @@
+"""
+Tests for the metrics registry and its Prometheus export
+"""
+import json
+import subprocess
+import sys
+import threading
+
+import httpx
+
+from services.deadline import DeadlineExceededError
+from services.metrics import Registry, error_class
+
+
+def test_counter_and_histogram_render():
+    """Test the Prometheus text for a counter and a histogram."""
+    registry = Registry()
+    requests = registry.counter('test_requests_total', "Requests", ('provider',))
+    latency = registry.histogram('test_latency_seconds', "Latency", ('provider',), buckets=(0.1, 1.0))
+
+    requests.inc('groq')
+    requests.inc('groq', amount=2)
+    latency.observe(0.05, 'groq')
+    latency.observe(0.5, 'groq')
+    latency.observe(3.0, 'groq')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE test_requests_total counter' in lines
+    assert 'test_requests_total{provider="groq"} 3' in lines
+    assert 'test_latency_seconds_bucket{provider="groq",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{provider="groq",le="1.0"} 2' in lines
+    assert 'test_latency_seconds_bucket{provider="groq",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum{provider="groq"} 3.55' in lines
+    assert 'test_latency_seconds_count{provider="groq"} 3' in lines
+
+def test_threads_record_without_losing_counts():
+    """Test that per-thread shards add up to every increment."""
+    registry = Registry()
+    counter = registry.counter('test_total', "Total", ('kind',))
+
+    def record():
+        for _ in range(10000):
+            counter.inc('a')
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert 'test_total{kind="a"} 80000' in registry.render().splitlines()
+
+def test_exited_threads_are_folded_into_one_shard():
+    """Test that a thread per request doesn't leave a shard per request behind."""
+    registry = Registry()
+    counter = registry.counter('test_total', "Total", ('kind',))
+    latency = registry.histogram('test_seconds', "Latency", ('kind',), buckets=(1.0,))
+
+    def record():
+        counter.inc('a')
+        latency.observe(0.5, 'a')
+
+    for _ in range(500):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+
+    assert len(registry._shards) <= 2
+    lines = registry.render().splitlines()
+    assert 'test_total{kind="a"} 500' in lines
+    assert 'test_seconds_count{kind="a"} 500' in lines
+    assert registry._shards == []
+
+def test_gauges_are_collected_at_render_time():
+    """Test that a gauge reads its callback, and re-registering replaces it."""
+    registry = Registry()
+    depth = {'bulk': 2}
+    registry.gauge('test_queue_depth', "Queued", ('class',), lambda: {(name,): n for name, n in depth.items()})
+
+    assert 'test_queue_depth{class="bulk"} 2' in registry.render()
+    depth['bulk'] = 5
+    assert 'test_queue_depth{class="bulk"} 5' in registry.render()
+
+    registry.gauge('test_queue_depth', "Queued", ('class',), lambda: {('bulk',): 7})
+    assert 'test_queue_depth{class="bulk"} 7' in registry.render()
+
+def test_workers_are_merged(tmp_path):
+    """Test that counters sum over every worker's file, and gauges skip exited workers."""
+    registry = Registry()
+    registry.counter('test_total', "Total", ('kind',)).inc('a', amount=3)
+    registry.gauge('test_active', "Active", (), lambda: {(): 1})
+    registry.configure({'path': str(tmp_path), 'flush_interval': 60})
+
+    # A worker that has since exited
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    (tmp_path / f"metrics-{exited.pid}.json").write_text(json.dumps({
+        "pid": exited.pid,
+        "values": [["test_total", ["a"], 4]],
+        "histograms": [],
+        "gauges": [["test_active", [], 6]]
+    }))
+
+    lines = registry.render().splitlines()
+    assert 'test_total{kind="a"} 7' in lines
+    assert 'test_active 1' in lines
+    assert (tmp_path / f"metrics-{registry.snapshot()['pid']}.json").exists()
+
+def test_error_class_follows_wrapped_errors():
+    """Test that a provider's wrapped error is labelled by its cause."""
+    request = httpx.Request('POST', 'http://test')
+    status_error = httpx.HTTPStatusError("error", request=request,
+                                         response=httpx.Response(429, request=request))
+    try:
+        try:
+            raise status_error
+        except Exception as e:
+            raise Exception("Groq request failed") from e
+    except Exception as wrapped:
+        assert error_class(wrapped) == 'http_429'
+
+    assert error_class(httpx.ReadTimeout("slow")) == 'timeout'
+    assert error_class(httpx.ConnectError("refused")) == 'connection'
+    assert error_class(DeadlineExceededError("late")) == 'deadline'
+    assert error_class(KeyError("choices")) == 'KeyError'
@@ -121,4 +121,769 @@ def test_cost_calculation(provider_manager):
     # Total: $0.000025
     expected_cost = 0.000025
     
-    assert result['cost'] == pytest.approx(expected_cost)
\ No newline at end of file
+    assert result['cost'] == pytest.approx(expected_cost)
+
+def _write_config(path, config):
+    import yaml
+    path.write_text(yaml.safe_dump(config))
+
+def test_reload_rebuilds_only_changed_providers(mock_importlib, tmp_path):
+    """Test that a config reload keeps unchanged providers and rebuilds edited ones."""
+    import copy
+    import os
+
+    config_path = tmp_path / "providers.yaml"
+    _write_config(config_path, TEST_CONFIG)
+    manager = ProviderManager.from_config_file(str(config_path))
+    first, second = manager.providers
+
+    updated = copy.deepcopy(TEST_CONFIG)
+    updated['providers'][1]['cost_per_1k_tokens']['prompt'] = 0.005
+    _write_config(config_path, updated)
+    os.utime(config_path, (0, manager._config_mtime + 10))
+
+    assert manager.needs_reload() is True
+    assert manager.reload_if_changed() is True
+    assert manager.providers[0] is first
+    assert manager.providers[1] is not second
+    assert manager.providers[1].config['cost_per_1k_tokens']['prompt'] == 0.005
+
+    # Nothing changed on disk since the last reload
+    assert manager.needs_reload() is False
+    assert manager.reload_if_changed() is False
+
+def test_reload_drops_disabled_providers(provider_manager):
+    """Test that disabling a provider removes it without touching the snapshot in use."""
+    import copy
+
+    in_flight = provider_manager.providers
+    updated = copy.deepcopy(TEST_CONFIG)
+    updated['providers'][0]['enabled'] = False
+    provider_manager.reload(updated)
+
+    assert [p.name for p in provider_manager.providers] == ['test_provider_2']
+    assert len(in_flight) == 2
+
+def test_reload_closes_retired_providers(provider_manager):
+    """Test that providers dropped by a reload release their resources."""
+    import copy
+
+    retired = provider_manager.providers[0]
+    retired.close = MagicMock()
+    updated = copy.deepcopy(TEST_CONFIG)
+    updated['providers'][0]['enabled'] = False
+    provider_manager.reload(updated)
+
+    retired.close.assert_called_once()
+
+def test_reload_rebuilds_components_whose_settings_changed(mock_importlib):
+    """Test that a reload applies edited settings sections and keeps untouched components."""
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['settings']['routing'] = {'enabled': True, 'state_path': None}
+    config['settings']['response_cache'] = {'enabled': True, 'ttl': 60}
+    manager = ProviderManager(config)
+    manager.generate("Test prompt", cache='bypass')
+    router, cache = manager.router, manager.response_cache
+
+    updated = copy.deepcopy(config)
+    updated['settings']['routing']['epsilon'] = 0.0
+    updated['settings']['admission'] = {'enabled': True, 'max_concurrency': 2}
+    manager.reload(updated)
+
+    assert manager.response_cache is cache
+    assert manager.router is not router
+    assert manager.router.epsilon == 0.0
+    assert manager.router.stats['test_provider_1'].samples == 1
+    assert manager.admission.max_concurrency == 2
+
+def test_agenerate_success(provider_manager):
+    """Test the async path through a provider without a native agenerate()."""
+    import asyncio
+
+    result = asyncio.run(provider_manager.agenerate("Test prompt"))
+
+    assert result['modelUsed'] == 'test_provider_1'
+    assert result['cost'] == pytest.approx(0.000025)
+
+def test_agenerate_fallback(provider_manager):
+    """Test async fallback to the second provider when the first one fails."""
+    import asyncio
+
+    provider_manager.providers[0].agenerate = MagicMock(side_effect=Exception("Provider failed"))
+    result = asyncio.run(provider_manager.agenerate("Test prompt"))
+
+    assert result['modelUsed'] == 'test_provider_2'
+
+def _enable_hedging(manager, slow_seconds):
+    import time
+
+    manager.settings = dict(manager.settings, hedging={'enabled': True, 'min_samples': 1, 'min_delay': 0.01})
+    manager._latency_tracker(manager.providers[0]).record(0.01)
+
+    slow_provider = manager.providers[0]
+    fast_result = slow_provider.mock_response
+
+    def slow_generate(prompt, max_tokens, temperature):
+        time.sleep(slow_seconds)
+        return dict(fast_result)
+
+    slow_provider.generate = slow_generate
+    return slow_provider
+
+def test_hedged_generate_returns_faster_provider(provider_manager):
+    """Test that a slow primary is hedged and the faster provider wins."""
+    import time
+
+    _enable_hedging(provider_manager, slow_seconds=0.3)
+    result = provider_manager.generate("Test prompt")
+
+    assert result['modelUsed'] == 'test_provider_2'
+    assert result['hedged'] is True
+
+    # The slow call still completes and is logged as the losing side
+    time.sleep(0.4)
+    provider_manager.usage_store.flush()
+    records = list(provider_manager.usage_store.iter_records())
+    outcomes = {r['modelUsed']: r.get('hedgeOutcome') for r in records}
+    assert outcomes == {'test_provider_2': None, 'test_provider_1': 'lost'}
+
+def test_hedged_agenerate_cancels_loser(provider_manager):
+    """Test that the async hedging path cancels the slower attempt."""
+    import asyncio
+
+    slow_provider = _enable_hedging(provider_manager, slow_seconds=0.3)
+
+    async def slow_agenerate(prompt, max_tokens, temperature):
+        await asyncio.sleep(0.3)
+        return dict(slow_provider.mock_response)
+
+    slow_provider.agenerate = slow_agenerate
+
+    async def run():
+        result = await provider_manager.agenerate("Test prompt")
+        await asyncio.sleep(0)  # let the cancellation callback run
+        return result
+
+    result = asyncio.run(run())
+    assert result['modelUsed'] == 'test_provider_2'
+
+    provider_manager.usage_store.flush()
+    records = list(provider_manager.usage_store.iter_records())
+    assert any(r['modelUsed'] == 'test_provider_1' and r.get('hedgeOutcome') == 'cancelled' for r in records)
+
+def test_cancelled_hedge_loser_frees_half_open_trial(provider_manager):
+    """Test that cancelling a hedge loser that was a half-open trial lets the next request probe again."""
+    import asyncio
+    import time
+    from services.circuit_breaker import CircuitBreaker
+
+    slow_provider = _enable_hedging(provider_manager, slow_seconds=0.3)
+
+    async def slow_agenerate(prompt, max_tokens, temperature):
+        await asyncio.sleep(0.3)
+        return dict(slow_provider.mock_response)
+
+    slow_provider.agenerate = slow_agenerate
+    breaker = provider_manager.breakers['test_provider_1'] = CircuitBreaker(name='test_provider_1', cooldown=60)
+    breaker._state = 'open'
+    breaker._opened_at = time.time() - 61
+
+    async def run():
+        result = await provider_manager.agenerate("Test prompt", cache='bypass')
+        await asyncio.sleep(0)  # let the cancellation reach the loser
+        return result
+
+    assert asyncio.run(run())['modelUsed'] == 'test_provider_2'
+    assert breaker.state == 'half_open'
+    assert breaker.allow()
+
+def test_no_hedge_without_latency_samples(provider_manager):
+    """Test that a provider is not hedged before enough latencies are known."""
+    provider_manager.settings = dict(provider_manager.settings, hedging={'enabled': True, 'min_samples': 5})
+
+    result = provider_manager.generate("Test prompt")
+
+    assert result['modelUsed'] == 'test_provider_1'
+    assert 'hedged' not in result
+
+@pytest.fixture
+def cached_manager(mock_importlib):
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['settings']['response_cache'] = {'enabled': True}
+    return ProviderManager(config)
+
+def test_cache_hit_is_free_and_tagged(cached_manager):
+    """Test that a repeated deterministic prompt is served from the cache."""
+    provider = cached_manager.providers[0]
+    provider.generate = MagicMock(return_value=dict(provider.mock_response))
+
+    first = cached_manager.generate("What is ML?", temperature=0)
+    second = cached_manager.generate("What is  ML? ", temperature=0)
+
+    assert provider.generate.call_count == 1
+    assert 'cached' not in first
+    assert second['cached'] is True
+    assert second['cost'] == 0.0
+    assert second['response'] == first['response']
+
+def test_cache_modes(cached_manager):
+    """Test bypass, only and the default temperature rule."""
+    from services.response_cache import CacheMissError
+
+    with pytest.raises(CacheMissError):
+        cached_manager.generate("What is ML?", temperature=0, cache='only')
+
+    cached_manager.generate("What is ML?", temperature=0, cache='bypass')
+    with pytest.raises(CacheMissError):
+        cached_manager.generate("What is ML?", temperature=0, cache='only')
+
+    cached_manager.generate("What is ML?", temperature=0.7)
+    assert 'cached' not in cached_manager.generate("What is ML?", temperature=0.7)
+
+    cached_manager.generate("What is ML?", temperature=0)
+    assert cached_manager.generate("What is ML?", temperature=0, cache='only')['cached'] is True
+
+    with pytest.raises(ValueError):
+        cached_manager.generate("What is ML?", cache='sometimes')
+
+def test_similarity_cache_serves_near_duplicates(mock_importlib):
+    """Test that a near-duplicate prompt is answered from the approximate cache."""
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['settings']['similarity_cache'] = {'enabled': True}
+    manager = ProviderManager(config)
+
+    manager.generate("What is machine learning?", temperature=0)
+    result = manager.generate("what is machine learning", temperature=0)
+
+    assert result['cached'] is True
+    assert result['cacheMatch'] == 'approximate'
+    assert result['cost'] == 0.0
+    assert manager.get_cache_stats()['approximate']['hits'] == 1
+
+def _chunked(*chunks, fail_after=None):
+    """A provider stream() replacement yielding the given chunks."""
+    def stream(prompt, max_tokens, temperature):
+        for index, chunk in enumerate(chunks):
+            if index == fail_after:
+                raise Exception("Connection dropped")
+            yield chunk
+        return {"response": ''.join(chunks), "tokens": {"prompt": 5, "completion": 10, "total": 15}}
+    return stream
+
+def test_stream_relays_chunks_then_done(provider_manager):
+    """Test that chunks are relayed in order and the done event carries metadata."""
+    provider_manager.providers[0].stream = _chunked("Hello", ", ", "world")
+
+    events = list(provider_manager.stream("Test prompt"))
+
+    assert events[:-1] == [('chunk', {'text': 'Hello'}), ('chunk', {'text': ', '}), ('chunk', {'text': 'world'})]
+    event, summary = events[-1]
+    assert event == 'done'
+    assert summary['modelUsed'] == 'test_provider_1'
+    assert summary['cost'] == pytest.approx(0.000025)
+    assert summary['streamed'] is True
+    assert 'response' not in summary
+
+def test_stream_falls_back_before_first_chunk(provider_manager):
+    """Test that a provider failing before any output is skipped."""
+    provider_manager.providers[0].stream = _chunked("never sent", fail_after=0)
+
+    events = list(provider_manager.stream("Test prompt"))
+
+    assert events[0] == ('chunk', {'text': 'This is a test response'})
+    assert events[-1][1]['modelUsed'] == 'test_provider_2'
+
+def test_stream_does_not_fall_back_after_first_chunk(provider_manager):
+    """Test that a failure mid-stream is raised rather than mixing two providers' output."""
+    provider_manager.providers[0].stream = _chunked("partial", "rest", fail_after=1)
+    second = provider_manager.providers[1]
+    second.generate = MagicMock(return_value=dict(second.mock_response))
+
+    events = provider_manager.stream("Test prompt")
+    assert next(events) == ('chunk', {'text': 'partial'})
+    with pytest.raises(Exception, match="Connection dropped"):
+        next(events)
+    second.generate.assert_not_called()
+
+def test_stream_serves_cache_hits(cached_manager):
+    """Test that a cached answer is streamed as one chunk without calling a provider."""
+    cached_manager.generate("What is ML?", temperature=0)
+    cached_manager.providers[0].stream = MagicMock()
+
+    events = list(cached_manager.stream("What is ML?", temperature=0))
+
+    assert events[0] == ('chunk', {'text': 'This is a test response'})
+    assert events[-1][0] == 'done'
+    assert events[-1][1]['cached'] is True
+    cached_manager.providers[0].stream.assert_not_called()
+
+def test_generate_batch_keeps_order_and_item_errors(provider_manager):
+    """Test that batch results line up with their inputs and failures stay per item."""
+    provider_manager.usage_store = MagicMock()
+
+    results = provider_manager.generate_batch([
+        {'prompt': 'First'},
+        {'max_tokens': 10},
+        {'prompt': 'Third', 'cache': 'sometimes'},
+        {'prompt': 'Fourth', 'temperature': 0}
+    ])
+
+    assert results[0]['modelUsed'] == 'test_provider_1'
+    assert results[1]['status'] == 400
+    assert results[2]['status'] == 400
+    assert results[3]['modelUsed'] == 'test_provider_1'
+
+    # Two successful items, written in a single bulk append
+    provider_manager.usage_store.append.assert_not_called()
+    provider_manager.usage_store.append_many.assert_called_once()
+    assert len(provider_manager.usage_store.append_many.call_args[0][0]) == 2
+
+def test_generate_batch_respects_max_concurrency(mock_importlib):
+    """Test that no more than max_concurrency calls reach a provider at once."""
+    import copy
+    import threading
+    import time
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'] = config['providers'][:1]
+    config['providers'][0]['max_concurrency'] = 2
+    manager = ProviderManager(config)
+
+    provider = manager.providers[0]
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current, peak
+
+    def slow_generate(prompt, max_tokens, temperature):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        time.sleep(0.05)
+        with lock:
+            in_flight[0] -= 1
+        return dict(provider.mock_response)
+
+    provider.generate = slow_generate
+
+    results = manager.generate_batch([{'prompt': f"Prompt {i}"} for i in range(8)])
+
+    assert all(result['modelUsed'] == 'test_provider_1' for result in results)
+    assert in_flight[1] == 2
+
+def test_generate_batch_rejects_oversized_batches(provider_manager):
+    """Test the settings.batch.max_items limit."""
+    provider_manager.settings = dict(provider_manager.settings, batch={'max_items': 2})
+
+    with pytest.raises(ValueError):
+        provider_manager.generate_batch([{'prompt': 'x'}] * 3)
+
+def test_concurrent_identical_requests_are_coalesced(provider_manager):
+    """Test that a burst of the same prompt makes one upstream call billed once."""
+    import threading
+    import time
+
+    provider = provider_manager.providers[0]
+    provider_manager.usage_store = MagicMock()
+    started = threading.Event()
+    calls = []
+
+    def slow_generate(prompt, max_tokens, temperature):
+        calls.append(prompt)
+        started.set()
+        time.sleep(0.1)
+        return dict(provider.mock_response)
+
+    provider.generate = slow_generate
+
+    results = [None] * 4
+
+    def request(index):
+        results[index] = provider_manager.generate("Popular prompt")
+
+    leader = threading.Thread(target=request, args=(0,))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=request, args=(i,)) for i in range(1, 4)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert 'coalesced' not in results[0]
+    assert results[0]['cost'] == pytest.approx(0.000025)
+    for result in results[1:]:
+        assert result['coalesced'] is True
+        assert result['cost'] == 0.0
+        assert result['response'] == results[0]['response']
+
+    logged = [call.args[0] for call in provider_manager.usage_store.append.call_args_list]
+    assert sum(1 for record in logged if record.get('coalesced')) == 3
+
+def test_async_requests_are_coalesced(provider_manager):
+    """Test that concurrent agenerate calls for the same prompt share one call."""
+    import asyncio
+
+    provider = provider_manager.providers[0]
+    calls = []
+
+    async def slow_agenerate(prompt, max_tokens, temperature):
+        calls.append(prompt)
+        await asyncio.sleep(0.05)
+        return dict(provider.mock_response)
+
+    provider.agenerate = slow_agenerate
+
+    async def burst():
+        return await asyncio.gather(*(provider_manager.agenerate("Popular prompt") for _ in range(3)))
+
+    results = asyncio.run(burst())
+
+    assert len(calls) == 1
+    assert sum(1 for result in results if result.get('coalesced')) == 2
+
+def test_bypass_is_never_coalesced(provider_manager):
+    """Test that cache: bypass requests always get their own generation."""
+    assert provider_manager._coalesce_key(provider_manager.providers, "x", 10, 0, 'bypass') is None
+    assert provider_manager._coalesce_key(provider_manager.providers, "x", 10, 0, 'default') is not None
+
+def test_open_circuit_is_skipped_without_calling_provider(provider_manager):
+    """Test that a failing provider is skipped instantly once its circuit opens."""
+    provider_manager.settings = dict(provider_manager.settings, circuit_breaker={'min_calls': 2, 'cooldown': 60})
+    failing = MagicMock(side_effect=Exception("Connection refused"))
+    provider_manager.providers[0].generate = failing
+
+    for _ in range(3):
+        assert provider_manager.generate("Test prompt", cache='bypass')['modelUsed'] == 'test_provider_2'
+
+    assert failing.call_count == 2
+    status = provider_manager.get_provider_status()
+    assert status[0]['circuit']['state'] == 'open'
+    assert status[1]['circuit']['state'] == 'closed'
+
+def test_caller_errors_dont_open_circuit(provider_manager):
+    """Test that 4xx rejections of the request itself leave the provider's circuit closed."""
+    import httpx
+
+    provider_manager.settings = dict(provider_manager.settings, circuit_breaker={'min_calls': 2, 'cooldown': 60})
+    request = httpx.Request('POST', 'http://test')
+    rejected = Exception("test_provider_1 request failed")
+    rejected.__cause__ = httpx.HTTPStatusError("bad request", request=request,
+                                               response=httpx.Response(400, request=request))
+    provider_manager.providers[0].generate = MagicMock(side_effect=rejected)
+
+    for _ in range(3):
+        provider_manager.generate("Test prompt", cache='bypass')
+
+    assert provider_manager.providers[0].generate.call_count == 3
+    assert provider_manager.breakers['test_provider_1'].status()['state'] == 'closed'
+
+def test_adaptive_routing_prefers_faster_provider(mock_importlib):
+    """Test that with routing enabled the faster of two equal-priority providers is used."""
+    import copy
+    import time
+
+    config = copy.deepcopy(TEST_CONFIG)
+    for provider_config in config['providers']:
+        provider_config['priority'] = 1
+    config['settings']['routing'] = {'enabled': True, 'epsilon': 0.0, 'cost_weight': 0.0, 'state_path': None}
+    manager = ProviderManager(config)
+
+    slow = next(p for p in manager.providers if p.name == 'test_provider_1')
+    slow_generate = slow.generate
+
+    def delayed(prompt, max_tokens, temperature):
+        time.sleep(0.02)
+        return slow_generate(prompt, max_tokens, temperature)
+
+    slow.generate = delayed
+
+    # Both get explored until they have min_samples, then the faster one wins
+    for _ in range(8):
+        manager.generate("Test prompt", cache='bypass')
+
+    assert manager.generate("Test prompt", cache='bypass')['modelUsed'] == 'test_provider_2'
+    assert manager.get_provider_status()[0]['routing']['samples'] >= 3
+
+@pytest.fixture
+def context_manager(mock_importlib):
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'][0].update({'context_size': 100, 'max_tokens': 50})
+    config['providers'][1].update({'context_size': 1000, 'max_tokens': 200})
+    config['settings']['context_window'] = {'prompt_token_margin': 0.0}
+    return ProviderManager(config)
+
+def test_long_prompt_skips_small_context_provider(context_manager):
+    """Test that a provider whose context can't fit the prompt is never called."""
+    small = context_manager.providers[0]
+    small.generate = MagicMock(side_effect=AssertionError("should not be called"))
+
+    result = context_manager.generate("word " * 80, max_tokens=100)
+
+    assert result['modelUsed'] == 'test_provider_2'
+    small.generate.assert_not_called()
+
+def test_max_tokens_clamped_to_provider_limit(context_manager):
+    """Test that the completion budget is clamped to the provider's max_tokens."""
+    provider = context_manager.providers[0]
+    provider.generate = MagicMock(return_value=dict(provider.mock_response))
+
+    result = context_manager.generate("short prompt", max_tokens=80)
+
+    assert provider.generate.call_args.kwargs['max_tokens'] == 50
+    assert result['clampedMaxTokens'] == 50
+
+def test_prompt_too_long_for_every_provider(context_manager):
+    """Test that an oversized prompt fails fast without calling any provider."""
+    from services.provider_manager import ContextWindowError
+
+    for provider in context_manager.providers:
+        provider.generate = MagicMock()
+
+    with pytest.raises(ContextWindowError):
+        context_manager.generate("word " * 990, max_tokens=100)
+
+    for provider in context_manager.providers:
+        provider.generate.assert_not_called()
+
+def test_provider_status_reports_tokenizer_readiness(provider_manager):
+    """Test that each provider's tokenizer state is reported for /health."""
+    status = provider_manager.get_provider_status()[0]
+
+    assert status['tokenizer'] == {"spec": "approx", "state": "ready"}
+    assert provider_manager.tokenizers_ready()
+
+def _hang_until_deadline(prompt, max_tokens, temperature):
+    # Like a provider whose HTTP call runs into its (deadline-capped) timeout
+    import time
+    from services import deadline
+
+    time.sleep(deadline.cap(10))
+    raise Exception("timed out")
+
+def test_deadline_is_split_across_fallbacks(provider_manager):
+    """Test that a hanging provider only uses its share, leaving time for the fallback."""
+    provider_manager.providers[0].generate = _hang_until_deadline
+
+    result = provider_manager.generate("Test prompt", cache='bypass', timeout=0.4)
+
+    assert result['modelUsed'] == 'test_provider_2'
+    attempts = result['budget']['providers']
+    assert [a['outcome'] for a in attempts] == ['deadline', 'success']
+    assert attempts[0]['allotted'] == pytest.approx(0.2, abs=0.05)
+    assert result['budget']['deadline'] == 0.4
+
+def test_exhausted_deadline_fails_fast(provider_manager):
+    """Test that a request stops when its deadline passes, however many providers are left."""
+    import asyncio
+    import time
+    from services.deadline import DeadlineExceededError
+
+    for provider in provider_manager.providers:
+        provider.generate = _hang_until_deadline
+
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        provider_manager.generate("Test prompt", cache='bypass', timeout=0.3)
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(provider_manager.agenerate("Test prompt", cache='bypass', timeout=0.3))
+    assert time.monotonic() - started < 1.2
+
+def test_deadline_capped_by_server_maximum(provider_manager):
+    """Test that callers can't ask for more than settings.deadline.max_seconds."""
+    provider_manager.settings = dict(provider_manager.settings, deadline={'max_seconds': 5})
+
+    result = provider_manager.generate("Test prompt", cache='bypass', timeout=600)
+
+    assert result['budget']['deadline'] == 5
+    with pytest.raises(ValueError):
+        provider_manager.generate("Test prompt", cache='bypass', timeout=0)
+
+def test_stream_reports_budget(provider_manager):
+    """Test that the stream's done event says how the deadline was spent."""
+    events = list(provider_manager.stream("Test prompt", cache='bypass', timeout=5))
+
+    event, summary = events[-1]
+    assert event == 'done'
+    assert [a['outcome'] for a in summary['budget']['providers']] == ['success']
+
+def test_slot_wait_is_bounded_by_deadline(mock_importlib):
+    """Test that waiting for a busy provider's slot counts against the attempt's allotment."""
+    import asyncio
+    import copy
+    import threading
+    import time
+    from services.deadline import DeadlineExceededError
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'][0]['max_concurrency'] = 1
+    manager = ProviderManager(config)
+    busy = manager.providers[0]
+    holding = threading.Event()
+
+    def hold_slot(prompt, max_tokens, temperature):
+        holding.set()
+        time.sleep(1.0)
+        return dict(busy.mock_response)
+
+    busy.generate = hold_slot
+    holder = threading.Thread(target=manager.generate, args=("Hold",), kwargs={'cache': 'bypass', 'timeout': 5})
+    holder.start()
+    holding.wait()
+
+    started = time.monotonic()
+    result = manager.generate("Test prompt", cache='bypass', timeout=0.4)
+    assert result['modelUsed'] == 'test_provider_2'
+    assert [a['outcome'] for a in result['budget']['providers']] == ['deadline', 'success']
+
+    manager.providers = [busy]
+    with pytest.raises(DeadlineExceededError):
+        manager.generate("Test prompt", cache='bypass', timeout=0.2)
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(manager.agenerate("Test prompt", cache='bypass', timeout=0.2))
+    assert time.monotonic() - started < 0.9
+    holder.join()
+
+def test_deadline_timeouts_dont_open_circuit(mock_importlib):
+    """Test that attempts cut short by the caller's budget don't count against the provider."""
+    import copy
+    from services.deadline import DeadlineExceededError
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'] = config['providers'][:1]
+    config['settings']['circuit_breaker'] = {'min_calls': 2, 'cooldown': 60}
+    manager = ProviderManager(config)
+    provider = manager.providers[0]
+    answer = provider.generate
+    provider.generate = _hang_until_deadline
+
+    for _ in range(5):
+        with pytest.raises(DeadlineExceededError):
+            manager.generate("Test prompt", cache='bypass', timeout=0.05)
+
+    assert manager.breakers['test_provider_1'].status()['state'] == 'closed'
+    provider.generate = answer
+    assert manager.generate("Test prompt", cache='bypass', timeout=30)['modelUsed'] == 'test_provider_1'
+
+def test_coalesced_followers_keep_their_own_deadline(provider_manager):
+    """Test that a short-budget leader's timeout isn't passed on to followers, nor the other way round."""
+    import threading
+    import time
+    from services.deadline import DeadlineExceededError
+
+    provider_manager.providers = provider_manager.providers[:1]
+    provider = provider_manager.providers[0]
+    provider.generate = _hang_until_deadline
+    results = {}
+
+    def request(name, timeout):
+        try:
+            results[name] = provider_manager.generate("Shared prompt", timeout=timeout)
+        except Exception as e:
+            results[name] = e
+
+    # The leader runs out of time; the follower retries as leader with its own budget
+    leader = threading.Thread(target=request, args=('leader', 0.1))
+    leader.start()
+    time.sleep(0.02)
+    provider.generate = lambda prompt, max_tokens, temperature: {
+        "response": "late", "tokens": {"prompt": 1, "completion": 1, "total": 2}}
+    request('follower', 30)
+    leader.join()
+    assert isinstance(results['leader'], DeadlineExceededError)
+    assert results['follower']['response'] == 'late'
+    assert not results['follower'].get('coalesced')
+
+    # A follower with less time than the leader gives up with a deadline error
+    def slow(prompt, max_tokens, temperature):
+        time.sleep(0.4)
+        return {"response": "slow", "tokens": {"prompt": 1, "completion": 1, "total": 2}}
+
+    provider.generate = slow
+    leader = threading.Thread(target=request, args=('leader', 30))
+    leader.start()
+    time.sleep(0.05)
+    request('follower', 0.1)
+    leader.join()
+    assert results['leader']['response'] == 'slow'
+    assert isinstance(results['follower'], DeadlineExceededError)
+
+def test_rate_limited_provider_is_skipped(mock_importlib):
+    """Test that a provider over its RPM hands requests to the next provider."""
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'][0]['rate_limit'] = {'rpm': 2, 'tpm': 1000, 'on_limit': 'skip'}
+    manager = ProviderManager(config)
+
+    used = [manager.generate("Test prompt", cache='bypass')['modelUsed'] for _ in range(3)]
+
+    assert used == ['test_provider_1', 'test_provider_1', 'test_provider_2']
+    status = manager.get_provider_status()[0]['rateLimit']
+    assert status['skipped'] == 1
+    # Each call reserved 2 + 100 tokens, then settled at the 15 it really used
+    assert status['tpm']['available'] == pytest.approx(1000 - 2 * 15, abs=2)
+
+def test_open_circuit_is_skipped_before_rate_limit(mock_importlib):
+    """Test that a provider with an open circuit neither waits for nor spends its rate limit."""
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'][0]['rate_limit'] = {'rpm': 3, 'on_limit': 'wait', 'max_wait': 5}
+    config['settings']['circuit_breaker'] = {'min_calls': 2, 'cooldown': 60}
+    manager = ProviderManager(config)
+    manager.providers[0].generate = MagicMock(side_effect=Exception("Connection refused"))
+    manager.generate("Test prompt", cache='bypass')
+    manager.generate("Test prompt", cache='bypass')
+
+    manager.generate("Test prompt", cache='bypass')
+    assert manager.get_provider_status()[0]['rateLimit']['rpm']['available'] == 1
+
+def test_reload_keeps_rate_limit_usage(mock_importlib):
+    """Test that rebuilding a provider keeps its spent capacity and removed providers lose their limiter."""
+    import copy
+
+    config = copy.deepcopy(TEST_CONFIG)
+    config['providers'][0]['rate_limit'] = {'rpm': 2, 'on_limit': 'skip'}
+    config['providers'][1]['rate_limit'] = {'rpm': 10}
+    manager = ProviderManager(config)
+    manager.generate("Test prompt", cache='bypass')
+    manager.generate("Test prompt", cache='bypass')
+
+    # Touching the entry rebuilds the provider but not its used-up minute
+    edited = copy.deepcopy(config)
+    edited['providers'][0]['priority'] = 0
+    manager.reload(edited)
+    assert manager.generate("Test prompt", cache='bypass')['modelUsed'] == 'test_provider_2'
+
+    edited['providers'][1]['enabled'] = False
+    manager.reload(edited)
+    assert set(manager.rate_limiters) == {'test_provider_1'}
+
+def test_fallback_is_counted_in_metrics(provider_manager):
+    """Test that a failed provider shows up as an error, a fallback and a successful request."""
+    from services import metrics
+
+    def value(name, *labels):
+        for metric, metric_labels, amount in metrics.REGISTRY.snapshot()['values']:
+            if metric == name and tuple(metric_labels) == labels:
+                return amount
+        return 0
+
+    before = value('llm_fallbacks_total', 'test_provider_1', 'ValueError')
+    provider_manager.providers[0].generate = MagicMock(side_effect=ValueError("bad response"))
+
+    provider_manager.generate("Test prompt", cache='bypass')
+
+    assert value('llm_fallbacks_total', 'test_provider_1', 'ValueError') == before + 1
+    assert value('llm_provider_errors_total', 'test_provider_1', 'ValueError') >= 1
+    rendered = metrics.render()
+    assert 'llm_request_duration_seconds_count{mode="generate",outcome="success"}' in rendered
+    assert 'llm_provider_tokens_total{provider="test_provider_2",kind="completion"}' in rendered
@@ -0,0 +1,99 @@
+"""
+Tests for the per-provider rate limiter
+"""
+import asyncio
+import time
+
+import pytest
+
+from services import deadline
+from services.rate_limiter import RateLimitedError, RateLimiter
+
+
+def test_requests_per_minute_skip():
+    """Test that a skipping limiter refuses requests once the RPM bucket is empty."""
+    limiter = RateLimiter(rpm=2, on_limit='skip')
+    limiter.acquire(0)
+    limiter.acquire(0)
+
+    with pytest.raises(RateLimitedError):
+        limiter.acquire(0)
+    assert limiter.status()['skipped'] == 1
+    assert limiter.status()['rpm'] == {"limit": 2, "available": 0}
+
+def test_waits_for_the_next_slot():
+    """Test that a waiting limiter queues a request until the bucket refills."""
+    limiter = RateLimiter(rpm=600, max_wait=1.0)  # one request per 0.1s
+    for _ in range(600):
+        limiter.acquire(0)
+
+    started = time.monotonic()
+    limiter.acquire(0)
+    assert 0.05 < time.monotonic() - started < 0.5
+
+def test_bounded_wait_and_queue():
+    """Test that waits longer than max_wait, or past the deadline, skip instead."""
+    limiter = RateLimiter(tpm=60, max_wait=0.5)  # one token per second
+    limiter.acquire(60)
+
+    with pytest.raises(RateLimitedError):
+        limiter.acquire(5)
+    limiter.acquire(0)
+
+    with deadline.scope(0.01):
+        limiter = RateLimiter(rpm=600, max_wait=1.0)
+        for _ in range(600):
+            limiter.acquire(0)
+        with pytest.raises(RateLimitedError):
+            limiter.acquire(0)
+
+def test_settle_reconciles_estimate():
+    """Test that the estimated charge is replaced by the real usage."""
+    limiter = RateLimiter(tpm=1000, on_limit='skip')
+    ticket = limiter.acquire(800)
+    assert limiter.status()['tpm']['available'] <= 200
+
+    ticket.settle(100)
+    assert limiter.status()['tpm']['available'] >= 899
+
+    limiter.acquire(500).cancel()
+    assert limiter.status()['tpm']['available'] >= 899
+
+def test_async_acquire():
+    """Test that the async path waits without blocking the loop."""
+    limiter = RateLimiter(rpm=600, max_wait=1.0)
+    for _ in range(600):
+        limiter.acquire(0)
+
+    async def run():
+        ticker = asyncio.create_task(asyncio.sleep(0.01))
+        await limiter.aacquire(0)
+        return ticker.done()
+
+    assert asyncio.run(run()) is True
+    assert limiter.status()['queued'] == 0
+
+def test_inherit_carries_levels_capped_at_new_limits():
+    """Test that a replacement limiter starts from the old one's remaining capacity."""
+    old = RateLimiter(rpm=10, tpm=1000)
+    old.acquire(400)
+    old.acquire(400)
+
+    same = RateLimiter(rpm=10, tpm=1000)
+    same.inherit(old)
+    assert same.status()['rpm']['available'] == 8
+    assert same.status()['tpm']['available'] == pytest.approx(200, abs=1)
+
+    reduced = RateLimiter(rpm=5, tpm=100)
+    reduced.inherit(old)
+    assert reduced.status()['rpm']['available'] == 5
+    assert reduced.status()['tpm']['available'] == 100
+
+    fresh = RateLimiter(rpm=10)
+    fresh.inherit(None)
+    assert fresh.status()['rpm']['available'] == 10
+
+def test_rejects_unknown_mode():
+    """Test that a typo in on_limit fails at load time."""
+    with pytest.raises(ValueError):
+        RateLimiter(rpm=10, on_limit='drop')
@@ -0,0 +1,85 @@
+"""
+Tests for the trace-replay benchmark's workload building
+"""
+import json
+import sqlite3
+
+import pytest
+
+from benchmarks.replay import build_workload, describe_workload, fallback_counts, parse_speed, read_usage
+
+
+def _record(timestamp, response, prompt=12, completion=5, **extra):
+    return dict({"response": response, "tokens": {"prompt": prompt, "completion": completion,
+                                                  "total": prompt + completion},
+                 "cost": 0.001, "modelUsed": "groq", "timestamp": timestamp}, **extra)
+
+
+def test_workload_follows_recorded_traffic():
+    """Test that arrivals keep their spacing and repeated answers repeat the prompt."""
+    records = [
+        _record(1000.0, "Paris"),
+        _record(1002.5, "Berlin", prompt=30, completion=0),
+        _record(1001.0, "Paris", cached=True, cost=0.0),
+        _record(1002.6, "lost race", hedgeOutcome="lost"),
+        _record(1600.0, "Rome"),
+        {"response": "no timestamp"}
+    ]
+    workload = build_workload(records)
+
+    assert [item['at'] for item in workload] == [0.0, 1.0, 2.5, 600.0]
+    assert workload[0]['prompt'] == workload[1]['prompt']
+    assert workload[0]['prompt'] != workload[2]['prompt']
+    assert len(workload[0]['prompt'].split()) == 12
+    assert len(workload[2]['prompt'].split()) == 30
+    assert workload[2]['maxTokens'] == 1
+    assert workload[1]['recorded']['cached']
+
+    assert [item['at'] for item in build_workload(records, max_gap=10)] == [0.0, 1.0, 2.5, 12.5]
+    assert len(build_workload(records, limit=2)) == 2
+
+    described = describe_workload(workload)
+    assert described['requests'] == 4
+    assert described['distinctPrompts'] == 3
+    assert described['recordedCached'] == 1
+    assert described['recordedCostUsd'] == pytest.approx(0.003)
+
+
+def test_read_usage_from_every_store(tmp_path):
+    """Test that the legacy log, JSONL segments and SQLite stores all read back in order."""
+    records = [_record(1000.0 + i, f"r{i}") for i in range(3)]
+
+    legacy = tmp_path / "usage_logs.json"
+    legacy.write_text(json.dumps(records))
+    assert read_usage(str(legacy)) == records
+
+    segments = tmp_path / "usage"
+    segments.mkdir()
+    (segments / "usage-00000001.jsonl").write_text(''.join(json.dumps(r) + '\n' for r in records[:2]))
+    (segments / "usage-00000002.jsonl").write_text(json.dumps(records[2]) + '\n{"cut off')
+    assert read_usage(str(segments)) == records
+
+    database = tmp_path / "usage.db"
+    connection = sqlite3.connect(str(database))
+    connection.execute("CREATE TABLE usage (id INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL)")
+    connection.executemany("INSERT INTO usage (record) VALUES (?)", [(json.dumps(r),) for r in records])
+    connection.commit()
+    connection.close()
+    assert read_usage(str(database)) == records
+
+
+def test_speed_and_fallback_parsing():
+    """Test replay speeds and reading fallback counters from /metrics."""
+    assert parse_speed('max') is None
+    assert parse_speed('10x') == 10.0
+    assert parse_speed('0.5') == 0.5
+
+    body = '\n'.join([
+        '# TYPE llm_fallbacks_total counter',
+        'llm_fallbacks_total{provider="groq",reason="http_429"} 3.0',
+        'llm_fallbacks_total{provider="llama",reason="http_429"} 1.0',
+        'llm_fallbacks_total{provider="llama",reason="timeout"} 2.0',
+        'llm_retries_total{provider="groq",reason="timeout"} 9.0'
+    ])
+    assert fallback_counts(body) == {'http_429': 4.0, 'timeout': 2.0}
+
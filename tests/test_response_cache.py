@@ -0,0 +1,78 @@
+"""
+Tests for the exact-match response cache
+"""
+import time
+
+from services.response_cache import ResponseCache, make_cache_key
+
+RESULT = {
+    "response": "Machine learning is...",
+    "tokens": {"prompt": 5, "completion": 10, "total": 15},
+    "modelUsed": "groq",
+    "cost": 0.001,
+    "connectionReused": True
+}
+
+def test_key_normalizes_whitespace_only():
+    """Test that whitespace differences share a key but other changes don't."""
+    base = make_cache_key("what is  ML?\n", 100, 0.0, ["groq"])
+
+    assert make_cache_key("  what is ML?", 100, 0.0, ["groq"]) == base
+    assert make_cache_key("What is ML?", 100, 0.0, ["groq"]) != base
+    assert make_cache_key("what is ML?", 50, 0.0, ["groq"]) != base
+    assert make_cache_key("what is ML?", 100, 0.0, ["groq", "huggingface"]) != base
+
+def test_get_returns_replayable_fields():
+    """Test that only replayable fields are cached and hits return copies."""
+    cache = ResponseCache()
+    cache.put("k", RESULT)
+
+    hit = cache.get("k")
+    assert hit == {"response": RESULT["response"], "tokens": RESULT["tokens"], "modelUsed": "groq"}
+    hit["response"] = "changed"
+    assert cache.get("k")["response"] == RESULT["response"]
+    assert cache.stats()["hits"] == 2
+
+def test_lru_eviction_by_bytes():
+    """Test that least recently used entries are evicted past the byte bound."""
+    cache = ResponseCache(max_bytes=300)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    cache.get("a")
+    cache.put("c", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] <= 300
+
+def test_ttl_expiry():
+    """Test that entries expire after their TTL."""
+    cache = ResponseCache(ttl=0.05)
+    cache.put("k", RESULT)
+    time.sleep(0.1)
+
+    assert cache.get("k") is None
+
+def test_disk_tier_survives_new_instance(tmp_path):
+    """Test that the on-disk tier serves entries to a fresh cache."""
+    path = str(tmp_path / "cache.db")
+    ResponseCache(disk_path=path).put("k", RESULT)
+
+    assert ResponseCache(disk_path=path).get("k")["response"] == RESULT["response"]
+
+def test_disk_promotion_keeps_expiry(tmp_path):
+    """Test that an entry promoted from disk expires when its disk row does, not a full TTL later."""
+    path = str(tmp_path / "cache.db")
+    ResponseCache(ttl=0.2, disk_path=path).put("k", RESULT)
+    time.sleep(0.1)
+
+    cache = ResponseCache(ttl=60, disk_path=path)
+    assert cache.get("k") is not None
+    time.sleep(0.15)
+    assert cache.get("k") is None
+
+def test_nondeterministic_requests_skipped_by_default():
+    """Test that temperature > 0 is not cacheable unless configured."""
+    assert ResponseCache().is_cacheable(0.0)
+    assert not ResponseCache().is_cacheable(0.7)
+    assert ResponseCache(cache_nondeterministic=True).is_cacheable(0.7)
@@ -0,0 +1,164 @@
+"""
+Tests for the provider retry policy against a local HTTP server
+"""
+import http.server
+import json
+import threading
+import time
+
+import httpx
+import pytest
+
+from services import deadline
+from services.deadline import DeadlineExceededError
+from services.providers.huggingface_provider import HuggingfaceProvider
+from services.providers.llama_provider import LlamaProvider
+from services.retry_policy import RetryPolicy, is_caller_error, is_retryable, parse_retry_after
+
+
+class _ScriptedHandler(http.server.BaseHTTPRequestHandler):
+    """Answers each POST with the next (status, headers, body) from the server's script."""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append(time.monotonic())
+        status, headers, body = self.server.script.pop(0) if self.server.script else (200, {}, {"response": "ok"})
+
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ScriptedHandler)
+    server.script = []
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _llama(server, **config):
+    return LlamaProvider(dict({'name': 'llama', 'endpoint': f"{server.url}/api/generate",
+                               'retry_count': 3, 'retry': {'base_delay': 0.01, 'max_delay': 0.05}}, **config))
+
+def _status_error(status, headers=None):
+    request = httpx.Request('POST', 'http://test')
+    return httpx.HTTPStatusError("error", request=request,
+                                 response=httpx.Response(status, headers=headers, request=request))
+
+def test_classification():
+    """Test that transient failures are retried and rejected requests are not."""
+    for status in (408, 429, 500, 502, 503, 504):
+        assert is_retryable(_status_error(status))
+    for status in (400, 401, 403, 404, 422, 501):
+        assert not is_retryable(_status_error(status))
+    assert is_retryable(httpx.ReadTimeout("slow"))
+    assert is_retryable(httpx.ConnectError("refused"))
+    assert not is_retryable(KeyError("choices"))
+
+def test_caller_errors():
+    """Test that only 4xx rejections caused by the request itself are blamed on the caller."""
+    for status in (400, 404, 413, 422):
+        assert is_caller_error(_status_error(status))
+    for status in (401, 403, 429, 408, 500, 501):
+        assert not is_caller_error(_status_error(status))
+    wrapped = Exception("request failed")
+    wrapped.__cause__ = _status_error(400)
+    assert is_caller_error(wrapped)
+    assert not is_caller_error(httpx.ConnectError("refused"))
+
+def test_parse_retry_after():
+    """Test both Retry-After forms."""
+    assert parse_retry_after(_status_error(429, {'Retry-After': '3'})) == 3
+    in_two_minutes = time.strftime('%a, %d %b %Y %H:%M:%S GMT', time.gmtime(time.time() + 120))
+    assert 110 < parse_retry_after(_status_error(503, {'Retry-After': in_two_minutes})) <= 120
+    assert parse_retry_after(_status_error(503)) is None
+    assert parse_retry_after(ValueError("no response")) is None
+
+def test_jitter_stays_within_bounds():
+    """Test that decorrelated jitter grows from the base delay but never passes the cap."""
+    policy = RetryPolicy(base_delay=0.5, max_delay=4.0)
+    delay = policy.base_delay
+    for _ in range(50):
+        delay = policy.jitter(delay)
+        assert 0.5 <= delay <= 4.0
+
+def test_fatal_status_is_not_retried(server):
+    """Test that a 401 fails on the first attempt."""
+    server.script = [(401, {}, {"error": "bad key"})]
+    provider = _llama(server)
+
+    with pytest.raises(Exception, match="Ollama request failed"):
+        provider.generate("Say hello", 10, 0)
+
+    assert len(server.requests) == 1
+    provider.close()
+
+def test_transient_errors_are_retried(server):
+    """Test that 5xx responses are retried until one succeeds."""
+    server.script = [(502, {}, {}), (500, {}, {})]
+    provider = _llama(server)
+
+    assert provider.generate("Say hello", 10, 0)['response'] == 'ok'
+    assert len(server.requests) == 3
+    provider.close()
+
+def test_retry_after_is_honoured(server):
+    """Test that a 429's Retry-After sets the wait, and a too-long one gives up."""
+    server.script = [(429, {'Retry-After': '0.3'}, {})]
+    provider = _llama(server)
+
+    assert provider.generate("Say hello", 10, 0)['response'] == 'ok'
+    assert server.requests[1] - server.requests[0] >= 0.3
+
+    server.script = [(429, {'Retry-After': '120'}, {})]
+    with pytest.raises(Exception, match="retry after 120s"):
+        provider.generate("Say hello", 10, 0)
+    assert len(server.requests) == 3
+    provider.close()
+
+def test_retry_after_beyond_deadline_stops(server):
+    """Test that a wait the request deadline can't afford ends the retries."""
+    server.script = [(503, {'Retry-After': '2'}, {})]
+    provider = _llama(server)
+
+    with deadline.scope(1.0):
+        with pytest.raises(DeadlineExceededError):
+            provider.generate("Say hello", 10, 0)
+    assert len(server.requests) == 1
+    provider.close()
+
+def test_async_retries(server):
+    """Test that the async path follows the same policy."""
+    import asyncio
+    server.script = [(503, {}, {}), (400, {}, {"error": "bad request"})]
+    provider = _llama(server)
+
+    with pytest.raises(Exception, match="Ollama request failed"):
+        asyncio.run(provider.agenerate("Say hello", 10, 0))
+    assert len(server.requests) == 2
+    provider.close()
+
+def test_huggingface_waits_for_model_load(server, monkeypatch):
+    """Test that a loading model's estimated_time is used as the backoff."""
+    server.script = [(503, {}, {"error": "Model org/tiny is currently loading", "estimated_time": 0.3})]
+    provider = HuggingfaceProvider({'name': 'hf', 'api_key': 'test', 'model': 'org/tiny',
+                                    'tokenizer': 'approx', 'retry': {'base_delay': 0.01}})
+    monkeypatch.setattr(HuggingfaceProvider, 'api_url', property(lambda self: f"{server.url}/models/{self.model}"))
+
+    assert provider.retry_hint(_status_error(503)) is None
+    assert provider.generate("Say hello", 10, 0)['response'] == "{'response': 'ok'}"
+    assert server.requests[1] - server.requests[0] >= 0.3
+    provider.close()
@@ -0,0 +1,80 @@
+"""
+Tests for adaptive provider routing
+"""
+from services.routing import AdaptiveRouter
+
+
+class _Provider:
+    def __init__(self, name, priority=1):
+        self.name = name
+        self.priority = priority
+
+
+def _train(router, name, seconds, cost=0.0, count=5):
+    for _ in range(count):
+        router.record_success(name, seconds, 50, cost)
+
+def test_faster_provider_goes_first_within_a_priority():
+    """Test that providers sharing a priority are ordered by observed latency."""
+    router = AdaptiveRouter(epsilon=0.0, state_path=None)
+    slow, fast, backup = _Provider('slow'), _Provider('fast'), _Provider('backup', priority=2)
+    _train(router, 'slow', 2.0)
+    _train(router, 'fast', 0.3)
+    _train(router, 'backup', 0.1)
+
+    assert [p.name for p in router.order([slow, fast, backup])] == ['fast', 'slow', 'backup']
+
+def test_cost_and_errors_enter_the_objective():
+    """Test that a cheaper or more reliable provider can beat a faster one."""
+    router = AdaptiveRouter(epsilon=0.0, cost_weight=1000.0, state_path=None)
+    _train(router, 'fast_paid', 0.2, cost=0.002)
+    _train(router, 'slow_free', 1.0)
+    assert router.score('slow_free') < router.score('fast_paid')
+
+    _train(router, 'flaky', 0.1)
+    for _ in range(15):
+        router.record_failure('flaky')
+    assert router.score('flaky') > router.score('slow_free')
+
+def test_expected_latency_follows_request_length():
+    """Test that a low-overhead slow generator wins short requests and a fast generator wins long ones."""
+    router = AdaptiveRouter(epsilon=0.0, cost_weight=0.0, state_path=None)
+    # quick_start: 0.1s + 20ms/token; quick_tokens: 1.0s + 2ms/token
+    for tokens in (20, 200, 50, 400, 100) * 2:
+        router.record_success('quick_start', 0.1 + 0.02 * tokens, tokens, 0.0)
+        router.record_success('quick_tokens', 1.0 + 0.002 * tokens, tokens, 0.0)
+    providers = [_Provider('quick_start'), _Provider('quick_tokens')]
+
+    assert router.stats['quick_start'].expected_latency(20) < router.stats['quick_start'].expected_latency(2000)
+    assert [p.name for p in router.order(providers, max_tokens=20)] == ['quick_start', 'quick_tokens']
+    assert [p.name for p in router.order(providers, max_tokens=2000)] == ['quick_tokens', 'quick_start']
+
+def test_unproven_providers_are_explored_first():
+    """Test that a provider without enough samples is tried before ranking kicks in."""
+    router = AdaptiveRouter(epsilon=0.0, min_samples=3, state_path=None)
+    _train(router, 'known', 0.1)
+
+    order = router.order([_Provider('known'), _Provider('new')])
+    assert order[0].name == 'new'
+
+def test_stale_provider_gets_one_refresh():
+    """Test that a provider with old estimates is probed once, then ranked normally."""
+    router = AdaptiveRouter(epsilon=0.0, stale_after=60, state_path=None)
+    _train(router, 'best', 0.1)
+    _train(router, 'stale', 1.0)
+    router.stats['stale'].updated_at -= 120
+    providers = [_Provider('best'), _Provider('stale')]
+
+    assert router.order(providers)[0].name == 'stale'
+    assert router.order(providers)[0].name == 'best'
+
+def test_estimates_survive_restart(tmp_path):
+    """Test that a new router restores persisted estimates."""
+    path = str(tmp_path / "provider_stats.json")
+    router = AdaptiveRouter(state_path=path)
+    _train(router, 'groq', 0.4, cost=0.0001)
+    router.save_state()
+
+    restored = AdaptiveRouter(state_path=path)
+    assert restored.stats['groq'].samples == 5
+    assert restored.score('groq') == router.score('groq')
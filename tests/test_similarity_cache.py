@@ -0,0 +1,65 @@
+"""
+Tests for the near-duplicate response cache
+"""
+import pytest
+
+from services.similarity_cache import MinHasher, SimilarityCache
+
+RESULT = {"response": "ML is...", "tokens": {"total": 15}, "modelUsed": "groq", "cost": 0.001}
+SCOPE = SimilarityCache.make_scope(100, 0.0, ["groq"])
+
+def test_signature_is_stable_and_normalized():
+    """Test that casing, punctuation and whitespace don't change the signature."""
+    hasher = MinHasher()
+
+    assert hasher.signature("What is machine learning?") == hasher.signature("what is  machine learning")
+    assert MinHasher().signature("hello world") == hasher.signature("hello world")
+
+def test_near_duplicate_hit():
+    """Test that a prompt differing by a word finds the cached answer."""
+    cache = SimilarityCache(threshold=0.6)
+    cache.put(SCOPE, cache.signature("Can you explain what machine learning is?"), RESULT)
+
+    match = cache.lookup(SCOPE, cache.signature("Could you explain what machine learning is"))
+
+    assert match is not None
+    result, similarity = match
+    assert result["response"] == "ML is..."
+    assert 'cost' not in result
+    assert 0.6 <= similarity < 1.0
+
+def test_unrelated_prompt_and_other_scope_miss():
+    """Test that dissimilar prompts and different parameters don't match."""
+    cache = SimilarityCache()
+    cache.put(SCOPE, cache.signature("what is machine learning"), RESULT)
+
+    assert cache.lookup(SCOPE, cache.signature("write a poem about the sea")) is None
+    other_scope = SimilarityCache.make_scope(50, 0.0, ["groq"])
+    assert cache.lookup(other_scope, cache.signature("what is machine learning")) is None
+    assert cache.stats()["misses"] == 2
+
+def test_bounded_entries_evict_lru():
+    """Test that the index never holds more than max_entries."""
+    cache = SimilarityCache(max_entries=2)
+    for prompt in ("first prompt here", "second prompt here", "a third one entirely"):
+        cache.put(SCOPE, cache.signature(prompt), RESULT)
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert cache.lookup(SCOPE, cache.signature("first prompt here")) is None
+    assert cache.lookup(SCOPE, cache.signature("a third one entirely")) is not None
+
+def test_stats_report_ratio_and_latency():
+    """Test that hit ratio and lookup latency are exposed."""
+    cache = SimilarityCache()
+    cache.put(SCOPE, cache.signature("what is ml"), RESULT)
+    cache.lookup(SCOPE, cache.signature("What is ML?"))
+    cache.lookup(SCOPE, cache.signature("tell me a joke"))
+
+    stats = cache.stats()
+    assert stats["hitRatio"] == 0.5
+    assert stats["avgLookupMs"] >= 0.0
+
+def test_bands_must_divide_num_perm():
+    with pytest.raises(ValueError):
+        SimilarityCache(num_perm=64, bands=10)
@@ -0,0 +1,151 @@
+"""
+Tests for single-flight request coalescing
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from services.single_flight import CoalesceTimeoutError, SingleFlight
+
+
+def test_followers_receive_leader_error():
+    """Test that a failed leader call fails its followers without a retry stampede."""
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+    errors = []
+
+    def failing():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        raise RuntimeError("upstream down")
+
+    def follower():
+        try:
+            flight.do('key', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=follower)
+    leader.start()
+    started.wait()
+    others = [threading.Thread(target=follower) for _ in range(2)]
+    for thread in others:
+        thread.start()
+    for thread in [leader] + others:
+        thread.join()
+
+    assert len(calls) == 1
+    assert errors == ["upstream down"] * 3
+    assert flight.stats()["inFlight"] == 0
+
+def test_followers_woken_when_leader_is_interrupted():
+    """Test that a leader dying on a non-Exception BaseException still releases its followers."""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    class Interrupted(BaseException):
+        pass
+
+    def interrupted():
+        started.set()
+        time.sleep(0.05)
+        raise Interrupted()
+
+    def lead():
+        with pytest.raises(Interrupted):
+            flight.do('key', interrupted)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+
+    with pytest.raises(Exception, match="interrupted"):
+        flight.do('key', pytest.fail, timeout=2)
+    leader.join()
+    assert flight.stats()["inFlight"] == 0
+
+def test_async_follower_of_sync_leader():
+    """Test that an event-loop caller can follow a call made from a worker thread."""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        time.sleep(0.05)
+        return {"response": "ok"}
+
+    leader = threading.Thread(target=flight.do, args=('key', slow))
+    leader.start()
+    started.wait()
+
+    async def follow():
+        return await flight.ado('key', pytest.fail)
+
+    result, shared = asyncio.run(follow())
+    leader.join()
+
+    assert shared is True
+    assert result == {"response": "ok"}
+
+def test_follower_gives_up_after_timeout():
+    """Test that a follower stops waiting at its timeout while the leader finishes."""
+    flight = SingleFlight()
+    started = threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        time.sleep(0.2)
+        return "done"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do('key', slow)))
+    leader.start()
+    started.wait()
+
+    with pytest.raises(CoalesceTimeoutError):
+        flight.do('key', slow, timeout=0.02)
+    leader.join()
+
+    assert results == [("done", False)]
+
+def test_follower_retries_leader_specific_error():
+    """Test that a follower handed a retryable leader error runs the call itself."""
+    class OutOfTime(Exception):
+        pass
+
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def leader_call():
+        calls.append('leader')
+        started.set()
+        time.sleep(0.05)
+        raise OutOfTime()
+
+    def follower_call():
+        calls.append('follower')
+        return "answer"
+
+    errors = []
+
+    def lead():
+        try:
+            flight.do('key', leader_call)
+        except OutOfTime as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+
+    result = flight.do('key', follower_call, timeout=5, retry=lambda error: isinstance(error, OutOfTime))
+    leader.join()
+
+    assert result == ("answer", False)
+    assert calls == ['leader', 'follower']
+    assert len(errors) == 1
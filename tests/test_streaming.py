@@ -0,0 +1,101 @@
+"""
+Tests for provider streaming against a local HTTP server
+"""
+import http.server
+import json
+import threading
+
+import pytest
+
+from services.providers.groq_provider import GroqProvider
+from services.providers.llama_provider import LlamaProvider
+from utils.sse import format_sse, sse_stream
+
+OLLAMA_LINES = [
+    {"response": "Hel", "done": False},
+    {"response": "lo", "done": False},
+    {"response": "", "done": True, "prompt_eval_count": 7, "eval_count": 2}
+]
+
+GROQ_EVENTS = [
+    {"choices": [{"delta": {"role": "assistant"}}]},
+    {"choices": [{"delta": {"content": "Hel"}}]},
+    {"choices": [{"delta": {"content": "lo"}}]},
+    {"choices": [], "usage": {"prompt_tokens": 9, "completion_tokens": 2, "total_tokens": 11}}
+]
+
+
+class _StreamHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        assert request['stream'] is True
+
+        if self.path.startswith('/api/generate'):
+            content_type = 'application/x-ndjson'
+            body = ''.join(json.dumps(line) + '\n' for line in OLLAMA_LINES)
+        else:
+            content_type = 'text/event-stream'
+            body = ''.join(f"data: {json.dumps(event)}\n\n" for event in GROQ_EVENTS) + "data: [DONE]\n\n"
+
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StreamHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def _drain(stream):
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as stop:
+            return chunks, stop.value
+
+def test_ollama_stream_parses_ndjson(server_url):
+    """Test that Ollama NDJSON lines become chunks and the final line supplies token counts."""
+    provider = LlamaProvider({'name': 'llama', 'endpoint': f"{server_url}/api/generate"})
+
+    chunks, result = _drain(provider.stream("Say hello", 10, 0))
+
+    assert chunks == ['Hel', 'lo']
+    assert result['response'] == 'Hello'
+    assert result['tokens'] == {'prompt': 7, 'completion': 2, 'total': 9}
+    provider.close()
+
+def test_groq_stream_parses_sse(server_url):
+    """Test that Groq SSE deltas become chunks and the usage chunk supplies token counts."""
+    provider = GroqProvider({'name': 'groq', 'api_key': 'test', 'endpoint': f"{server_url}/openai/v1/chat/completions"})
+
+    chunks, result = _drain(provider.stream("Say hello", 10, 0))
+
+    assert chunks == ['Hel', 'lo']
+    assert result['response'] == 'Hello'
+    assert result['tokens'] == {'prompt': 9, 'completion': 2, 'total': 11}
+    provider.close()
+
+def test_sse_stream_turns_failures_into_error_event():
+    """Test that an exception after the response started ends the stream with an error event."""
+    def events():
+        yield 'chunk', {'text': 'partial'}
+        raise Exception("Connection dropped")
+
+    messages = list(sse_stream(events()))
+
+    assert messages[0] == format_sse('chunk', {'text': 'partial'})
+    assert messages[1].startswith('event: error\n')
+    assert 'Connection dropped' in messages[1]
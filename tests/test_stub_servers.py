@@ -0,0 +1,104 @@
+"""
+Tests for the benchmark stub providers and harness helpers
+"""
+import pytest
+
+from benchmarks.harness import bench_config, router_overhead, server_timing, stub_specs
+from benchmarks.stub_servers import StubProfile, StubServer, parse_latency
+from services.providers.groq_provider import GroqProvider
+from services.providers.huggingface_provider import HuggingfaceProvider
+from services.providers.llama_provider import LlamaProvider
+
+PROVIDERS = {
+    'ollama': lambda endpoint: LlamaProvider({'name': 'llama', 'endpoint': endpoint, 'tokenizer': 'approx'}),
+    'groq': lambda endpoint: GroqProvider({'name': 'groq', 'endpoint': endpoint, 'api_key': 'test',
+                                           'tokenizer': 'approx'}),
+    'huggingface': lambda endpoint: HuggingfaceProvider({'name': 'hf', 'endpoint': endpoint, 'api_key': 'test',
+                                                         'tokenizer': 'approx'})
+}
+
+@pytest.fixture
+def stub(request):
+    server = StubServer(request.param, StubProfile(latency='fixed:0', completion_tokens=4)).start()
+    yield server
+    server.stop()
+
+@pytest.mark.parametrize('stub', ['ollama', 'groq', 'huggingface'], indirect=True)
+def test_providers_understand_stubs(stub):
+    """Test that each provider parses its stub's response, streamed where the provider streams."""
+    provider = PROVIDERS[stub.kind](stub.endpoint)
+
+    result = provider.generate("Say hello to the stub", 3, 0)
+    assert result['response'] == 'alpha bravo charlie'
+    # Only Groq reports usage; the others count the text themselves
+    assert result['tokens']['completion'] == 3 if stub.kind == 'groq' else result['tokens']['completion'] > 0
+
+    if stub.kind != 'huggingface':
+        chunks = provider.stream("Say hello to the stub", 3, 0)
+        texts = []
+        try:
+            while True:
+                texts.append(next(chunks))
+        except StopIteration as stop:
+            summary = stop.value
+        assert ''.join(texts) == 'alpha bravo charlie'
+        assert summary['tokens']['completion'] == 3
+
+    assert stub.stats()['statuses'] == {'200': 1 if stub.kind == 'huggingface' else 2}
+    provider.close()
+
+def test_rate_limited_stub_sends_retry_after():
+    """Test that a stub over its RPM answers 429 with Retry-After, which the provider honours."""
+    server = StubServer('groq', StubProfile(latency='fixed:0', rpm=1, retry_after=0.01)).start()
+    provider = GroqProvider({'name': 'groq', 'endpoint': server.endpoint, 'api_key': 'test', 'retry_count': 1,
+                             'tokenizer': 'approx', 'retry': {'max_retry_after': 0.001}})
+    try:
+        provider.generate("first", 3, 0)
+        with pytest.raises(Exception, match="retry after"):
+            provider.generate("second", 3, 0)
+    finally:
+        provider.close()
+        server.stop()
+    assert server.stats()['statuses'] == {'200': 1, '429': 1}
+
+def test_latency_specs():
+    """Test the latency distributions and that bad specs are rejected."""
+    import random
+    rng = random.Random(1)
+    assert parse_latency('fixed:0.2')(rng) == 0.2
+    assert all(0.1 <= parse_latency('uniform:0.1:0.3')(rng) <= 0.3 for _ in range(100))
+    assert parse_latency('lognormal:0.2:0.5')(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency('gamma:1')
+
+def test_bench_config_points_providers_at_stubs():
+    """Test that per-provider overrides apply and the router config targets the stubs."""
+    config = {
+        'providers': [
+            {'name': 'local', 'type': 'llama', 'enabled': True},
+            {'name': 'cloud', 'type': 'groq', 'enabled': True, 'api_key': '${GROQ_API_KEY}'},
+            {'name': 'off', 'type': 'groq', 'enabled': False}
+        ],
+        'settings': {'routing': {'enabled': True}}
+    }
+    specs = stub_specs(config, {'latency': 'fixed:0.1'}, ['cloud.error_rate=0.5'])
+    assert [(spec['name'], spec['kind'], spec.get('error_rate')) for spec in specs] == [
+        ('local', 'ollama', None), ('cloud', 'groq', 0.5)
+    ]
+    with pytest.raises(ValueError):
+        stub_specs(config, {}, ['missing.error_rate=1'])
+
+    served = [dict(spec, endpoint=f"http://stub/{spec['name']}") for spec in specs]
+    routed = bench_config(config, served)
+    assert [p['endpoint'] for p in routed['providers']] == ['http://stub/local', 'http://stub/cloud']
+    assert routed['providers'][1]['api_key'] == 'benchmark'
+    assert routed['settings']['tracing'] == {'enabled': True}
+    assert routed['settings']['routing'] == {'enabled': True}
+
+def test_router_overhead_from_server_timing():
+    """Test that waiting phases are taken out of the traced total."""
+    phases = server_timing('token_count;dur=1.5, attempt;desc="groq";dur=52.0, '
+                           'http_upstream;desc="groq";dur=48.0, http_upstream;desc="llama";dur=20.0, total;dur=75.0')
+    assert phases['http_upstream'] == 68.0
+    assert router_overhead(phases) == 7.0
+    assert router_overhead(server_timing(None)) is None
@@ -0,0 +1,131 @@
+"""
+Tests for the shared token counter
+"""
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from services import token_counter
+from services.token_counter import TokenCounter, approximate_token_count
+
+
+class FakeEncoder:
+    """Counts characters, and records how it was called."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, text, disallowed_special=()):
+        self.calls.append(('encode', text))
+        return list(text)
+
+    def encode_batch(self, texts, disallowed_special=()):
+        self.calls.append(('encode_batch', list(texts)))
+        return [list(text) for text in texts]
+
+
+class FakeTokenizer:
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+@pytest.fixture
+def encoder():
+    fake = FakeEncoder()
+    with patch.dict(token_counter._ENCODERS, {'fake': fake}):
+        yield fake
+
+def test_counts_are_memoised(encoder):
+    """Test that the same text is encoded once per tokenizer."""
+    counter = TokenCounter()
+
+    assert counter.count("hello", 'tiktoken:fake') == 5
+    assert counter.count("hello", 'tiktoken:fake') == 5
+
+    assert len(encoder.calls) == 1
+    assert counter.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+def test_cache_is_bounded(encoder):
+    """Test that the least recently used counts are evicted."""
+    counter = TokenCounter(cache_size=2)
+
+    for text in ("a", "bb", "ccc"):
+        counter.count(text, 'tiktoken:fake')
+    counter.count("a", 'tiktoken:fake')
+
+    assert counter.stats()["entries"] == 2
+    assert len(encoder.calls) == 4
+
+def test_count_batch_encodes_misses_together(encoder):
+    """Test that only uncached texts are encoded, in a single batch call."""
+    counter = TokenCounter()
+    counter.count("one", 'tiktoken:fake')
+
+    assert counter.count_batch(["one", "three", "fifteen"], 'tiktoken:fake') == [3, 5, 7]
+    assert encoder.calls[-1] == ('encode_batch', ["three", "fifteen"])
+
+def test_hf_tokenizer_spec():
+    """Test that hf: specs use the model's tokenizer."""
+    with patch.dict(token_counter._HF_TOKENIZERS, {'org/model': FakeTokenizer()}):
+        assert TokenCounter().count_batch(["a b c", "d"], 'hf:org/model') == [3, 1]
+
+def test_unavailable_tokenizer_falls_back_to_estimate():
+    """Test that a tokenizer that can't be loaded gives the heuristic count."""
+    text = "one two three four five six"
+    with patch.dict(token_counter._HF_TOKENIZERS, {'missing/model': None}):
+        assert TokenCounter().count(text, 'hf:missing/model') == approximate_token_count(text)
+    assert TokenCounter().count(text, 'approx') == approximate_token_count(text)
+
+def test_encode_errors_are_not_memoised(encoder):
+    """Test that an estimate made after the tokenizer raised is recounted next time."""
+    counter = TokenCounter()
+    with patch.object(encoder, 'encode', side_effect=ValueError("bad input")):
+        assert counter.count("hello world", 'tiktoken:fake') == approximate_token_count("hello world")
+
+    assert counter.count("hello world", 'tiktoken:fake') == 11
+    assert counter.stats()['hits'] == 0
+
+def test_acount_offloads_long_texts(encoder):
+    """Test that long texts are encoded on the worker pool, not the event loop."""
+    import threading
+
+    threads = []
+    original = encoder.encode
+
+    def encode(text, disallowed_special=()):
+        threads.append(threading.current_thread().name)
+        return original(text)
+
+    encoder.encode = encode
+    counter = TokenCounter(offload_chars=10)
+
+    assert asyncio.run(counter.acount("short", 'tiktoken:fake')) == 5
+    assert asyncio.run(counter.acount("x" * 50, 'tiktoken:fake')) == 50
+    assert threads[0] == threading.main_thread().name
+    assert threads[1].startswith('tokenize')
+
+def test_estimates_while_tokenizer_loads_in_background():
+    """Test that counts are estimated, and not memoised, until the tokenizer is ready."""
+    import threading
+
+    release = threading.Event()
+
+    def slow_load(model_name, *args):
+        release.wait(5)
+        token_counter._HF_TOKENIZERS[model_name] = FakeTokenizer()
+        return token_counter._HF_TOKENIZERS[model_name]
+
+    text = "one two three four five six"
+    counter = TokenCounter()
+    with patch.dict(token_counter._HF_TOKENIZERS), patch.object(token_counter, 'get_hf_tokenizer', slow_load):
+        assert counter.count(text, 'hf:slow/model') == approximate_token_count(text)
+        assert counter.readiness('hf:slow/model') == token_counter.LOADING
+
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name == 'tokenizer-hf:slow/model':
+                thread.join(5)
+
+        assert counter.readiness('hf:slow/model') == token_counter.READY
+        assert counter.count(text, 'hf:slow/model') == 6
@@ -0,0 +1,66 @@
+"""
+Tests for the offline tokenizer store
+"""
+from unittest.mock import patch
+
+import pytest
+
+from services import token_counter, tokenizer_store
+from services.token_counter import TokenCounter
+
+tiktoken = pytest.importorskip("tiktoken")
+
+
+def _tiny_encoding():
+    ranks = {bytes([i]): i for i in range(256)}
+    ranks[b"ab"] = 256
+    ranks[b"abab"] = 257
+    return tiktoken.Encoding(
+        name="tiny",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks=ranks,
+        special_tokens={"<|end|>": 258}
+    )
+
+def test_tiktoken_snapshot_round_trip(tmp_path):
+    """Test that a stored encoding tokenizes exactly like the original."""
+    encoding = _tiny_encoding()
+    directory = tokenizer_store.artifact_dir("tiktoken:tiny", str(tmp_path))
+    tokenizer_store.save_tiktoken(encoding, directory)
+
+    loaded = tokenizer_store.load("tiktoken:tiny", str(tmp_path))
+
+    for text in ("abab ab xyz", "", "ümlaut abab"):
+        assert loaded.encode(text) == encoding.encode(text)
+    assert loaded.encode("<|end|>", allowed_special="all") == [258]
+
+def test_counter_uses_store_offline(tmp_path):
+    """Test that an offline counter loads stored tokenizers and estimates the rest."""
+    tokenizer_store.save_tiktoken(_tiny_encoding(), tokenizer_store.artifact_dir("tiktoken:tiny", str(tmp_path)))
+    counter = TokenCounter(background_load=False, store_path=str(tmp_path), offline=True)
+
+    with patch.dict(token_counter._ENCODERS, clear=True), patch.object(tiktoken, 'get_encoding') as download:
+        assert counter.count("abab", 'tiktoken:tiny') == 1
+        assert counter.readiness('tiktoken:tiny') == token_counter.READY
+        assert counter.count("one two three", 'tiktoken:missing') == 4
+        assert counter.readiness('tiktoken:missing') == token_counter.UNAVAILABLE
+        download.assert_not_called()
+
+def test_missing_snapshot_returns_none(tmp_path):
+    """Test that an empty store reports nothing to load."""
+    assert tokenizer_store.load("tiktoken:cl100k_base", str(tmp_path)) is None
+    assert tokenizer_store.load("hf:org/model", None) is None
+
+def test_hf_snapshot_round_trip(tmp_path):
+    """Test that a stored Hugging Face tokenizer loads without transformers."""
+    tokenizers = pytest.importorskip("tokenizers")
+    from tokenizers.models import WordLevel
+    from tokenizers.pre_tokenizers import Whitespace
+
+    tokenizer = tokenizers.Tokenizer(WordLevel({"hello": 0, "world": 1, "[UNK]": 2}, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = Whitespace()
+    tokenizer_store.save_hf(tokenizer, tokenizer_store.artifact_dir("hf:org/tiny", str(tmp_path)))
+
+    loaded = tokenizer_store.load("hf:org/tiny", str(tmp_path))
+
+    assert loaded(["hello world", "hello there"])["input_ids"] == [[0, 1], [0, 2]]
@@ -0,0 +1,139 @@
+"""
+Tests for request tracing spans and their export
+"""
+import contextvars
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from services import tracing
+from services.provider_manager import ProviderManager
+from services.tracing import Tracer
+
+
+class _OllamaHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(0.05)
+        body = json.dumps({"response": "hi", "prompt_eval_count": 2, "eval_count": 1}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _OllamaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def tracer():
+    yield tracing.configure_tracing({'enabled': True})
+    tracing.configure_tracing(None)
+
+def test_spans_are_noops_without_a_trace():
+    """Test that nothing is recorded outside a traced request, or when tracing is disabled."""
+    with tracing.span('cost'):
+        pass
+    assert tracing.current() is None
+    assert Tracer().start('GET /') is None
+
+def test_server_timing_sums_phases_per_provider():
+    """Test the Server-Timing header and the timings field."""
+    tracer = Tracer()
+    tracer.configure({'enabled': True})
+    trace = tracer.start('POST /generate')
+    try:
+        for _ in range(2):
+            with tracing.span('attempt', provider='groq'):
+                time.sleep(0.01)
+        with tracing.span('usage_log'):
+            pass
+    finally:
+        tracer.finish(trace)
+
+    assert tracing.current() is None
+    entries = trace.server_timing().split(', ')
+    assert [entry.split(';dur=')[0] for entry in entries] == ['attempt;desc="groq"', 'usage_log', 'total']
+    assert float(entries[0].split('dur=')[1]) >= 20
+
+    report = trace.report()
+    assert [span['name'] for span in report] == ['attempt', 'attempt', 'usage_log']
+    assert report[0]['provider'] == 'groq'
+    assert report[1]['start'] >= report[0]['start'] + report[0]['duration']
+
+    # Spans ending after the response was sent are dropped
+    trace.add('late', time.perf_counter(), time.perf_counter())
+    assert len(trace.spans) == 3
+
+def test_spans_follow_copied_contexts(tracer):
+    """Test that work handed to another thread with its context lands in the same trace."""
+    trace = tracing.start('POST /generate')
+    try:
+        def work():
+            with tracing.span('attempt', provider='llama'):
+                pass
+
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(work,))
+        thread.start()
+        thread.join()
+    finally:
+        tracing.finish(trace)
+
+    assert trace.spans[0]['tid'] != threading.get_native_id()
+
+def test_export_appends_chrome_trace_events(tmp_path):
+    """Test that exported traces form one loadable Chrome trace file."""
+    tracer = Tracer()
+    tracer.configure({'enabled': True, 'export_path': str(tmp_path)})
+    for _ in range(2):
+        trace = tracer.start('POST /generate')
+        with tracing.span('cost'):
+            pass
+        tracer.finish(trace)
+
+    files = list(tmp_path.glob('trace-*.json'))
+    assert len(files) == 1
+    # Viewers accept the file without its closing bracket; json needs it
+    events = json.loads(files[0].read_text().rstrip().rstrip(',') + ']')
+    assert [event['name'] for event in events] == ['POST /generate', 'cost'] * 2
+    request, cost = events[:2]
+    assert request['ph'] == cost['ph'] == 'X'
+    assert request['ts'] <= cost['ts'] and cost['ts'] + cost['dur'] <= request['ts'] + request['dur']
+
+def test_generate_records_each_phase(server, tracer):
+    """Test the spans of a real provider call through the manager."""
+    manager = ProviderManager({
+        'providers': [{'name': 'llama', 'type': 'llama', 'enabled': True, 'tokenizer': 'approx',
+                       'endpoint': f"{server.url}/api/generate"}],
+        'settings': {'tracing': {'enabled': True}}
+    })
+    trace = tracing.start('POST /generate')
+    try:
+        manager.generate("Say hello", cache='bypass')
+    finally:
+        tracing.finish(trace)
+        manager.usage_store.close()
+        manager.providers[0].close()
+
+    names = [span['name'] for span in trace.report()]
+    for name in ('token_count', 'rate_limit', 'attempt', 'http_connect', 'http_upstream', 'http_read',
+                 'cost', 'usage_log'):
+        assert name in names
+    upstream = next(span for span in trace.report() if span['name'] == 'http_upstream')
+    assert upstream['provider'] == 'llama'
+    assert upstream['duration'] >= 50
@@ -0,0 +1,133 @@
+"""
+Tests for the incremental usage statistics
+"""
+import pytest
+
+from services.usage_stats import UsageStats
+from services.usage_store import JsonlUsageStore, SqliteUsageStore
+
+
+def _record(provider, cost=0.001, total=10):
+    return {"response": "ok", "tokens": {"total": total}, "cost": cost, "modelUsed": provider}
+
+def test_refresh_folds_in_only_new_records(tmp_path):
+    """Test that totals grow incrementally as records are committed."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    stats = UsageStats(store, snapshot_path=None)
+
+    store.append_many([_record("groq"), _record("groq"), _record("huggingface")])
+    store.flush()
+    stats.refresh()
+    store.append(_record("groq", cost=0.002, total=5))
+    store.flush()
+    stats.refresh()
+
+    summary = stats.summary()
+    assert summary["totalRequests"] == 4
+    assert summary["totalTokens"] == 35
+    assert summary["totalCost"] == pytest.approx(0.005)
+    assert summary["providerUsage"] == {"groq": 3, "huggingface": 1}
+    store.close()
+
+def test_recent_logs_ring_buffer(tmp_path):
+    """Test that only the most recent records are kept."""
+    store = SqliteUsageStore(path=str(tmp_path / "usage.db"))
+    stats = UsageStats(store, snapshot_path=None, recent_size=3)
+
+    store.append_many([dict(_record("groq"), response=str(i)) for i in range(10)])
+    store.flush()
+    stats.refresh()
+
+    assert [r["response"] for r in stats.recent_logs()] == ["7", "8", "9"]
+    assert stats.summary()["totalRequests"] == 10
+    store.close()
+
+def test_snapshot_restores_without_rescanning(tmp_path):
+    """Test that a restarted aggregator resumes from its snapshot cursor."""
+    snapshot = str(tmp_path / "usage_stats.json")
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    store.append_many([_record("groq"), _record("groq")])
+    store.flush()
+
+    stats = UsageStats(store, snapshot_path=snapshot)
+    stats.refresh()
+    stats.save_snapshot()
+
+    store.append(_record("huggingface"))
+    store.flush()
+
+    restored = UsageStats(store, snapshot_path=snapshot)
+    assert restored.summary()["totalRequests"] == 2
+    restored.refresh()
+    assert restored.summary()["totalRequests"] == 3
+    assert restored.summary()["providerUsage"] == {"groq": 2, "huggingface": 1}
+    store.close()
+
+def test_partial_line_is_read_once_complete(tmp_path):
+    """Test that a half-written record is picked up after it is completed."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    store.append(_record("groq"))
+    store.flush()
+    segment = store.segments()[-1]
+    with open(segment, "a") as file:
+        file.write('{"modelUsed": "gr')
+
+    stats = UsageStats(store, snapshot_path=None)
+    stats.refresh()
+    assert stats.summary()["totalRequests"] == 1
+
+    with open(segment, "a") as file:
+        file.write('oq", "cost": 0.0}\n')
+    stats.refresh()
+    assert stats.summary()["providerUsage"] == {"groq": 2}
+    store.close()
+
+def test_hedge_losers_count_cost_but_not_requests(tmp_path):
+    """Test that the abandoned side of a hedged request only adds its spend."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    stats = UsageStats(store, snapshot_path=None)
+
+    store.append(dict(_record("groq"), hedged=True))
+    store.append(dict(_record("huggingface"), hedged=True, hedgeOutcome="lost"))
+    store.flush()
+    stats.refresh()
+
+    summary = stats.summary()
+    assert summary["totalRequests"] == 1
+    assert summary["hedgedRequests"] == 1
+    assert summary["totalCost"] == pytest.approx(0.002)
+    assert summary["providerUsage"] == {"groq": 1}
+    store.close()
+
+def test_cache_hits_are_counted_at_zero_cost(tmp_path):
+    """Test that cache hits count as requests without adding spend."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    stats = UsageStats(store, snapshot_path=None)
+
+    store.append(_record("groq"))
+    store.append(dict(_record("groq"), cost=0.0, cached=True))
+    store.flush()
+    stats.refresh()
+
+    summary = stats.summary()
+    assert summary["totalRequests"] == 2
+    assert summary["cacheHits"] == 1
+    assert summary["totalCost"] == pytest.approx(0.001)
+    assert summary["providerUsage"] == {"groq": 1}
+    store.close()
+
+def test_coalesced_followers_count_as_free_requests(tmp_path):
+    """Test that coalesced followers are counted but not billed."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    stats = UsageStats(store, snapshot_path=None)
+
+    store.append_many([_record("groq"), dict(_record("groq", cost=0.0), coalesced=True)])
+    store.flush()
+    stats.refresh()
+
+    summary = stats.summary()
+    assert summary["totalRequests"] == 2
+    assert summary["coalescedRequests"] == 1
+    assert summary["totalTokens"] == 10
+    assert summary["providerUsage"] == {"groq": 1}
+    store.close()
@@ -0,0 +1,138 @@
+"""
+Tests for the usage log stores
+"""
+import json
+import time
+
+import pytest
+
+from services.usage_store import (
+    JsonlUsageStore,
+    SqliteUsageStore,
+    create_usage_store,
+    migrate_legacy_log
+)
+
+
+def _record(i):
+    return {"response": f"r{i}", "tokens": {"total": i}, "cost": 0.0, "modelUsed": "groq"}
+
+
+@pytest.mark.parametrize("store_factory", [
+    lambda tmp: JsonlUsageStore(path=str(tmp / "usage")),
+    lambda tmp: SqliteUsageStore(path=str(tmp / "usage.db"))
+])
+def test_append_and_read_back(tmp_path, store_factory):
+    """Test that appended records are read back in order after a flush."""
+    store = store_factory(tmp_path)
+    for i in range(5):
+        store.append(_record(i))
+    store.flush()
+
+    assert [r["response"] for r in store.iter_records()] == ["r0", "r1", "r2", "r3", "r4"]
+    store.close()
+
+def test_failed_batch_is_kept_for_the_next_flush(tmp_path, monkeypatch):
+    """Test that records from a failed write are retried, in order, by the next flush."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    write_batch = store._write_batch
+
+    def failing(lines):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, '_write_batch', failing)
+    store.append(_record(1))
+    store.flush()
+    store.append(_record(2))
+    monkeypatch.setattr(store, '_write_batch', write_batch)
+    store.flush()
+
+    assert [r["response"] for r in store.iter_records()] == ["r1", "r2"]
+    store.close()
+
+def test_background_flush_latency(tmp_path):
+    """Test that buffered records are written without an explicit flush."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"), flush_interval=0.05)
+    store.append(_record(1))
+
+    deadline = time.time() + 2
+    while time.time() < deadline and not list(store.iter_records()):
+        time.sleep(0.01)
+
+    assert len(list(store.iter_records())) == 1
+    store.close()
+
+def test_segment_rollover(tmp_path):
+    """Test that segments roll over once they exceed the size limit."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"), segment_max_bytes=200)
+    for i in range(10):
+        store.append(_record(i))
+        store.flush()
+
+    assert len(store.segments()) > 1
+    assert len(list(store.iter_records())) == 10
+    store.close()
+
+def test_stores_sharing_a_directory_keep_order(tmp_path):
+    """Test that a rollover by one writer can't strand another's batch in an older segment."""
+    import threading
+
+    path = str(tmp_path / "usage")
+    # Every batch is bigger than a segment, so each write rolls over
+    first = JsonlUsageStore(path=path, segment_max_bytes=60)
+    second = JsonlUsageStore(path=path, segment_max_bytes=60)
+    first.append(_record(1))
+    first.flush()
+    cursor = first.read_since()[1]
+
+    chosen, resume = threading.Event(), threading.Event()
+    current_segment = first._current_segment
+
+    def paused_current_segment(incoming):
+        segment = current_segment(incoming)
+        chosen.set()
+        resume.wait(5)
+        return segment
+
+    first._current_segment = paused_current_segment
+    first.append(_record(2))
+    writer = threading.Thread(target=first.flush)
+    writer.start()
+    chosen.wait(5)
+
+    second.append(_record(3))
+    other = threading.Thread(target=second.flush)
+    other.start()
+    time.sleep(0.1)
+    resume.set()
+    writer.join(5)
+    other.join(5)
+
+    assert [r["response"] for r in first.iter_records()] == ["r1", "r2", "r3"]
+    assert [r["response"] for r in second.read_since(cursor)[0]] == ["r2", "r3"]
+    first.close()
+    second.close()
+
+def test_torn_line_is_skipped(tmp_path):
+    """Test that a partially written final line does not break reads."""
+    store = JsonlUsageStore(path=str(tmp_path / "usage"))
+    store.append(_record(1))
+    store.flush()
+    with open(store.segments()[-1], "a") as file:
+        file.write('{"response": "tor')
+
+    assert len(list(store.iter_records())) == 1
+    store.close()
+
+def test_legacy_migration_runs_once(tmp_path):
+    """Test that the JSON array log is imported once and then set aside."""
+    legacy = tmp_path / "usage_logs.json"
+    legacy.write_text(json.dumps([_record(1), _record(2)]))
+
+    store = create_usage_store({"path": str(tmp_path / "usage"), "legacy_path": str(legacy)})
+
+    assert len(list(store.iter_records())) == 2
+    assert not legacy.exists()
+    assert (tmp_path / "usage_logs.json.migrated").exists()
+    assert migrate_legacy_log(str(legacy), store) == 0
+    store.close()
@@ -7,6 +7,22 @@ from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+def get_cost_rates(provider_config: Dict) -> Dict[str, float]:
+    """
+    Prompt and completion rates per 1k tokens from a provider config.
+    
+    `cost_per_1k_tokens` is either a mapping with `prompt` and `completion`
+    rates or a single rate charged for both.
+    """
+    cost_rates = provider_config.get('cost_per_1k_tokens') or {}
+    if not isinstance(cost_rates, dict):
+        rate = float(cost_rates)
+        return {'prompt': rate, 'completion': rate}
+    return {
+        'prompt': float(cost_rates.get('prompt', 0.0)),
+        'completion': float(cost_rates.get('completion', 0.0))
+    }
+
 def calculate_cost(
     provider_name: str,
     prompt_tokens: int,
@@ -25,12 +41,10 @@ def calculate_cost(
     Returns:
         Cost in USD
     """
-    # Get cost rates from provider config
-    cost_rates = provider_config.get('cost_per_1k_tokens', {})
-    
-    # Default rates (free)
-    prompt_rate = cost_rates.get('prompt', 0.0)
-    completion_rate = cost_rates.get('completion', 0.0)
+    # Get cost rates from provider config (free when unset)
+    cost_rates = get_cost_rates(provider_config)
+    prompt_rate = cost_rates['prompt']
+    completion_rate = cost_rates['completion']
     
     # Calculate costs
     prompt_cost = (prompt_tokens / 1000) * prompt_rate
@@ -67,9 +81,9 @@ def estimate_cost(
     estimated_prompt_tokens = int(words * approx_tokens_per_word)
     
     # Get cost rates
-    cost_rates = provider_config.get('cost_per_1k_tokens', {})
-    prompt_rate = cost_rates.get('prompt', 0.0)
-    completion_rate = cost_rates.get('completion', 0.0)
+    cost_rates = get_cost_rates(provider_config)
+    prompt_rate = cost_rates['prompt']
+    completion_rate = cost_rates['completion']
     
     # Calculate estimated costs
     estimated_prompt_cost = (estimated_prompt_tokens / 1000) * prompt_rate
@@ -0,0 +1,44 @@
+"""
+Server-Sent Events Utilities
+"""
+import json
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # stop nginx from buffering the stream
+}
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Encode one event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_stream(events: Iterable[Tuple[str, Dict]], start_time: Optional[float] = None) -> Iterator[str]:
+    """
+    Encode (event, data) pairs from ProviderManager.stream() as SSE messages.
+
+    Once the response has started its status code can no longer change, so an
+    exception raised mid-stream is sent as a final 'error' event instead.
+
+    Args:
+        events: Pairs to encode
+        start_time: When set, timeTaken is added to the 'done' event
+    """
+    try:
+        for event, data in events:
+            if event == 'done' and start_time is not None:
+                data['timeTaken'] = round(time.time() - start_time, 2)
+            yield format_sse(event, data)
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        yield format_sse('error', {
+            "error": "Failed to generate response",
+            "details": str(e)
+        })